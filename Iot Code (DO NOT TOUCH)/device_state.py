@@ -0,0 +1,112 @@
+"""
+Device State Cache
+Keeps the device manager's identity, claim and config state locally.
+
+device_state.json remembers what the device learned from Firebase (device ID,
+owner UID, registry name/zone), so after a reboot the manager can publish
+straight away and revalidate the claim in the background instead of waiting
+for the network. Writes go through a temp file + os.replace, so a power cut
+never leaves a half-written state file.
+
+JSON config files (camera_config.json, vps_config.json) are parsed once and
+only re-parsed when their mtime changes; changed() reports which ones did.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Configuration
+CONFIG_CHECK_INTERVAL = 5  # seconds between config file mtime checks
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceStateCache:
+    """Persisted device state plus mtime-watched config files."""
+
+    def __init__(self, state_file: Path, configs: Dict[str, Tuple[Path, Callable[[], Any]]]):
+        """
+        configs maps a name to (path, loader); the loader is called to parse
+        the file on first access and again whenever the file changes.
+        """
+        self.state_file = state_file
+        self.state: Dict[str, Any] = self._read_state()
+        self._configs = configs
+        self._values: Dict[str, Any] = {}
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self._last_check = 0.0
+
+    def _read_state(self) -> Dict[str, Any]:
+        if not self.state_file.exists():
+            return {}
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            logger.info(f"Loaded cached device state: {sorted(state)}")
+            return state if isinstance(state, dict) else {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable device state cache: {e}")
+            return {}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.state.get(key, default)
+
+    def update(self, **fields: Any):
+        """Set fields and persist atomically if anything changed."""
+        changed = {key: value for key, value in fields.items() if self.state.get(key) != value}
+        if not changed:
+            return
+        self.state.update(changed)
+        self.state = {key: value for key, value in self.state.items() if value is not None}
+        tmp_path = self.state_file.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logger.error(f"Could not save device state cache: {e}")
+
+    def clear(self):
+        """Forget all cached state (e.g. the SD card moved to another Pi)."""
+        self.state = {}
+        self.state_file.unlink(missing_ok=True)
+
+    def config(self, name: str) -> Any:
+        """Parsed config, loaded on first use and cached until the file changes."""
+        if name not in self._values:
+            path, loader = self._configs[name]
+            self._mtimes[name] = self._mtime(path)
+            self._values[name] = loader()
+        return self._values[name]
+
+    def changed(self) -> List[str]:
+        """Reload configs whose files changed; returns their names."""
+        now = time.monotonic()
+        if now - self._last_check < CONFIG_CHECK_INTERVAL:
+            return []
+        self._last_check = now
+
+        changed = []
+        for name, (path, loader) in self._configs.items():
+            if name not in self._values:
+                continue
+            mtime = self._mtime(path)
+            if mtime != self._mtimes[name]:
+                self._mtimes[name] = mtime
+                self._values[name] = loader()
+                logger.info(f"📝 {path.name} changed, reloaded")
+                changed.append(name)
+        return changed
+
+    @staticmethod
+    def _mtime(path: Path) -> Optional[float]:
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            return None
@@ -315,6 +315,7 @@ void waitForDeviceClaim() {
  *   p: integer (phosphorus)
  *   k: integer (potassium)
  *   timestamp: integer (milliseconds since boot)
+ *   updated_at: server timestamp (epoch ms, set by Firebase; used by sensor_rollup.py)
  *********************************************/
 void uploadSensorData(float moisture, float temp, int ec, float ph, int n, int p, int k) {
   // Validate device is claimed
@@ -337,7 +338,8 @@ void uploadSensorData(float moisture, float temp, int ec, float ph, int n, int p
   json += "\"n\":" + String(n) + ",";
   json += "\"p\":" + String(p) + ",";
   json += "\"k\":" + String(k) + ",";
-  json += "\"timestamp\":" + String(millis());
+  json += "\"timestamp\":" + String(millis()) + ",";
+  json += "\"updated_at\":{\".sv\":\"timestamp\"}";
   json += "}";
 
   // Upload to Firebase
@@ -5,22 +5,54 @@ Converts RTSP camera streams to HLS format for web playback.
 
 This script reads camera_config.json and launches FFmpeg processes
 to convert each RTSP stream to HLS (.m3u8) format.
+
+Every camera is supervised by its own asyncio task. The task waits on the
+FFmpeg process exit instead of polling it, restarts it with a per-camera
+exponential backoff, and never sleeps on behalf of other cameras.
+camera_config.json is watched so cameras can be added, removed or re-pointed
+without restarting the launcher.
+
+Stream health comes from FFmpeg's `-progress` output (see stream_health.py):
+a camera is restarted only when its frame count stops or it can no longer
+keep up with real time, and per-camera metrics are exported to a JSON file.
+FFmpeg's stdout and stderr are both always drained; stderr is kept in a
+per-camera ring buffer and a size-rotated log file (see ffmpeg_logs.py).
+
+stream_config.json selects where live segments go (SD card or tmpfs) and
+whether finished segments are also kept in the on-disk DVR (see hls_dvr.py)
+and scored for motion (see motion_index.py), and whether FFmpeg also writes
+a small per-camera snapshot for dashboard thumbnails.
 """
 
+import asyncio
 import json
 import logging
-import os
-import subprocess
 import signal
-import sys
 import time
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
+
+from ffmpeg_logs import FFmpegLogCapture
+import instrumentation
+import motion_index
+from hls_dvr import DVRArchiver, start_dvr_server
+from stream_config import live_hls_dir, load_stream_config, snapshot_name
+from stream_health import StreamHealth, read_progress, write_metrics
 
 # Configuration
 CONFIG_FILE = Path(__file__).parent / "camera_config.json"
-HLS_OUTPUT_DIR = Path("/var/www/html/hls")  # Web-accessible directory
+STREAM_CONFIG = load_stream_config()
+HLS_OUTPUT_DIR = live_hls_dir(STREAM_CONFIG)  # SD card (web-accessible) or tmpfs
 LOG_FILE = Path(__file__).parent / "ffmpeg_hls.log"
+HEALTH_CHECK_INTERVAL = 5  # seconds between health checks for each camera
+METRICS_INTERVAL = 5  # seconds between stream metrics exports
+CONFIG_WATCH_INTERVAL = 2  # seconds between camera_config.json change checks
+RESTART_BACKOFF_MIN = 1  # first restart delay in seconds
+RESTART_BACKOFF_MAX = 60  # upper bound for the restart delay
+STABLE_RUNTIME = 60  # a run at least this long resets the backoff
+STOP_TIMEOUT = 5  # seconds to wait for FFmpeg to exit before killing it
+PIPE_DRAIN_TIMEOUT = 2  # seconds to collect FFmpeg's last output after it exits
+CRASH_TAIL_LINES = 20  # stderr lines logged when FFmpeg dies
 
 # Setup logging
 logging.basicConfig(
@@ -33,19 +65,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Store FFmpeg processes
-ffmpeg_processes = {}
-# Store process start times for timeout detection
-process_start_times = {}
-process_last_output_times = {}
-
 
 def load_camera_config() -> Dict[str, str]:
     """Load camera configuration from JSON file."""
     if not CONFIG_FILE.exists():
         logger.error(f"Camera config file not found: {CONFIG_FILE}")
         return {}
-    
+
     try:
         with open(CONFIG_FILE, 'r') as f:
             config = json.load(f)
@@ -56,30 +82,48 @@ def load_camera_config() -> Dict[str, str]:
         return {}
 
 
+def get_config_mtime() -> Optional[float]:
+    """Return the camera_config.json modification time, or None if missing."""
+    try:
+        return CONFIG_FILE.stat().st_mtime
+    except OSError:
+        return None
+
+
 def create_hls_output_dir():
     """Create HLS output directory if it doesn't exist."""
     HLS_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    logger.info(f"HLS output directory: {HLS_OUTPUT_DIR}")
+    logger.info(f"HLS output directory: {HLS_OUTPUT_DIR} ({STREAM_CONFIG['storage_mode']})")
 
 
-def start_ffmpeg_stream(cam_name: str, rtsp_url: str):
+def build_ffmpeg_cmd(cam_name: str, rtsp_url: str) -> List[str]:
     """
-    Start FFmpeg process to convert RTSP to HLS.
-    
+    Build the FFmpeg command that converts RTSP to HLS.
+
     FFmpeg command:
     ffmpeg -rtsp_transport tcp -i <rtsp_url> \
            -c:v copy -c:a aac -b:a 128k \
-           -f hls -hls_time 1 -hls_list_size 10 -hls_flags delete_segments \
+           -f hls -hls_time 2 -hls_list_size 5 -hls_flags delete_segments \
            -hls_segment_filename <output_dir>/<cam_name>_%03d.ts \
            <output_dir>/<cam_name>.m3u8
+
+    With snapshot_enabled a second output writes the thumbnail from the same
+    input (see snapshot_output_args).
     """
     output_m3u8 = HLS_OUTPUT_DIR / f"{cam_name}.m3u8"
     segment_pattern = HLS_OUTPUT_DIR / f"{cam_name}_%03d.ts"
-    
-    ffmpeg_cmd = [
+    snapshot_args = snapshot_output_args(cam_name)
+
+    return [
         'ffmpeg',
+        '-hide_banner',  # No build banner on every (re)start
+        '-loglevel', 'warning',  # Only warnings and errors reach the error log
+        '-nostats',  # Progress goes to stdout below instead of stderr
+        '-progress', 'pipe:1',  # Machine-readable progress for the health probe
         '-rtsp_transport', 'tcp',  # Use TCP for RTSP (more reliable)
-        # The monitoring script will handle reconnection by restarting FFmpeg if it stops
+        # Decode keyframes only: the HLS output copies the stream, so only the thumbnail decodes
+        *(['-skip_frame', 'nokey'] if snapshot_args else []),
+        # The camera supervisor handles reconnection by restarting FFmpeg if it stops
         '-i', rtsp_url,
         '-c:v', 'copy',  # Copy video codec (no re-encoding)
         '-c:a', 'aac',  # Convert audio to AAC
@@ -93,213 +137,330 @@ def start_ffmpeg_stream(cam_name: str, rtsp_url: str):
         '-vsync', 'cfr',  # Constant frame rate (helps with timestamp synchronization)
         '-r', '30',  # Force 30fps (helps with timestamp issues)
         '-y',  # Overwrite output files
-        str(output_m3u8)
+        str(output_m3u8),
+        *snapshot_args,
     ]
-    
-    try:
-        logger.info(f"Starting FFmpeg for {cam_name}...")
-        logger.debug(f"Command: {' '.join(ffmpeg_cmd)}")
-        
-        # Create error log file for this camera
-        error_log_file = LOG_FILE.parent / f"ffmpeg_{cam_name}_error.log"
-        error_log_handle = open(error_log_file, 'a')
-        
-        process = subprocess.Popen(
-            ffmpeg_cmd,
-            stdout=subprocess.PIPE,
-            stderr=error_log_handle,  # Log errors to file
-            text=True,
-            bufsize=1  # Line buffered
-        )
-        
-        # Wait a moment to see if FFmpeg starts successfully
-        time.sleep(3)
-        if process.poll() is not None:
-            # Process died immediately
-            exit_code = process.returncode
-            logger.error(f"❌ FFmpeg for {cam_name} died immediately (exit code: {exit_code})")
-            
-            # Read and log the error
-            error_log_handle.close()
-            if error_log_file.exists():
-                try:
-                    with open(error_log_file, 'r') as f:
-                        error_lines = f.readlines()[-30:]  # Last 30 lines
-                        if error_lines:
-                            logger.error(f"FFmpeg error output for {cam_name}:")
-                            for line in error_lines:
-                                logger.error(f"  {line.strip()}")
-                except Exception as e:
-                    logger.warning(f"Could not read error log: {e}")
-            return  # Don't add to processes list if it died immediately
-        
-        error_log_handle.close()  # Close handle, FFmpeg will continue writing to file
-        
-        ffmpeg_processes[cam_name] = process
-        process_start_times[cam_name] = time.time()
-        process_last_output_times[cam_name] = time.time()
-        logger.info(f"✅ FFmpeg started for {cam_name} (PID: {process.pid})")
-        logger.info(f"📝 Error logs: {error_log_file}")
-        
-    except Exception as e:
-        logger.error(f"Failed to start FFmpeg for {cam_name}: {e}")
-        if 'error_log_handle' in locals():
-            error_log_handle.close()
 
 
-def stop_ffmpeg_stream(cam_name: str):
-    """Stop FFmpeg process for a camera."""
-    if cam_name in ffmpeg_processes:
-        process = ffmpeg_processes[cam_name]
+def snapshot_output_args(cam_name: str) -> List[str]:
+    """
+    FFmpeg output writing <cam>.<snapshot_format> every snapshot_interval
+    seconds, or [] when snapshots are off. The file is replaced atomically
+    (FFmpeg writes <name>.tmp and renames it), so the uploader never sends a
+    half-written image.
+    """
+    name = snapshot_name(cam_name, STREAM_CONFIG)
+    if name is None:
+        return []
+    if STREAM_CONFIG.get("snapshot_format") == "webp":
+        codec = ['-c:v', 'libwebp', '-quality', '60']
+    else:
+        codec = ['-c:v', 'mjpeg', '-q:v', '6']
+    return [
+        '-map', '0:v:0',  # Video only
+        '-an',
+        '-vf', f"fps=1/{STREAM_CONFIG['snapshot_interval']},scale={STREAM_CONFIG['snapshot_width']}:-2",
+        *codec,
+        '-f', 'image2',
+        '-update', '1',  # Keep overwriting one file
+        '-atomic_writing', '1',
+        str(HLS_OUTPUT_DIR / name)
+    ]
+
+
+class CameraSupervisor:
+    """
+    Keeps one camera's FFmpeg process running.
+
+    The supervisor task awaits the process exit (or a restart request from the
+    health check / config watcher), then restarts FFmpeg after a backoff that
+    doubles on every quick failure and resets once a run has been stable.
+    """
+
+    def __init__(self, cam_name: str, rtsp_url: str):
+        self.cam_name = cam_name
+        self.rtsp_url = rtsp_url
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.started_at = 0.0
+        self.restart_count = 0
+        self.health = StreamHealth(cam_name)
+        self.logs = FFmpegLogCapture(cam_name, LOG_FILE.parent)
+        self._backoff = RESTART_BACKOFF_MIN
+        self._restart_event = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._motion_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the supervisor task (and the motion analyzer, if enabled)."""
+        self._task = asyncio.create_task(self.run(), name=f"camera:{self.cam_name}")
+        if STREAM_CONFIG.get("motion_enabled") and motion_index.np is not None:
+            analyzer = motion_index.MotionAnalyzer(self.cam_name, STREAM_CONFIG, HLS_OUTPUT_DIR)
+            self._motion_task = asyncio.create_task(analyzer.run(), name=f"motion:{self.cam_name}")
+
+    def request_restart(self, reason: str):
+        """Ask the supervisor to restart FFmpeg without waiting for it to die."""
+        logger.warning(f"🔄 Restart requested for {self.cam_name}: {reason}")
+        self._restart_event.set()
+
+    def update_url(self, rtsp_url: str):
+        """Point the camera at a new RTSP URL and restart FFmpeg."""
+        self.rtsp_url = rtsp_url
+        self._backoff = RESTART_BACKOFF_MIN
+        self.request_restart("RTSP URL changed in camera config")
+
+    async def stop(self):
+        """Stop FFmpeg and the supervisor task."""
+        self._stopping = True
+        self._restart_event.set()
+        if self._motion_task:
+            self._motion_task.cancel()
+            await asyncio.gather(self._motion_task, return_exceptions=True)
+        if self._task:
+            await self._task
+        self.logs.close()
+
+    async def run(self):
+        """Supervise FFmpeg until stop() is called."""
+        while not self._stopping:
+            self._restart_event.clear()
+            if await self._spawn():
+                await self._wait_for_exit_or_restart()
+            if self._stopping:
+                break
+
+            if time.monotonic() - self.started_at >= STABLE_RUNTIME:
+                self._backoff = RESTART_BACKOFF_MIN
+            self.restart_count += 1
+            logger.info(f"🔄 Restarting FFmpeg for {self.cam_name} in {self._backoff}s "
+                        f"(restart #{self.restart_count})")
+            self._restart_event.clear()
+            try:
+                await asyncio.wait_for(self._restart_event.wait(), timeout=self._backoff)
+            except asyncio.TimeoutError:
+                pass
+            self._backoff = min(self._backoff * 2, RESTART_BACKOFF_MAX)
+
+        await self._terminate()
+
+    @instrumentation.traced("ffmpeg.spawn")
+    async def _spawn(self) -> bool:
+        """Launch FFmpeg. Returns False if the process could not be started."""
+        ffmpeg_cmd = build_ffmpeg_cmd(self.cam_name, self.rtsp_url)
+        self.started_at = time.monotonic()
+        self.health.reset()
+        self.logs.clear()
+
+        try:
+            logger.info(f"Starting FFmpeg for {self.cam_name}...")
+            logger.debug(f"Command: {' '.join(ffmpeg_cmd)}")
+            self.process = await asyncio.create_subprocess_exec(
+                *ffmpeg_cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,  # -progress output
+                stderr=asyncio.subprocess.PIPE,  # Drained into self.logs
+            )
+        except Exception as e:
+            logger.error(f"Failed to start FFmpeg for {self.cam_name}: {e}")
+            self.process = None
+            return False
+
+        logger.info(f"✅ FFmpeg started for {self.cam_name} (PID: {self.process.pid})")
+        logger.info(f"📝 Error logs: {self.logs.log_file}")
+        return True
+
+    async def _wait_for_exit_or_restart(self):
+        """Block until FFmpeg exits or a restart is requested."""
+        exit_task = asyncio.create_task(self.process.wait())
+        restart_task = asyncio.create_task(self._restart_event.wait())
+        progress_task = asyncio.create_task(read_progress(self.process.stdout, self.health))
+        stderr_task = asyncio.create_task(self.logs.drain(self.process.stderr))
+        health_task = asyncio.create_task(self._monitor_health())
+
+        await asyncio.wait({exit_task, restart_task}, return_when=asyncio.FIRST_COMPLETED)
+        for task in (restart_task, health_task):
+            task.cancel()
+
+        died = exit_task.done()
+        if not died:
+            exit_task.cancel()
+            await self._terminate()
+
+        # Let both readers reach EOF so FFmpeg's last words are captured
+        _, pending = await asyncio.wait({progress_task, stderr_task}, timeout=PIPE_DRAIN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+
+        if died:
+            runtime = time.monotonic() - self.started_at
+            logger.warning(f"FFmpeg process for {self.cam_name} has died "
+                           f"(exit code: {self.process.returncode}) after {runtime:.1f}s.")
+            error_lines = self.logs.tail(CRASH_TAIL_LINES)
+            if error_lines:
+                logger.error(f"FFmpeg error output for {self.cam_name}:")
+                for line in error_lines:
+                    logger.error(f"  {line}")
+
+    async def _monitor_health(self):
+        """Request a restart when the progress probe reports a real stall."""
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            with instrumentation.span("ffmpeg.health_check"):
+                reason = self.health.stall_reason()
+            if reason:
+                self.request_restart(f"⏱️ stream stalled: {reason}")
+                return
+
+    def metrics(self) -> Dict:
+        """Current health metrics for this camera."""
+        running = self.process is not None and self.process.returncode is None
+        try:
+            # FFmpeg rewrites the playlist each time it finishes a segment
+            last_segment_at = (HLS_OUTPUT_DIR / f"{self.cam_name}.m3u8").stat().st_mtime
+        except OSError:
+            last_segment_at = None
+        snapshot = snapshot_name(self.cam_name, STREAM_CONFIG)
+        try:
+            snapshot_at = (HLS_OUTPUT_DIR / snapshot).stat().st_mtime if snapshot else None
+        except OSError:
+            snapshot_at = None
+        metrics = self.health.to_dict()
+        metrics.update({
+            "running": running,
+            "pid": self.process.pid if running else None,
+            "uptime_s": round(time.monotonic() - self.started_at, 1) if running else 0,
+            "restart_count": self.restart_count,
+            "last_segment_at": last_segment_at,
+            "snapshot_at": snapshot_at,
+        })
+        return metrics
+
+    async def _terminate(self):
+        """Terminate the current FFmpeg process, killing it if needed."""
+        process = self.process
+        if process is None or process.returncode is not None:
+            return
         try:
             process.terminate()
-            process.wait(timeout=5)
-            logger.info(f"Stopped FFmpeg for {cam_name}")
-        except subprocess.TimeoutExpired:
+            await asyncio.wait_for(process.wait(), timeout=STOP_TIMEOUT)
+            logger.info(f"Stopped FFmpeg for {self.cam_name}")
+        except asyncio.TimeoutError:
             process.kill()
-            logger.warning(f"Force killed FFmpeg for {cam_name}")
-        except Exception as e:
-            logger.error(f"Error stopping FFmpeg for {cam_name}: {e}")
-        finally:
-            del ffmpeg_processes[cam_name]
-            if cam_name in process_start_times:
-                del process_start_times[cam_name]
-            if cam_name in process_last_output_times:
-                del process_last_output_times[cam_name]
-
-
-def stop_all_streams():
-    """Stop all FFmpeg processes."""
-    logger.info("Stopping all FFmpeg streams...")
-    for cam_name in list(ffmpeg_processes.keys()):
-        stop_ffmpeg_stream(cam_name)
-
-
-def signal_handler(sig, frame):
-    """Handle shutdown signals."""
-    logger.info("Received shutdown signal. Stopping all streams...")
-    stop_all_streams()
-    sys.exit(0)
-
-
-def check_ffmpeg_processes():
-    """Check if FFmpeg processes are still running, restart if needed."""
-    current_time = time.time()
-    
-    for cam_name, process in list(ffmpeg_processes.items()):
-        # Check if process has died
-        if process.poll() is not None:
-            exit_code = process.returncode
-            logger.warning(f"FFmpeg process for {cam_name} has died (exit code: {exit_code}).")
-            
-            # Read error log to see what went wrong
-            error_log_file = LOG_FILE.parent / f"ffmpeg_{cam_name}_error.log"
-            if error_log_file.exists():
-                try:
-                    with open(error_log_file, 'r') as f:
-                        error_lines = f.readlines()[-20:]  # Last 20 lines
-                        if error_lines:
-                            logger.error(f"FFmpeg error log for {cam_name}:")
-                            for line in error_lines:
-                                logger.error(f"  {line.strip()}")
-                except Exception as e:
-                    logger.warning(f"Could not read error log: {e}")
-            
-            # Reload config and restart
-            config = load_camera_config()
-            if cam_name in config:
-                stop_ffmpeg_stream(cam_name)
-                time.sleep(5)  # Wait longer before restart to avoid rapid loops
-                logger.info(f"🔄 Restarting FFmpeg for {cam_name}...")
-                start_ffmpeg_stream(cam_name, config[cam_name])
+            await process.wait()
+            logger.warning(f"Force killed FFmpeg for {self.cam_name}")
+        except ProcessLookupError:
+            pass
+
+
+async def apply_camera_config(supervisors: Dict[str, CameraSupervisor], config: Dict[str, str]):
+    """Start, stop or re-point camera supervisors to match the config."""
+    for cam_name in list(supervisors):
+        if cam_name not in config:
+            logger.info(f"➖ Camera {cam_name} removed from config, stopping...")
+            await supervisors.pop(cam_name).stop()
+
+    for cam_name, rtsp_url in config.items():
+        supervisor = supervisors.get(cam_name)
+        if supervisor is None:
+            logger.info(f"➕ Starting supervisor for {cam_name}")
+            supervisor = CameraSupervisor(cam_name, rtsp_url)
+            supervisors[cam_name] = supervisor
+            supervisor.start()
+        elif supervisor.rtsp_url != rtsp_url:
+            supervisor.update_url(rtsp_url)
+
+
+async def watch_camera_config(supervisors: Dict[str, CameraSupervisor]):
+    """Reload camera_config.json whenever it changes on disk."""
+    last_mtime = get_config_mtime()
+    while True:
+        await asyncio.sleep(CONFIG_WATCH_INTERVAL)
+        mtime = get_config_mtime()
+        if mtime == last_mtime:
             continue
-        
-        # Check process runtime timeout (if process runs too long without output, might be stuck)
-        if cam_name in process_start_times:
-            process_runtime = current_time - process_start_times[cam_name]
-            # If process has been running for more than 5 minutes without output update, restart
-            if cam_name in process_last_output_times:
-                time_since_last_output = current_time - process_last_output_times[cam_name]
-                if time_since_last_output > 300:  # 5 minutes timeout
-                    logger.warning(f"⏱️ FFmpeg for {cam_name} timeout: No output for {time_since_last_output:.1f} seconds. Restarting...")
-                    config = load_camera_config()
-                    if cam_name in config:
-                        stop_ffmpeg_stream(cam_name)
-                        time.sleep(3)
-                        start_ffmpeg_stream(cam_name, config[cam_name])
-                    continue
-        
-        # Check if output file is being updated (process might be stuck/hung)
-        output_m3u8 = HLS_OUTPUT_DIR / f"{cam_name}.m3u8"
-        if output_m3u8.exists():
-            try:
-                file_mtime = os.path.getmtime(output_m3u8)
-                file_age = current_time - file_mtime
-                
-                # Update last output time if file was recently modified
-                if file_age < 5:  # File updated in last 5 seconds
-                    process_last_output_times[cam_name] = current_time
-                
-                # If file hasn't been updated in 15 seconds, process might be stuck
-                if file_age > 15:
-                    logger.warning(f"⏱️ FFmpeg output for {cam_name} hasn't updated in {file_age:.1f} seconds. Process may be stuck. Restarting...")
-                    config = load_camera_config()
-                    if cam_name in config:
-                        stop_ffmpeg_stream(cam_name)
-                        time.sleep(3)
-                        start_ffmpeg_stream(cam_name, config[cam_name])
-            except Exception as e:
-                logger.debug(f"Could not check file age for {cam_name}: {e}")
-        else:
-            # File doesn't exist - check if process has been running for a while
-            if cam_name in process_start_times:
-                process_runtime = current_time - process_start_times[cam_name]
-                # If process running for 30+ seconds but no output file, restart
-                if process_runtime > 30:
-                    logger.warning(f"⏱️ FFmpeg for {cam_name} running for {process_runtime:.1f}s but no output file. Restarting...")
-                    config = load_camera_config()
-                    if cam_name in config:
-                        stop_ffmpeg_stream(cam_name)
-                        time.sleep(3)
-                        start_ffmpeg_stream(cam_name, config[cam_name])
+        last_mtime = mtime
+
+        logger.info("📝 Camera config changed, reloading...")
+        config = load_camera_config()
+        if not config:
+            logger.warning("Camera config is empty or invalid. Keeping current cameras.")
+            continue
+        await apply_camera_config(supervisors, config)
 
 
-def main():
-    """Main execution."""
-    logger.info("=" * 60)
-    logger.info("FFmpeg HLS Launcher Starting...")
-    logger.info("=" * 60)
-    
-    # Setup signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
+async def export_metrics(supervisors: Dict[str, CameraSupervisor]):
+    """Periodically write per-camera stream metrics."""
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        with instrumentation.span("ffmpeg.export_metrics"):
+            write_metrics({
+                "updated_at": int(time.time()),
+                "cameras": {name: s.metrics() for name, s in supervisors.items()},
+            })
+
+
+async def start_streams(camera_config: Dict[str, str]) -> Tuple[Dict[str, CameraSupervisor], List[asyncio.Task]]:
+    """Start camera supervisors plus the config watcher, metrics export and DVR."""
     # Create output directory
     create_hls_output_dir()
-    
+
+    if STREAM_CONFIG.get("motion_enabled") and motion_index.np is None:
+        logger.warning("motion_enabled is set but NumPy is missing (sudo apt install python3-numpy)")
+
+    supervisors: Dict[str, CameraSupervisor] = {}
+    logger.info(f"Starting {len(camera_config)} camera streams...")
+    await apply_camera_config(supervisors, camera_config)
+
+    watcher = asyncio.create_task(watch_camera_config(supervisors))
+    exporter = asyncio.create_task(export_metrics(supervisors))
+    background = [watcher, exporter]
+
+    if STREAM_CONFIG.get("dvr_enabled"):
+        archiver = DVRArchiver(STREAM_CONFIG, HLS_OUTPUT_DIR)
+        background.append(asyncio.create_task(archiver.run(lambda: list(supervisors))))
+        start_dvr_server(STREAM_CONFIG)
+
+    logger.info("All camera supervisors started. Monitoring processes...")
+    return supervisors, background
+
+
+async def stop_streams(supervisors: Dict[str, CameraSupervisor], background: List[asyncio.Task]):
+    """Cancel the background tasks and stop every FFmpeg process."""
+    logger.info("Stopping all streams...")
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*(s.stop() for s in supervisors.values()))
+
+
+async def run_launcher():
+    """Start all camera supervisors and run until a shutdown signal."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
     # Load camera configuration
     camera_config = load_camera_config()
     if not camera_config:
         logger.error("No camera configuration found. Exiting.")
         return
-    
-    # Start FFmpeg for each camera
-    logger.info(f"Starting {len(camera_config)} camera streams...")
-    for cam_name, rtsp_url in camera_config.items():
-        start_ffmpeg_stream(cam_name, rtsp_url)
-        time.sleep(1)  # Small delay between starts
-    
-    logger.info("All camera streams started. Monitoring processes...")
-    
-    # Monitor processes
-    try:
-        while True:
-            time.sleep(5)  # Check every 5 seconds (more frequent monitoring)
-            check_ffmpeg_processes()
-    except KeyboardInterrupt:
-        signal_handler(None, None)
+
+    supervisors, background = await start_streams(camera_config)
+
+    await stop_event.wait()
+    logger.info("Received shutdown signal.")
+    await stop_streams(supervisors, background)
+
+
+def main():
+    """Main execution."""
+    instrumentation.setup("ffmpeg_hls_launcher")
+    logger.info("=" * 60)
+    logger.info("FFmpeg HLS Launcher Starting...")
+    logger.info("=" * 60)
+
+    asyncio.run(run_launcher())
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,81 @@
+"""
+FFmpeg Log Capture
+Drains a camera's FFmpeg stderr into a ring buffer and a size-rotated log file.
+
+The launcher used to hand FFmpeg an append-only log file and re-read the whole
+file on every crash. Here every stderr line is kept in a fixed-size deque, so
+the last lines before a crash are available without touching the disk, and
+the on-disk copy is capped by a RotatingFileHandler so it can't fill the SD
+card.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import List
+
+# Configuration
+ERROR_LOG_MAX_BYTES = 1024 * 1024  # rotate ffmpeg_<cam>_error.log at 1 MB
+ERROR_LOG_BACKUP_COUNT = 2  # keep .1 and .2, so at most ~3 MB per camera
+TAIL_LINES = 50  # stderr lines kept in memory per camera
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegLogCapture:
+    """Ring buffer plus rotating log file for one camera's FFmpeg stderr."""
+
+    def __init__(self, cam_name: str, log_dir: Path):
+        self.cam_name = cam_name
+        self.log_file = log_dir / f"ffmpeg_{cam_name}_error.log"
+        self.lines = deque(maxlen=TAIL_LINES)
+
+        handler = RotatingFileHandler(
+            self.log_file,
+            maxBytes=ERROR_LOG_MAX_BYTES,
+            backupCount=ERROR_LOG_BACKUP_COUNT,
+        )
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        self._file_logger = logging.getLogger(f"ffmpeg.{cam_name}")
+        self._file_logger.handlers.clear()
+        self._file_logger.addHandler(handler)
+        self._file_logger.setLevel(logging.INFO)
+        self._file_logger.propagate = False  # keep FFmpeg chatter out of the main log
+
+    def write(self, line: str):
+        """Record one stderr line."""
+        line = line.rstrip()
+        if not line:
+            return
+        self.lines.append(line)
+        self._file_logger.info(line)
+
+    def tail(self, max_lines: int = TAIL_LINES) -> List[str]:
+        """Return the most recent stderr lines."""
+        if max_lines >= len(self.lines):
+            return list(self.lines)
+        return list(self.lines)[-max_lines:]
+
+    def clear(self):
+        """Drop the buffered lines (called when FFmpeg is restarted)."""
+        self.lines.clear()
+
+    async def drain(self, stream: asyncio.StreamReader):
+        """Read the stream until EOF so FFmpeg never blocks on a full pipe."""
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # Line longer than the StreamReader limit; it has been discarded.
+                continue
+            if not line:
+                return
+            self.write(line.decode('utf-8', errors='replace'))
+
+    def close(self):
+        """Close the rotating log file."""
+        for handler in list(self._file_logger.handlers):
+            handler.close()
+            self._file_logger.removeHandler(handler)
@@ -0,0 +1,213 @@
+"""
+Firebase Write Coalescer
+Batches RTDB writes under one node into a single multi-location PATCH.
+
+The device manager used to send device_info and camera_feeds as separate
+requests. WriteCoalescer queues writes as "<child path> -> value" under a root
+such as users/<uid>/devices/<deviceId>, waits COALESCE_WINDOW seconds for more
+writes, then sends everything in one PATCH.
+
+A later write to the same path replaces the queued one, and a write to a
+parent drops queued writes to its children, so the queue is bounded by the
+number of distinct paths rather than by time offline. When a PATCH fails the
+queue is saved to a journal file for its root (atomic replace) and replayed
+first, in order, once the connection is back — including after a reboot.
+Each root has its own journal, so a writer for a new owner never touches
+writes still pending for the old one.
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+# Configuration
+COALESCE_WINDOW = 0.5  # seconds to wait for more writes before sending
+RETRY_INTERVAL = 30  # seconds between replays while offline
+JOURNAL_MAX_PATHS = 1000  # hard cap on distinct queued paths
+
+logger = logging.getLogger(__name__)
+
+
+class WriteCoalescer:
+    """Queues writes under root and flushes them as one multi-location PATCH."""
+
+    def __init__(self, client, root: str, journal_dir: Path, window: float = COALESCE_WINDOW):
+        self.client = client  # anything with patch(path, data) -> bool
+        self.root = root.strip('/')
+        self.journal_file = journal_dir / f"{quote(self.root, safe='')}.json"
+        self.window = window
+        self.pending: "OrderedDict[str, Any]" = OrderedDict()
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+        self._load_journal()
+
+    def set(self, path: str, value: Any):
+        """Queue value for root/path."""
+        path = path.strip('/')
+        with self._lock:
+            self._queue(path, value)
+            self._schedule(self.window)
+
+    def update(self, path: str, data: Dict[str, Any], touch: Optional[Dict[str, Any]] = None,
+               replace: bool = False):
+        """
+        Queue only the fields of data that differ from what was last queued
+        for path; nested objects are compared field by field, so changing
+        one leaf sends only that leaf. Fields in touch are queued every time.
+        With replace, the first write sets the whole node so stale children
+        are removed.
+        """
+        path = path.strip('/')
+        with self._lock:
+            last = self._state.get(path)
+            if last is None and replace:
+                self._queue(path, copy.deepcopy(data))
+            else:
+                self._queue_changes(path, last or {}, data)
+            for key, value in (touch or {}).items():
+                self._queue(f"{path}/{key}", value)
+            self._state[path] = copy.deepcopy(data)
+            if self.pending:
+                self._schedule(self.window)
+
+    def flush(self) -> bool:
+        """Send everything queued as one PATCH. Returns True if nothing is left."""
+        if self._closed:
+            return not self.pending
+        return self._send()
+
+    def close(self):
+        """Stop retrying and make one last attempt; what fails stays in the journal."""
+        with self._lock:
+            self._closed = True
+            self._cancel_timer()
+        self._send()
+
+    def _send(self) -> bool:
+        with self._flush_lock:
+            with self._lock:
+                self._cancel_timer()
+                batch = OrderedDict(self.pending)
+                self.pending.clear()
+            if not batch:
+                return True
+
+            if self.client.patch(self.root, dict(batch)):
+                logger.debug(f"Firebase batch {self.root}: {len(batch)} path(s) in one PATCH")
+                if self.journal_file.exists():
+                    self.journal_file.unlink()
+                    logger.info("📒 Write journal replayed")
+                return True
+
+            with self._lock:
+                # Put the batch back ahead of anything queued meanwhile (newer wins)
+                newer = self.pending
+                self.pending = OrderedDict()
+                for path, value in list(batch.items()) + list(newer.items()):
+                    self._queue(path, value)
+                self._save_journal()
+                self._schedule(RETRY_INTERVAL)
+            logger.warning(f"Firebase batch failed, {len(self.pending)} path(s) journaled for retry")
+            return False
+
+    def _queue_changes(self, path: str, last: Dict[str, Any], data: Dict[str, Any]):
+        """Queue the leaves of data that differ from last (lock held)."""
+        for key, value in data.items():
+            old = last.get(key)
+            if isinstance(value, dict) and isinstance(old, dict):
+                self._queue_changes(f"{path}/{key}", old, value)
+            elif key not in last or old != value:
+                self._queue(f"{path}/{key}", copy.deepcopy(value))
+        for key in last:
+            if key not in data:
+                self._queue(f"{path}/{key}", None)  # null deletes
+
+    def _queue(self, path: str, value: Any):
+        """Add a write, collapsing it with queued writes it overlaps (lock held)."""
+        for queued in list(self.pending):
+            if queued == path or queued.startswith(path + '/'):
+                del self.pending[queued]  # superseded by this write
+            elif path.startswith(queued + '/'):
+                # A parent is already queued: fold this write into its value
+                parent = self.pending[queued]
+                if not isinstance(parent, dict):
+                    parent = {}
+                node = parent
+                keys = path[len(queued) + 1:].split('/')
+                for key in keys[:-1]:
+                    child = node.get(key)
+                    node[key] = child if isinstance(child, dict) else {}
+                    node = node[key]
+                if value is None:
+                    node.pop(keys[-1], None)
+                else:
+                    node[keys[-1]] = value
+                self.pending[queued] = parent
+                self.pending.move_to_end(queued)
+                return
+        self.pending[path] = value
+        while len(self.pending) > JOURNAL_MAX_PATHS:
+            dropped, _ = self.pending.popitem(last=False)
+            # Forget what was sent for the dropped node so the next update re-sends it
+            for node in list(self._state):
+                if node == dropped or node.startswith(dropped + '/') or dropped.startswith(node + '/'):
+                    del self._state[node]
+            logger.warning(f"Write journal full, dropping oldest write: {dropped}")
+
+    def _schedule(self, delay: float):
+        if self._timer is not None or self._closed:
+            return
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def _save_journal(self):
+        """Atomically persist the queue (lock held)."""
+        tmp_path = self.journal_file.with_suffix('.tmp')
+        try:
+            self.journal_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({"root": self.root, "writes": list(self.pending.items())}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_file)
+        except OSError as e:
+            logger.error(f"Could not save write journal: {e}")
+
+    def _load_journal(self):
+        if not self.journal_file.exists():
+            return
+        try:
+            with open(self.journal_file, 'r') as f:
+                journal = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable write journal: {e}")
+            return
+        if journal.get("root") != self.root:
+            logger.warning("Write journal belongs to another device/owner, discarding it")
+            self.journal_file.unlink()
+            return
+        for path, value in journal.get("writes", []):
+            self._queue(path, value)
+        if self.pending:
+            logger.info(f"📒 Replaying {len(self.pending)} journaled write(s)")
+            self._schedule(0)
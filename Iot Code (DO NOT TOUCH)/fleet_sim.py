@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Fleet Simulator
+Runs hundreds of virtual device managers against a local Firebase RTDB stand-in.
+
+Each virtual Pi gets an injected fake MAC and follows the same protocol as
+raspi_device_manager.py: it streams /device_registry/<deviceId> until it is
+claimed, publishes device_info + camera_feeds as one multi-location PATCH
+through the real FirebaseClient and WriteCoalescer, then heartbeats every
+--heartbeat seconds. A simulated dashboard claims the devices at --claim-rate.
+
+The stand-in (FakeRTDB) implements the REST subset the devices use — GET,
+PUT, PATCH (multi-location), print=silent, {".sv": "timestamp"} and
+text/event-stream subscriptions — with configurable latency, random 503s and
+a full outage window.
+
+Reported at the end:
+- requests per second (average and peak) by method
+- bytes per device-hour (request + response, writes and streams separately)
+- claim-to-publish latency (dashboard claim -> first device_info write)
+- recovery time after the outage (outage end -> next successful write)
+
+Usage:
+    python3 fleet_sim.py --devices 300 --duration 300
+    python3 fleet_sim.py --devices 200 --latency 80 --error-rate 0.01 --outage-at 120 --outage-for 60
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from firebase_batch import WriteCoalescer
+from raspi_device_manager import (
+    STREAM_BACKOFF_MAX, STREAM_BACKOFF_MIN, UPDATE_INTERVAL,
+    FirebaseClient, apply_stream_event, device_root, generate_hls_urls,
+    get_device_id, is_claimed, publish_camera_feeds, update_device_info,
+)
+
+# Configuration
+SIM_HOST = "127.0.0.1"
+SIM_PORT = 9400
+SIM_CAMERAS = {"cam1": "rtsp://sim/stream1", "cam2": "rtsp://sim/stream2"}
+SIM_OWNER_UID = "sim_owner"
+KEEP_ALIVE_INTERVAL = 30  # seconds between SSE keep-alive events (as Firebase)
+DEVICE_ID_PATTERN = re.compile(r"pi_[0-9A-F]{12}")
+
+logger = logging.getLogger("fleet_sim")
+
+
+def fake_mac(index: int) -> str:
+    """Deterministic, locally administered MAC for virtual device #index."""
+    return f"02000000{index:04X}"
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return f"p50 {pick(0.5):.2f}s  p95 {pick(0.95):.2f}s  max {values[-1]:.2f}s"
+
+
+class FakeRTDB:
+    """In-process Firebase RTDB REST stand-in with latency and fault injection."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.outage = False
+        self.tree: Dict[str, Any] = {}
+        self.streams: List[Tuple[List[str], asyncio.Queue]] = []
+
+        # Metrics
+        self.requests: Counter = Counter()
+        self.per_second: Counter = Counter()
+        self.bytes: Dict[str, Counter] = defaultdict(Counter)  # device -> {"write", "stream"}
+        self.first_publish: Dict[str, float] = {}
+        self.writes: Dict[str, List[float]] = defaultdict(list)  # successful writes per device
+        self.claimed_at: Dict[str, float] = {}
+        self.outage_end: Optional[float] = None
+        self.elapsed = 0.0
+
+    # --- data tree ---
+
+    @staticmethod
+    def _keys(path: str) -> List[str]:
+        return [key for key in path.split('/') if key]
+
+    def get_node(self, keys: List[str]) -> Any:
+        node = self.tree
+        for key in keys:
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return node
+
+    def set_node(self, keys: List[str], value: Any):
+        value = self._resolve(value)
+        if not keys:
+            self.tree = value if isinstance(value, dict) else {}
+            return
+        node = self.tree
+        parents = []
+        for key in keys[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                child = node[key] = {}
+            parents.append((node, key))
+            node = child
+        if value is None or value == {}:
+            node.pop(keys[-1], None)
+            # Firebase never stores empty objects
+            for parent, key in reversed(parents):
+                if parent[key]:
+                    break
+                del parent[key]
+        else:
+            node[keys[-1]] = value
+
+    def _resolve(self, value: Any) -> Any:
+        if value == {".sv": "timestamp"}:
+            return int(time.time() * 1000)
+        if isinstance(value, dict):
+            return {key: self._resolve(child) for key, child in value.items()}
+        return value
+
+    def write(self, keys: List[str], value: Any):
+        """Write from outside HTTP (e.g. the simulated dashboard) and notify streams."""
+        self.set_node(keys, value)
+        self._notify(keys)
+
+    def _notify(self, keys: List[str]):
+        for stream_keys, queue in self.streams:
+            if keys[:len(stream_keys)] == stream_keys:
+                path = '/' + '/'.join(keys[len(stream_keys):])
+                queue.put_nowait(('put', {"path": path, "data": self.get_node(keys)}))
+            elif stream_keys[:len(keys)] == keys:
+                queue.put_nowait(('put', {"path": '/', "data": self.get_node(stream_keys)}))
+
+    # --- faults ---
+
+    def set_outage(self, active: bool):
+        self.outage = active
+        if active:
+            for _, queue in self.streams:
+                queue.put_nowait(('close', None))
+
+    def _failing(self) -> bool:
+        return self.outage or random.random() < self.error_rate
+
+    # --- HTTP ---
+
+    async def serve(self, host: str, port: int):
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                header_bytes = len(request_line)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    header_bytes += len(line)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                path, _, query = target.partition('?')
+                path = path[:-len('.json')] if path.endswith('.json') else path
+                match = DEVICE_ID_PATTERN.search(path)
+                device = match.group(0) if match else "other"
+                now = time.time()
+                self.per_second[int(now)] += 1
+
+                streaming = method == 'GET' and 'text/event-stream' in headers.get('accept', '')
+                self.requests['STREAM' if streaming else method] += 1
+                kind = 'stream' if streaming else 'write'
+                self.bytes[device][kind] += header_bytes + len(body)
+
+                delay = self.latency + random.uniform(-self.jitter, self.jitter)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                if self._failing():
+                    sent = await self._respond(writer, 503, {"error": "Service Unavailable"})
+                elif streaming:
+                    self.bytes[device][kind] += await self._stream(writer, self._keys(path))
+                    break
+                else:
+                    sent = await self._respond(writer, *self._apply(method, path, query, body, device))
+                self.bytes[device][kind] += sent
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass  # client went away, or the simulation is shutting down
+        finally:
+            writer.close()
+
+    def _apply(self, method: str, path: str, query: str, body: bytes, device: str) -> Tuple[int, Any]:
+        keys = self._keys(path)
+        if method == 'GET':
+            node = self.get_node(keys)
+            if 'shallow=true' in query and isinstance(node, dict):
+                return 200, {key: True if isinstance(value, dict) else value for key, value in node.items()}
+            return 200, node
+        if method not in ('PUT', 'PATCH'):
+            return 405, {"error": "Method not allowed"}
+
+        data = json.loads(body or b'null')
+        if method == 'PUT':
+            self.write(keys, data)
+            touched = [keys]
+        else:
+            touched = []
+            for child, value in (data or {}).items():
+                child_keys = keys + self._keys(child)
+                self.set_node(child_keys, value)
+                touched.append(child_keys)
+            for child_keys in touched:
+                self._notify(child_keys)
+
+        now = time.time()
+        if device != "other":
+            self.writes[device].append(now)
+            if device not in self.first_publish and any('device_info' in k for k in touched):
+                self.first_publish[device] = now
+        if 'print=silent' in query:
+            return 204, None
+        return 200, data
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, data: Any) -> int:
+        reason = {200: 'OK', 204: 'No Content', 405: 'Method Not Allowed', 503: 'Service Unavailable'}[status]
+        body = b'' if status == 204 else json.dumps(data).encode()
+        head = f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        writer.write(head.encode() + body)
+        await writer.drain()
+        return len(head) + len(body)
+
+    async def _stream(self, writer: asyncio.StreamWriter, keys: List[str]) -> int:
+        """Serve one text/event-stream subscription until it is closed."""
+        queue: asyncio.Queue = asyncio.Queue()
+        entry = (keys, queue)
+        self.streams.append(entry)
+        # Chunked like the real RTDB: requests only yields partial bodies of chunked responses
+        head = (b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        writer.write(head)
+        sent = len(head)
+        queue.put_nowait(('put', {"path": '/', "data": self.get_node(keys)}))
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), KEEP_ALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    event, data = 'keep-alive', None
+                if event == 'close':
+                    break
+                message = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+                chunk = b"%x\r\n%s\r\n" % (len(message), message)
+                writer.write(chunk)
+                await writer.drain()
+                sent += len(chunk)
+        finally:
+            self.streams.remove(entry)
+        return sent
+
+
+class VirtualDevice:
+    """One simulated raspi_device_manager: claim wait, publish, heartbeat."""
+
+    def __init__(self, index: int, db_url: str, heartbeat: float, journal_dir: Path,
+                 executor: ThreadPoolExecutor):
+        self.device_id = get_device_id(fake_mac(index))
+        self.local_ip = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+        self.db_url = db_url
+        self.heartbeat = heartbeat
+        self.executor = executor
+        self.client = FirebaseClient(db_url)
+        self.journal_dir = journal_dir  # journals are per root, so devices can share it
+        self.registry: Optional[Dict[str, Any]] = None
+        self.changed = asyncio.Event()
+
+    async def run(self):
+        stream = asyncio.create_task(self._registry_stream())
+        try:
+            while not is_claimed(self.registry):
+                self.changed.clear()
+                await self.changed.wait()
+            owner_uid = self.registry["owner_uid"]
+            writer = WriteCoalescer(self.client, device_root(owner_uid, self.device_id), self.journal_dir)
+            hls_urls = generate_hls_urls(self.local_ip, SIM_CAMERAS, {})
+            while True:
+                update_device_info(self.device_id, owner_uid, self.registry.get("name", ""),
+                                   self.registry.get("zone", ""), self.local_ip, writer, {})
+                publish_camera_feeds(self.device_id, owner_uid, hls_urls, writer)
+                await asyncio.get_running_loop().run_in_executor(self.executor, writer.flush)
+                self.changed.clear()
+                try:
+                    await asyncio.wait_for(self.changed.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # No final writer.close(): its blocking flush would stall the loop serving FakeRTDB
+            stream.cancel()
+
+    async def _registry_stream(self):
+        """Async twin of firebase_stream() so each device does not need its own thread."""
+        host, port = self.db_url.split('//', 1)[1].split(':')
+        backoff = STREAM_BACKOFF_MIN
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(host, int(port))
+                writer.write(f"GET /device_registry/{self.device_id}.json HTTP/1.1\r\n"
+                             f"Host: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+                await writer.drain()
+                status = await reader.readline()
+                if b' 200 ' not in status:
+                    raise ConnectionError(status.decode().strip())
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+                event = None
+                while True:
+                    line = (await reader.readline()).decode()
+                    if not line:
+                        break
+                    if line.startswith('event:'):
+                        event = line[len('event:'):].strip()
+                    elif line.startswith('data:') and event == 'put':
+                        payload = json.loads(line[len('data:'):])
+                        self.registry = apply_stream_event(self.registry, payload["path"], payload["data"])
+                        backoff = STREAM_BACKOFF_MIN
+                        self.changed.set()
+                writer.close()
+            except (ConnectionError, OSError, ValueError):
+                pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, STREAM_BACKOFF_MAX)
+
+
+async def run_fleet(args) -> FakeRTDB:
+    rtdb = FakeRTDB(args.latency / 1000, args.jitter / 1000, args.error_rate)
+    server = await rtdb.serve(SIM_HOST, args.port)
+    db_url = f"http://{SIM_HOST}:{args.port}"
+    executor = ThreadPoolExecutor(max_workers=args.devices)
+
+    with tempfile.TemporaryDirectory() as journal_dir:
+        devices = [VirtualDevice(i, db_url, args.heartbeat, Path(journal_dir), executor)
+                   for i in range(args.devices)]
+        start = time.time()
+        tasks = []
+        for device in devices:
+            tasks.append(asyncio.create_task(device.run()))
+            await asyncio.sleep(args.ramp / args.devices)
+
+        async def dashboard():
+            """Claim every device, as users would from Settings -> Device Management."""
+            for device in devices:
+                rtdb.claimed_at[device.device_id] = time.time()
+                rtdb.write(["device_registry", device.device_id], {
+                    "claimed": True,
+                    "owner_uid": SIM_OWNER_UID,
+                    "name": f"Sim Pi {device.device_id[-4:]}",
+                    "zone": "Sim Zone",
+                })
+                await asyncio.sleep(1 / args.claim_rate)
+
+        async def outage():
+            await asyncio.sleep(max(0.0, start + args.outage_at - time.time()))
+            logger.info(f"💥 Outage for {args.outage_for}s")
+            rtdb.set_outage(True)
+            await asyncio.sleep(args.outage_for)
+            rtdb.set_outage(False)
+            rtdb.outage_end = time.time()
+            logger.info("Outage over")
+
+        helpers = [asyncio.create_task(dashboard())]
+        if args.outage_for > 0:
+            helpers.append(asyncio.create_task(outage()))
+
+        await asyncio.sleep(max(0.0, start + args.duration - time.time()))
+        rtdb.elapsed = time.time() - start
+        for task in tasks + helpers:
+            task.cancel()
+        await asyncio.gather(*tasks, *helpers, return_exceptions=True)
+
+    server.close()
+    executor.shutdown(wait=False)
+    return rtdb
+
+
+def report(rtdb: FakeRTDB, args):
+    elapsed = rtdb.elapsed
+    total = sum(rtdb.requests.values())
+    by_method = '  '.join(f"{method} {count}" for method, count in sorted(rtdb.requests.items()))
+    device_hours = args.devices * elapsed / 3600
+
+    print(f"Fleet: {args.devices} devices, {elapsed:.0f}s, heartbeat {args.heartbeat}s, "
+          f"latency {args.latency:.0f}±{args.jitter:.0f}ms, error rate {args.error_rate:.1%}")
+    print(f"Requests: {total} ({total / elapsed:.1f}/s, peak {max(rtdb.per_second.values(), default=0)}/s)  {by_method}")
+
+    for kind in ('write', 'stream'):
+        total_bytes = sum(counts[kind] for device, counts in rtdb.bytes.items() if device != "other")
+        print(f"Traffic ({kind}s): {total_bytes / device_hours / 1024:.1f} KB per device-hour")
+
+    claim_latency = [rtdb.first_publish[device] - claimed
+                     for device, claimed in rtdb.claimed_at.items() if device in rtdb.first_publish]
+    print(f"Claim -> publish: {percentiles(claim_latency)}  ({len(claim_latency)}/{len(rtdb.claimed_at)} published)")
+
+    if rtdb.outage_end is not None:
+        recovery = []
+        for times in rtdb.writes.values():
+            after = [t for t in times if t >= rtdb.outage_end]
+            if after:
+                recovery.append(after[0] - rtdb.outage_end)
+        print(f"Outage {args.outage_for:.0f}s recovery: {percentiles(recovery)}  "
+              f"({len(recovery)}/{len(rtdb.writes)} recovered)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of device managers against a local RTDB stand-in.")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=120, help="seconds to run")
+    parser.add_argument("--heartbeat", type=float, default=UPDATE_INTERVAL, help="seconds between heartbeats")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which devices boot")
+    parser.add_argument("--claim-rate", type=float, default=20, help="dashboard claims per second")
+    parser.add_argument("--latency", type=float, default=30, help="RTDB latency in ms")
+    parser.add_argument("--jitter", type=float, default=10, help="latency jitter in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--outage-at", type=float, default=60, help="seconds into the run")
+    parser.add_argument("--outage-for", type=float, default=0, help="outage length in seconds (0 = none)")
+    parser.add_argument("--port", type=int, default=SIM_PORT)
+    parser.add_argument("--verbose", action="store_true", help="show per-device manager logs")
+    args = parser.parse_args()
+
+    logging.getLogger().handlers = [logging.StreamHandler()]
+    if not args.verbose:
+        # Hundreds of devices logging every write would drown the report
+        for name in ("raspi_device_manager", "firebase_batch", "urllib3"):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    rtdb = asyncio.run(run_fleet(args))
+    report(rtdb, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+HLS DVR
+Keeps a size-capped history of every camera's HLS segments on the Pi.
+
+The launcher writes live segments (usually to tmpfs) and deletes them after
+~10 seconds. When dvr_enabled is set in stream_config.json, DVRArchiver copies
+each finished segment into dvr_dir/<cam>/<YYYYMMDDHH>/<start_ms>.ts and records
+it in a SQLite index. Old segments are evicted by age (dvr_max_hours) and by
+total size (dvr_max_gb).
+
+A small HTTP server turns any time range into a VOD playlist:
+    GET /dvr/<cam>.m3u8?start=<epoch or ISO time>&end=<epoch or ISO time>
+    GET /dvr/<cam>/ranges          -> recorded time ranges as JSON
+    GET /dvr/<cam>/<hour>/<file>.ts -> archived segment
+
+Usage:
+    python3 hls_dvr.py serve
+    python3 hls_dvr.py playlist cam1 --start 2024-05-01T10:00:00+07:00 --end 2024-05-01T10:05:00+07:00
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from stream_config import live_hls_dir, load_stream_config
+
+# Configuration
+DVR_SCAN_INTERVAL = 2  # seconds between live playlist scans
+DISCONTINUITY_GAP = 1.0  # seconds of missing video that start a new range
+DEFAULT_RANGE = 3600  # seconds returned when a request has no start time
+INDEX_DB_NAME = "dvr_index.sqlite3"
+CAM_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+logger = logging.getLogger(__name__)
+
+Segment = Tuple[int, float, str]  # (start_ms, duration_s, path)
+
+
+def parse_program_date_time(value: str) -> Optional[int]:
+    """Parse an #EXT-X-PROGRAM-DATE-TIME value into epoch milliseconds."""
+    value = value.strip()
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z'):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp() * 1000)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_live_playlist(playlist_path: Path) -> List[Segment]:
+    """Return (start_ms, duration, segment filename) for each segment in a live playlist."""
+    try:
+        lines = playlist_path.read_text().splitlines()
+    except OSError:
+        return []
+
+    segments = []
+    start_ms = None
+    duration = None
+    next_start_ms = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+            start_ms = parse_program_date_time(line.split(':', 1)[1])
+        elif line.startswith('#EXTINF:'):
+            try:
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            except ValueError:
+                duration = None
+        elif line and not line.startswith('#'):
+            if start_ms is None:
+                start_ms = next_start_ms
+            if duration is not None and start_ms is not None:
+                segments.append((start_ms, duration, line))
+                next_start_ms = start_ms + int(duration * 1000)
+            start_ms = None
+            duration = None
+    return segments
+
+
+def parse_time_arg(value: str) -> int:
+    """Parse epoch seconds or an ISO-8601 time into epoch milliseconds (ValueError if neither)."""
+    try:
+        return int(float(value) * 1000)
+    except OverflowError:  # "inf"
+        raise ValueError(f"time out of range: {value}") from None
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+class DVRIndex:
+    """SQLite index of archived segments. One instance per thread."""
+
+    def __init__(self, dvr_dir: Path):
+        dvr_dir.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(dvr_dir / INDEX_DB_NAME, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # readers don't block the archiver
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " cam TEXT NOT NULL, start_ms INTEGER NOT NULL, duration REAL NOT NULL,"
+            " path TEXT NOT NULL, size INTEGER NOT NULL, PRIMARY KEY (cam, start_ms))"
+        )
+        # retention selects by age across all cameras, which the (cam, start_ms) key cannot serve
+        self.conn.execute("CREATE INDEX IF NOT EXISTS segments_start ON segments(start_ms)")
+        self.conn.commit()
+
+    def add(self, cam: str, start_ms: int, duration: float, path: str, size: int):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?)",
+            (cam, start_ms, duration, path, size),
+        )
+
+    def last_start(self, cam: str) -> int:
+        row = self.conn.execute(
+            "SELECT MAX(start_ms) FROM segments WHERE cam = ?", (cam,)
+        ).fetchone()
+        return row[0] or 0
+
+    def total_size(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM segments").fetchone()[0]
+
+    def query(self, cam: str, start_ms: int, end_ms: int) -> List[Segment]:
+        """Segments overlapping [start_ms, end_ms), oldest first."""
+        return self.conn.execute(
+            "SELECT start_ms, duration, path FROM segments"
+            " WHERE cam = ? AND start_ms < ? AND start_ms + duration * 1000 > ?"
+            " ORDER BY start_ms",
+            (cam, end_ms, start_ms),
+        ).fetchall()
+
+    def older_than(self, cutoff_ms: int) -> List[Tuple[str, int, str, int]]:
+        return self.conn.execute(
+            "SELECT cam, start_ms, path, size FROM segments WHERE start_ms < ?", (cutoff_ms,)
+        ).fetchall()
+
+    def oldest(self, limit: int) -> List[Tuple[str, int, str, int]]:
+        return self.conn.execute(
+            "SELECT cam, start_ms, path, size FROM segments ORDER BY start_ms LIMIT ?", (limit,)
+        ).fetchall()
+
+    def delete(self, rows: Iterable[Tuple[str, int, str, int]]):
+        self.conn.executemany(
+            "DELETE FROM segments WHERE cam = ? AND start_ms = ?",
+            [(cam, start_ms) for cam, start_ms, _, _ in rows],
+        )
+
+    def ranges(self, cam: str) -> List[Tuple[int, int]]:
+        """Continuous recorded ranges as (start_ms, end_ms)."""
+        ranges: List[List[int]] = []
+        for start_ms, duration, _ in self.query(cam, 0, 2 ** 62):
+            end_ms = start_ms + int(duration * 1000)
+            if ranges and start_ms - ranges[-1][1] <= DISCONTINUITY_GAP * 1000:
+                ranges[-1][1] = end_ms
+            else:
+                ranges.append([start_ms, end_ms])
+        return [(start, end) for start, end in ranges]
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def build_vod_playlist(segments: List[Segment], uri_prefix: str) -> str:
+    """Build a VOD playlist for archived segments (oldest first)."""
+    target_duration = max((math.ceil(duration) for _, duration, _ in segments), default=2)
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{target_duration}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+    ]
+    previous_end_ms = None
+    for start_ms, duration, path in segments:
+        if previous_end_ms is not None and abs(start_ms - previous_end_ms) > DISCONTINUITY_GAP * 1000:
+            lines.append('#EXT-X-DISCONTINUITY')
+        program_date_time = datetime.fromtimestamp(start_ms / 1000).astimezone()
+        lines.append(f'#EXT-X-PROGRAM-DATE-TIME:{program_date_time.isoformat(timespec="milliseconds")}')
+        lines.append(f'#EXTINF:{duration:.3f},')
+        lines.append(f'{uri_prefix}/{path}')
+        previous_end_ms = start_ms + int(duration * 1000)
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+class DVRArchiver:
+    """Copies finished live segments into the DVR and enforces retention."""
+
+    def __init__(self, config: Dict[str, Any], live_dir: Path):
+        self.live_dir = live_dir
+        self.dvr_dir = Path(config["dvr_dir"])
+        self.max_age_ms = int(float(config["dvr_max_hours"]) * 3600 * 1000)
+        self.max_bytes = int(float(config["dvr_max_gb"]) * 1024 ** 3)
+        self.index = DVRIndex(self.dvr_dir)
+        self.total_bytes = self.index.total_size()
+        self._last_start: Dict[str, int] = {}
+
+    async def run(self, camera_names: Callable[[], Iterable[str]]):
+        """Archive new segments every DVR_SCAN_INTERVAL seconds."""
+        logger.info(f"📼 DVR archiving to {self.dvr_dir} "
+                    f"(max {self.max_age_ms / 3600000:g}h per camera, "
+                    f"{self.max_bytes / 1024 ** 3:g} GB total)")
+        try:
+            while True:
+                await asyncio.sleep(DVR_SCAN_INTERVAL)
+                try:
+                    await asyncio.to_thread(self.scan, list(camera_names()))
+                except Exception as e:
+                    logger.error(f"DVR scan failed: {e}")
+        finally:
+            self.index.close()
+
+    def scan(self, camera_names: List[str]):
+        """Copy segments that appeared since the last scan (runs in a worker thread)."""
+        for cam_name in camera_names:
+            self._archive_camera(cam_name)
+        self._enforce_retention()
+        self.index.commit()
+
+    def _archive_camera(self, cam_name: str):
+        if cam_name not in self._last_start:
+            self._last_start[cam_name] = self.index.last_start(cam_name)
+
+        for start_ms, duration, segment_name in parse_live_playlist(self.live_dir / f"{cam_name}.m3u8"):
+            if start_ms <= self._last_start[cam_name]:
+                continue
+            hour_dir = datetime.fromtimestamp(start_ms / 1000).strftime('%Y%m%d%H')
+            relative_path = f"{hour_dir}/{start_ms}.ts"
+            destination = self.dvr_dir / cam_name / relative_path
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                shutil.copyfile(self.live_dir / segment_name, destination)
+            except FileNotFoundError:
+                logger.debug(f"DVR: {segment_name} vanished before it could be archived")
+                continue
+            size = destination.stat().st_size
+            self.index.add(cam_name, start_ms, duration, relative_path, size)
+            self.total_bytes += size
+            self._last_start[cam_name] = start_ms
+
+    def _enforce_retention(self):
+        expired = self.index.older_than(int(time.time() * 1000) - self.max_age_ms)
+        self._evict(expired)
+        while self.total_bytes > self.max_bytes:
+            oldest = self.index.oldest(100)
+            if not oldest:
+                break
+            self._evict(oldest)
+
+    def _evict(self, rows: List[Tuple[str, int, str, int]]):
+        if not rows:
+            return
+        for cam_name, _, relative_path, size in rows:
+            segment_path = self.dvr_dir / cam_name / relative_path
+            segment_path.unlink(missing_ok=True)
+            self.total_bytes -= size
+            try:
+                segment_path.parent.rmdir()  # drop the hour directory once it is empty
+            except OSError:
+                pass
+        self.index.delete(rows)
+        logger.debug(f"DVR: evicted {len(rows)} segments")
+
+
+class DVRRequestHandler(BaseHTTPRequestHandler):
+    dvr_dir: Path = Path(".")
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A003
+        return
+
+    def _send(self, status_code: int, body: bytes, content_type: str) -> None:
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:  # noqa: N802
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) < 2 or parts[0] != 'dvr':
+            self.send_error(404, "Not Found")
+            return
+
+        if len(parts) == 2 and parts[1].endswith('.m3u8'):
+            self._send_playlist(parts[1][:-len('.m3u8')], parse_qs(url.query))
+        elif len(parts) == 3 and parts[2] == 'ranges':
+            self._send_ranges(parts[1])
+        elif len(parts) == 4 and parts[3].endswith('.ts'):
+            self._send_segment(parts[1], parts[2], parts[3])
+        else:
+            self.send_error(404, "Not Found")
+
+    def _send_playlist(self, cam_name: str, query: Dict[str, List[str]]) -> None:
+        if not CAM_NAME_PATTERN.match(cam_name):
+            self.send_error(404, "Not Found")
+            return
+        try:
+            end_ms = parse_time_arg(query['end'][0]) if 'end' in query else int(time.time() * 1000)
+            start_ms = parse_time_arg(query['start'][0]) if 'start' in query else end_ms - DEFAULT_RANGE * 1000
+        except ValueError:
+            self.send_error(400, "start/end must be epoch seconds or ISO-8601 times")
+            return
+
+        index = DVRIndex(self.dvr_dir)
+        try:
+            segments = index.query(cam_name, start_ms, end_ms)
+        finally:
+            index.close()
+        if not segments:
+            self.send_error(404, "No recording in that range")
+            return
+        playlist = build_vod_playlist(segments, f"/dvr/{cam_name}")
+        self._send(200, playlist.encode('utf-8'), "application/vnd.apple.mpegurl")
+
+    def _send_ranges(self, cam_name: str) -> None:
+        if not CAM_NAME_PATTERN.match(cam_name):
+            self.send_error(404, "Not Found")
+            return
+        index = DVRIndex(self.dvr_dir)
+        try:
+            ranges = index.ranges(cam_name)
+        finally:
+            index.close()
+        body = json.dumps([{"start_ms": start, "end_ms": end} for start, end in ranges])
+        self._send(200, body.encode('utf-8'), "application/json; charset=utf-8")
+
+    def _send_segment(self, cam_name: str, hour_dir: str, file_name: str) -> None:
+        if not (CAM_NAME_PATTERN.match(cam_name) and hour_dir.isdigit()
+                and file_name[:-len('.ts')].isdigit()):
+            self.send_error(404, "Not Found")
+            return
+        try:
+            body = (self.dvr_dir / cam_name / hour_dir / file_name).read_bytes()
+        except OSError:
+            self.send_error(404, "Segment expired")
+            return
+        self._send(200, body, "video/mp2t")
+
+
+def start_dvr_server(config: Dict[str, Any]) -> ThreadingHTTPServer:
+    """Serve DVR playlists and segments from a background thread."""
+    DVRRequestHandler.dvr_dir = Path(config["dvr_dir"])
+    DVRIndex(DVRRequestHandler.dvr_dir).close()  # make sure the index exists
+    host = config.get("dvr_host") or "127.0.0.1"
+    server = ThreadingHTTPServer((host, int(config["dvr_port"])), DVRRequestHandler)
+    threading.Thread(target=server.serve_forever, name="dvr-http", daemon=True).start()
+    logger.info(f"📼 DVR playback on http://{host}:{config['dvr_port']}/dvr/<cam>.m3u8?start=&end=")
+    return server
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Serve or export DVR recordings.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("serve", help="run the DVR playback HTTP server")
+    playlist_parser = subparsers.add_parser("playlist", help="print a VOD playlist for a time range")
+    playlist_parser.add_argument("cam")
+    playlist_parser.add_argument("--start", required=True, help="epoch seconds or ISO-8601")
+    playlist_parser.add_argument("--end", required=True, help="epoch seconds or ISO-8601")
+    args = parser.parse_args()
+
+    config = load_stream_config()
+    if args.command == "serve":
+        server = start_dvr_server(config)
+        logger.info(f"Live segments: {live_hls_dir(config)}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    dvr_dir = Path(config["dvr_dir"])
+    index = DVRIndex(dvr_dir)
+    segments = index.query(args.cam, parse_time_arg(args.start), parse_time_arg(args.end))
+    index.close()
+    print(build_vod_playlist(segments, str(dvr_dir / args.cam)), end='')
+
+
+if __name__ == "__main__":
+    main()
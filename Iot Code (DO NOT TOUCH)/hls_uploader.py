@@ -4,21 +4,54 @@ HLS File Uploader
 Uploads HLS segments from Raspberry Pi to VPS server via rsync/SSH.
 
 This script monitors the local HLS directory and uploads new/changed files
-to the VPS server in real-time.
+to the VPS server in real-time. Each cycle's rsync stats feed UploadMetrics
+(throughput, segment latency, backlog and per-camera lag, see upload_metrics.py).
+
+An in-memory UploadManifest remembers what the VPS already has (size, inode
+and ctime per file; content hash for playlists), so each cycle hands rsync
+only the files that are new or changed. Stale files are removed from the VPS
+by a delete-only rsync every FULL_SYNC_INTERVAL.
+
+Camera snapshots (<cam>.jpg/.webp, see stream_config.py) are picked up like
+segments and go out on their camera's lane with its media.
+
+Files are uploaded on per-camera lanes (UploadLanes) that run concurrently
+over a bounded worker pool with weighted fair scheduling and an optional
+per-camera bandwidth cap. Optional vps_config.json keys:
+
+    "upload_lanes": 3                   concurrent rsync processes
+    "upload_bwlimit": 0                 KiB/s per lane (0 = unlimited)
+    "camera_upload": {"cam1": {"weight": 2, "bwlimit": 800}}
+    "local_target_dir": "/tmp/vps"      upload to a local directory instead of the VPS
+
+Usage:
+    python3 hls_uploader.py
 """
 
+import hashlib
 import json
 import logging
 import os
+import shlex
 import subprocess
+import threading
 import time
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import instrumentation
+from stream_config import live_hls_dir, load_stream_config
+from upload_metrics import UploadMetrics, camera_of, start_metrics_server
 
 # Configuration
 CONFIG_FILE = Path(__file__).parent / "vps_config.json"
-LOCAL_HLS_DIR = Path("/var/www/html/hls")
+LOCAL_HLS_DIR = live_hls_dir(load_stream_config())  # Where ffmpeg_hls_launcher.py writes
 LOG_FILE = Path(__file__).parent / "hls_uploader.log"
+SSH_CONTROL_PATH = "/tmp/hls-ssh-%C"  # shared SSH connection (ControlMaster) socket
+SSH_CONTROL_PERSIST = 300  # seconds the shared connection stays open when idle
+FULL_SYNC_INTERVAL = 60  # seconds between full scans + delete-only syncs (removes stale VPS files)
+IGNORED_SUFFIXES = ('.tmp', '.lock')  # files FFmpeg is still writing
+UPLOAD_LANES = 3  # default concurrent rsync processes (OpenSSH allows 10 sessions per connection)
 
 # Setup logging
 logging.basicConfig(
@@ -61,110 +94,388 @@ def load_vps_config() -> Optional[Dict]:
         return None
 
 
-def upload_hls_files(config: Dict) -> bool:
+def ssh_options(config: Dict) -> List[str]:
     """
-    Upload HLS files to VPS using rsync over SSH.
-    
-    Returns True if successful, False otherwise.
+    SSH command shared by rsync and the connection test.
+    ControlMaster keeps one authenticated connection open, so each upload
+    reuses it instead of doing a new TCP + SSH handshake.
+    """
+    ssh_key = os.path.expanduser(config.get('ssh_key_path', '~/.ssh/vps_hls_key'))
+    return [
+        'ssh',
+        '-i', ssh_key,
+        '-p', str(config.get('vps_port', 22)),
+        '-o', 'StrictHostKeyChecking=no',
+        '-o', 'ServerAliveInterval=30',
+        '-o', 'ServerAliveCountMax=3',
+        '-o', 'ConnectTimeout=10',
+        '-o', 'ControlMaster=auto',
+        '-o', f'ControlPath={SSH_CONTROL_PATH}',
+        '-o', f'ControlPersist={SSH_CONTROL_PERSIST}',
+    ]
+
+
+def upload_target(config: Dict) -> str:
+    """rsync destination: the VPS over SSH, or local_target_dir when set."""
+    if config.get('local_target_dir'):
+        return f"{config['local_target_dir']}/"
+    return f"{config['vps_user']}@{config['vps_host']}:{config['vps_hls_path']}/"
+
+
+def build_rsync_cmd(config: Dict, files_from: bool = False, bwlimit: int = 0) -> List[str]:
+    """
+    Build the rsync command for LOCAL_HLS_DIR and the VPS.
+    With files_from, only the paths given on stdin are sent and nothing is
+    deleted. Without it, nothing is sent and VPS files that no longer exist
+    locally are deleted (new files go through the manifest instead).
+    bwlimit caps the transfer rate in KiB/s.
     """
-    vps_host = config['vps_host']
-    vps_user = config['vps_user']
-    vps_port = config.get('vps_port', 22)
-    vps_hls_path = config['vps_hls_path']
-    ssh_key = config.get('ssh_key_path', '~/.ssh/vps_hls_key')
-    
-    # Expand user path
-    ssh_key = os.path.expanduser(ssh_key)
-    
-    # Build rsync command
     # -r: recursive
     # -l: preserve symlinks
     # -v: verbose
     # -z: compress during transfer
+    # --stats / --itemize-changes: bytes on the wire and which files were sent (for UploadMetrics)
     # --no-perms: don't preserve permissions (uploader can't change them)
     # --no-owner: don't preserve owner (files will be owned by uploader, then chowned by VPS)
     # --no-times: don't preserve timestamps (uploader can't change them)
     # --delete: delete files on VPS that don't exist locally
+    # --existing + --ignore-existing: send nothing (delete-only sweep)
     # --ignore-missing-args: ignore missing source files (FFmpeg deletes old segments)
     # --exclude: exclude temporary files
-    ssh_options = [
-        'ssh',
-        '-i', ssh_key,
-        '-p', str(vps_port),
-        '-o', 'StrictHostKeyChecking=no',
-        '-o', 'ServerAliveInterval=30',
-        '-o', 'ServerAliveCountMax=3',
-        '-o', 'ConnectTimeout=10'
-    ]
-    
+    # --bwlimit: per-lane bandwidth cap
     rsync_cmd = [
         'rsync',
         '-rlvz',  # Use -rlvz instead of -avz (no archive mode to avoid permission/time issues)
         '--no-perms',  # Don't try to preserve permissions (uploader can't set them)
         '--no-owner',  # Don't try to preserve owner (files owned by www-data on VPS)
         '--no-times',  # Don't try to preserve timestamps (uploader can't set them)
-        '--delete',
+        *(['--files-from=-'] if files_from else ['--delete', '--existing', '--ignore-existing']),
         '--ignore-missing-args',  # Ignore files that vanish during transfer (FFmpeg deletes old segments)
         '--exclude', '*.tmp',
         '--exclude', '*.lock',
-        '-e', ' '.join(ssh_options),
+        '--stats',
+        '--itemize-changes',
+        *([f'--bwlimit={bwlimit}'] if bwlimit else []),
+        *([] if config.get('local_target_dir') else ['-e', ' '.join(ssh_options(config))]),
         f'{LOCAL_HLS_DIR}/',
-        f'{vps_user}@{vps_host}:{vps_hls_path}/'
+        upload_target(config)
     ]
+    return rsync_cmd
+
+
+def check_rsync_result(returncode: int, stderr: str, stdout: str = "") -> bool:
+    """Log an rsync exit code. Returns True if the upload counts as successful."""
+    if returncode == 0:
+        logger.debug("✅ HLS files uploaded successfully")
+        return True
+    elif returncode == 24:
+        # Exit code 24: Some files vanished (FFmpeg deleted old segments during transfer)
+        # This is expected and harmless - segments are deleted by FFmpeg while rsync is uploading
+        logger.info("✅ HLS files uploaded (some files vanished - expected with HLS segment deletion)")
+        return True
+    elif returncode == 255:
+        logger.error("❌ Rsync error 255: SSH connection failed (network timeout or refused)")
+        if stderr:
+            logger.error(f"SSH stderr: {stderr.strip()}")
+        return False
+    else:
+        logger.warning(f"⚠️ Rsync returned code {returncode}")
+        if stderr:
+            logger.warning(f"Stderr: {stderr}")
+        if stdout:
+            logger.debug(f"Stdout: {stdout}")
+        return False
+
+
+Pending = Dict[str, Tuple[Tuple[int, int, int], Optional[str]]]  # name -> (size/inode/ctime, playlist hash)
+
+
+class UploadManifest:
+    """
+    Files confirmed on the VPS, keyed by name with their (size, inode, ctime)
+    at upload time. A file whose key still matches is not offered to rsync
+    again; playlists whose key changed are only resent if their content did.
+    Upload lanes confirm from their own threads, hence the lock.
+    """
+
+    def __init__(self):
+        self.files: Dict[str, Tuple[int, int, int]] = {}
+        self.hashes: Dict[str, str] = {}  # playlist name -> sha1 of the uploaded content
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(st: os.stat_result) -> Tuple[int, int, int]:
+        return st.st_size, st.st_ino, st.st_ctime_ns
+
+    @instrumentation.traced("upload.scan")
+    def changed(self, names: Optional[Iterable[str]] = None) -> Pending:
+        """
+        Files that need uploading, among names or, without names, among
+        everything in LOCAL_HLS_DIR (a full scan also forgets deleted files).
+        """
+        if names is None:
+            try:
+                with os.scandir(LOCAL_HLS_DIR) as entries:
+                    stats = {entry.name: entry.stat() for entry in entries if entry.is_file()}
+            except OSError:
+                stats = {}
+            with self._lock:
+                for name in set(self.files) - set(stats):
+                    self.files.pop(name, None)
+                    self.hashes.pop(name, None)
+        else:
+            stats = {}
+            for name in set(names):
+                try:
+                    stats[name] = (LOCAL_HLS_DIR / name).stat()
+                except OSError:
+                    continue  # already deleted by FFmpeg
+
+        pending: Pending = {}
+        for name, st in stats.items():
+            key = self._key(st)
+            if name.endswith(IGNORED_SUFFIXES) or self.files.get(name) == key:
+                continue
+            digest = None
+            if name.endswith('.m3u8'):
+                try:
+                    digest = hashlib.sha1((LOCAL_HLS_DIR / name).read_bytes()).hexdigest()
+                except OSError:
+                    continue
+                if self.hashes.get(name) == digest:
+                    with self._lock:
+                        self.files[name] = key  # rewritten with the same content
+                    continue
+            pending[name] = (key, digest)
+        return pending
+
+    def confirmed(self, name: str) -> bool:
+        with self._lock:
+            return name in self.files
+
+    def confirm(self, pending: Pending):
+        """Mark files returned by changed() as uploaded."""
+        with self._lock:
+            for name, (key, digest) in pending.items():
+                self.files[name] = key
+                if digest:
+                    self.hashes[name] = digest
+
+    def reconcile(self, config: Dict) -> bool:
+        """
+        List the VPS directory once at startup; local segments already there
+        with the same size count as uploaded. Playlists are always resent.
+        """
+        remote = list_remote_files(config)
+        if remote is None:
+            return False
+        with self._lock:
+            for name, size in remote.items():
+                if name.endswith('.m3u8'):
+                    continue
+                try:
+                    st = (LOCAL_HLS_DIR / name).stat()
+                except OSError:
+                    continue
+                if st.st_size == size:
+                    self.files[name] = self._key(st)
+        logger.info(f"🔄 VPS has {len(remote)} files, {len(self.files)} already match local segments")
+        return True
+
+
+def list_remote_files(config: Dict) -> Optional[Dict[str, int]]:
+    """{name: size} of the files in the upload target, or None if it cannot be listed."""
+    if config.get('local_target_dir'):
+        try:
+            with os.scandir(config['local_target_dir']) as entries:
+                return {entry.name: entry.stat().st_size for entry in entries if entry.is_file()}
+        except OSError as e:
+            logger.warning(f"Could not list target directory: {e}")
+            return None
+
+    remote_cmd = f"find {shlex.quote(config['vps_hls_path'])} -maxdepth 1 -type f -printf '%f %s\\n'"
+    try:
+        result = subprocess.run(
+            ssh_options(config) + [f"{config['vps_user']}@{config['vps_host']}", remote_cmd],
+            capture_output=True,
+            text=True,
+            timeout=30
+        )
+    except Exception as e:
+        logger.warning(f"Could not list VPS directory: {e}")
+        return None
+    if result.returncode != 0:
+        logger.warning(f"Could not list VPS directory: {result.stderr.strip()}")
+        return None
+
+    remote: Dict[str, int] = {}
+    for line in result.stdout.splitlines():
+        name, _, size = line.rpartition(' ')
+        if name and size.isdigit():
+            remote[name] = int(size)
+    return remote
+
+
+@instrumentation.traced("upload.rsync")
+def run_rsync(config: Dict, files: Optional[List[str]] = None, bwlimit: int = 0) -> Tuple[bool, str]:
+    """
+    rsync the given files (relative to LOCAL_HLS_DIR) to the VPS, or without
+    files run the delete-only sweep. Returns (ok, rsync output).
+    """
+    if files is not None and not files:
+        return True, ""
+    rsync_cmd = build_rsync_cmd(config, files_from=files is not None, bwlimit=bwlimit)
     
     try:
         logger.debug(f"Running rsync: {' '.join(rsync_cmd)}")
         result = subprocess.run(
             rsync_cmd,
+            input='\n'.join(files) if files is not None else None,
             capture_output=True,
             text=True,
             timeout=30
         )
-        
-        if result.returncode == 0:
-            logger.info("✅ HLS files uploaded successfully")
-            return True
-        elif result.returncode == 24:
-            # Exit code 24: Some files vanished (FFmpeg deleted old segments during transfer)
-            # This is expected and harmless - segments are deleted by FFmpeg while rsync is uploading
-            logger.info("✅ HLS files uploaded (some files vanished - expected with HLS segment deletion)")
-            return True
-        elif result.returncode == 255:
-            logger.error("❌ Rsync error 255: SSH connection failed (network timeout or refused)")
-            if result.stderr:
-                logger.error(f"SSH stderr: {result.stderr.strip()}")
-            return False
-        else:
-            logger.warning(f"⚠️ Rsync returned code {result.returncode}")
-            if result.stderr:
-                logger.warning(f"Stderr: {result.stderr}")
-            if result.stdout:
-                logger.debug(f"Stdout: {result.stdout}")
-            return False
+        return check_rsync_result(result.returncode, result.stderr, result.stdout), result.stdout
             
     except subprocess.TimeoutExpired:
         logger.error("❌ Rsync upload timed out")
-        return False
     except Exception as e:
         logger.error(f"❌ Error uploading HLS files: {e}")
-        return False
+    return False, ""
+
+
+def lane_settings(config: Dict, cam_name: str) -> Tuple[float, int]:
+    """(weight, bwlimit in KiB/s) for one camera's upload lane."""
+    settings = config.get('camera_upload', {}).get(cam_name, {})
+    return settings.get('weight', 1), settings.get('bwlimit', config.get('upload_bwlimit', 0))
+
+
+class UploadLanes:
+    """
+    Per-camera upload lanes over a bounded pool of rsync workers.
+
+    Each camera's files go out in order (media before its playlist), but
+    cameras upload concurrently, so one camera's big keyframe-heavy segment
+    no longer holds up everyone else's playlist. At most upload_lanes rsync
+    processes run at once (channels on the shared SSH connection). When more
+    cameras are waiting than there are workers, the one with the lowest
+    virtual time (bytes uploaded / weight) goes next: weighted fair queuing,
+    where an idle camera does not bank credit. bwlimit caps each lane.
+    """
+
+    def __init__(self, config: Dict, manifest: UploadManifest, metrics: Optional[UploadMetrics] = None):
+        self.config = config
+        self.manifest = manifest
+        self.metrics = metrics
+        self._waiting: Dict[str, Pending] = {}  # cam -> files not yet handed to a worker
+        self._busy: Dict[str, Pending] = {}  # cam -> files being uploaded
+        self._vtime: Dict[str, float] = {}
+        self._clock = 0.0  # virtual time of the last dispatched lane
+        self._failed: Set[str] = set()
+        self._stopped = False
+        self._cond = threading.Condition()
+        for index in range(config.get('upload_lanes', UPLOAD_LANES)):
+            threading.Thread(target=self._worker, name=f"upload-lane-{index}", daemon=True).start()
+
+    def submit(self, pending: Pending):
+        """Queue files on their camera's lane (files already in flight unchanged are skipped)."""
+        with self._cond:
+            for name, value in pending.items():
+                cam_name = camera_of(name)
+                if self._busy.get(cam_name, {}).get(name) == value:
+                    continue
+                self._waiting.setdefault(cam_name, {})[name] = value
+            self._cond.notify_all()
+
+    def healthy(self) -> bool:
+        """False while any camera's last upload failed."""
+        with self._cond:
+            return not self._failed
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._waiting and not self._busy, timeout)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _next_lane(self) -> Optional[str]:
+        ready = [cam_name for cam_name in self._waiting if cam_name not in self._busy]
+        if not ready:
+            return None
+        cam_name = min(ready, key=lambda cam: max(self._vtime.get(cam, 0.0), self._clock))
+        self._vtime[cam_name] = self._clock = max(self._vtime.get(cam_name, 0.0), self._clock)
+        return cam_name
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                cam_name = self._next_lane()
+                while cam_name is None and not self._stopped:
+                    self._cond.wait()
+                    cam_name = self._next_lane()
+                if self._stopped:
+                    return
+                pending = self._busy[cam_name] = self._waiting.pop(cam_name)
+
+            success = self._upload(cam_name, pending)
+
+            with self._cond:
+                del self._busy[cam_name]
+                weight, _ = lane_settings(self.config, cam_name)
+                self._vtime[cam_name] += sum(key[0] for key, _ in pending.values()) / max(weight, 0.01)
+                if success:
+                    self._failed.discard(cam_name)
+                else:
+                    self._failed.add(cam_name)  # not requeued: the next full scan offers them again
+                self._cond.notify_all()
+
+    @instrumentation.traced("upload.lane")
+    def _upload(self, cam_name: str, pending: Pending) -> bool:
+        """One camera's files: media first, so a playlist never references a segment the VPS lacks."""
+        media = sorted(name for name, (_, digest) in pending.items() if digest is None)
+        playlists = sorted(name for name, (_, digest) in pending.items() if digest)
+        _, bwlimit = lane_settings(self.config, cam_name)
+        local, started = segment_times(media), time.time()
+
+        success, stdout = run_rsync(self.config, media, bwlimit)
+        if success:
+            success, playlist_stdout = run_rsync(self.config, playlists, bwlimit)
+            stdout += playlist_stdout
+        if success:
+            self.manifest.confirm(pending)
+        if self.metrics is not None:
+            self.metrics.record(local, started, success, stdout)
+        return success
+
+
+def segment_times(names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    Modification time of each segment among names (file names in
+    LOCAL_HLS_DIR), or of all local segments. Segments are <cam>_NNN.ts.
+    """
+    if names is None:
+        paths = LOCAL_HLS_DIR.glob('*.ts')
+    else:
+        paths = (LOCAL_HLS_DIR / name for name in names if name.endswith('.ts'))
+    times: Dict[str, float] = {}
+    for path in paths:
+        try:
+            times[path.name] = path.stat().st_mtime
+        except OSError:
+            continue  # already deleted by FFmpeg
+    return times
 
 
 def test_vps_connection(config: Dict) -> bool:
     """Test SSH connection to VPS."""
-    vps_host = config['vps_host']
-    vps_user = config['vps_user']
-    vps_port = config.get('vps_port', 22)
-    ssh_key = config.get('ssh_key_path', '~/.ssh/vps_hls_key')
-    ssh_key = os.path.expanduser(ssh_key)
-    
-    ssh_cmd = [
-        'ssh',
-        '-i', ssh_key,
-        '-p', str(vps_port),
-        '-o', 'StrictHostKeyChecking=no',
-        '-o', 'ConnectTimeout=5',
-        f'{vps_user}@{vps_host}',
+    if config.get('local_target_dir'):
+        Path(config['local_target_dir']).mkdir(parents=True, exist_ok=True)
+        return True
+    ssh_cmd = ssh_options(config) + [
+        f"{config['vps_user']}@{config['vps_host']}",
         'echo "Connection successful"'
     ]
     
@@ -189,6 +500,7 @@ def test_vps_connection(config: Dict) -> bool:
 
 def main():
     """Main upload loop."""
+    instrumentation.setup("hls_uploader")
     logger.info("=" * 60)
     logger.info("HLS Uploader Starting...")
     logger.info("=" * 60)
@@ -215,13 +527,26 @@ def main():
     max_backoff = 60  # seconds
     consecutive_failures = 0
     current_interval = upload_interval
+    metrics = UploadMetrics()
+    if config.get('metrics_port'):
+        start_metrics_server(metrics, config['metrics_port'], load_stream_config()['metrics_host'])
+    manifest = UploadManifest()
+    manifest.reconcile(config)
+    metrics.watch_local(segment_times, manifest.confirmed)
+    lanes = UploadLanes(config, manifest, metrics)
+    last_sweep = time.monotonic()
     
     logger.info(f"Starting upload loop (interval: {upload_interval} seconds)")
     
     try:
         while True:
-            # Upload HLS files
-            success = upload_hls_files(config)
+            # Queue new/changed HLS files on the camera lanes, then periodically remove stale ones from the VPS
+            lanes.submit(manifest.changed())
+            success = lanes.healthy()
+            if success and time.monotonic() - last_sweep >= FULL_SYNC_INTERVAL:
+                success, _ = run_rsync(config)
+                last_sweep = time.monotonic()
+            metrics.export()
             
             if success:
                 consecutive_failures = 0
@@ -241,6 +566,8 @@ def main():
         logger.info("Received interrupt signal. Shutting down...")
     except Exception as e:
         logger.error(f"Unexpected error: {e}", exc_info=True)
+    finally:
+        lanes.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Motion Index
+Scores per-camera activity from a tiny grayscale substream and indexes it by time.
+
+For each camera a low-priority FFmpeg reads the launcher's own live playlist
+(no second RTSP connection), decodes keyframes only and scales them to
+motion_width x motion_height grayscale. Frames land in a preallocated NumPy
+buffer and are compared with the previous frame:
+
+    score   = mean absolute pixel difference (0-255)
+    changed = fraction of pixels that moved more than motion_threshold
+
+Records are appended to motion_dir/<cam>/<YYYYMMDD>.motion as fixed 16-byte
+rows (float64 time, float32 score, float32 changed), so a time-range query is
+a binary search over a memory-mapped array.
+
+Usage:
+    python3 motion_index.py query cam1 --start 2024-05-01T18:00:00+07:00 --end 2024-05-01T23:00:00+07:00
+    python3 motion_index.py benchmark cam1 --seconds 60
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # motion analysis is optional on the Pi
+    np = None
+
+from stream_config import live_hls_dir, load_stream_config
+
+# Configuration
+MOTION_NICE = 10  # keep analysis behind the copy-mode streams
+MOTION_FLUSH_INTERVAL = 60  # seconds between index appends (fewer SD writes)
+MOTION_RETRY_DELAY = 5  # seconds before re-reading the live playlist
+MOTION_EVENT_GAP = 10  # seconds of quiet that split two events
+RECORD_DTYPE = [('ts', '<f8'), ('score', '<f4'), ('changed', '<f4')]
+
+logger = logging.getLogger(__name__)
+
+
+def build_analysis_cmd(playlist: Path, width: int, height: int) -> List[str]:
+    """FFmpeg command producing raw grayscale keyframes on stdout."""
+    return [
+        'ffmpeg',
+        '-hide_banner',
+        '-loglevel', 'error',
+        '-skip_frame', 'nokey',  # decode keyframes only (~1 per GOP)
+        '-live_start_index', '-1',  # start at the newest segment
+        '-i', str(playlist),
+        '-an',
+        '-vf', f'scale={width}:{height}:flags=fast_bilinear,format=gray',
+        '-vsync', 'passthrough',
+        '-f', 'rawvideo',
+        'pipe:1',
+    ]
+
+
+def day_file(motion_dir: Path, cam_name: str, ts: float) -> Path:
+    return motion_dir / cam_name / f"{datetime.fromtimestamp(ts).strftime('%Y%m%d')}.motion"
+
+
+class MotionAnalyzer:
+    """Computes frame-difference motion scores for one camera."""
+
+    def __init__(self, cam_name: str, config: Dict[str, Any], live_dir: Path):
+        self.cam_name = cam_name
+        self.playlist = live_dir / f"{cam_name}.m3u8"
+        self.motion_dir = Path(config["motion_dir"])
+        self.width = int(config["motion_width"])
+        self.height = int(config["motion_height"])
+        self.threshold = int(config["motion_threshold"])
+        self.min_interval = 1.0 / float(config["motion_fps"])
+        self.max_days = int(config["motion_max_days"])
+        self.process = None
+
+        # Preallocated buffers: two frames and one int16 difference image
+        self.frames = np.zeros((2, self.height, self.width), dtype=np.uint8)
+        self.diff = np.zeros((self.height, self.width), dtype=np.int16)
+        self.current = 0
+        self.has_previous = False
+        self.last_frame_at = 0.0
+        self.pending: List[Tuple[float, float, float]] = []
+        self.frames_scored = 0
+
+    async def run(self):
+        """Analyze the camera until cancelled, restarting FFmpeg as needed."""
+        last_flush = time.monotonic()
+        try:
+            while True:
+                await self._spawn()
+                frame_size = self.width * self.height
+                try:
+                    while True:
+                        data = await self.process.stdout.readexactly(frame_size)
+                        self.score_frame(data, time.time())
+                        if time.monotonic() - last_flush >= MOTION_FLUSH_INTERVAL:
+                            await asyncio.to_thread(self.flush)
+                            last_flush = time.monotonic()
+                except asyncio.IncompleteReadError:
+                    pass
+                await self._terminate()
+                self.has_previous = False
+                await asyncio.sleep(MOTION_RETRY_DELAY)
+        finally:
+            await self._terminate()
+            self.flush()
+
+    async def _spawn(self):
+        while not self.playlist.exists():
+            await asyncio.sleep(MOTION_RETRY_DELAY)
+        self.process = await asyncio.create_subprocess_exec(
+            # nice(1) instead of preexec_fn, which is unsafe in a process with threads (pi_runtime.py)
+            "nice", "-n", str(MOTION_NICE), *build_analysis_cmd(self.playlist, self.width, self.height),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        logger.info(f"🔍 Motion analysis started for {self.cam_name} (PID: {self.process.pid})")
+
+    async def _terminate(self):
+        process = self.process
+        if process is None or process.returncode is not None:
+            return
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+    def score_frame(self, data: bytes, ts: float):
+        """Score one raw grayscale frame against the previous one."""
+        if ts - self.last_frame_at < self.min_interval:
+            return
+        self.last_frame_at = ts
+
+        frame = self.frames[self.current]
+        frame.reshape(-1)[:] = np.frombuffer(data, dtype=np.uint8)
+        if self.has_previous:
+            np.subtract(frame, self.frames[1 - self.current], out=self.diff, dtype=np.int16)
+            np.abs(self.diff, out=self.diff)
+            score = float(self.diff.mean())
+            changed = float(np.count_nonzero(self.diff > self.threshold)) / self.diff.size
+            self.pending.append((ts, score, changed))
+            self.frames_scored += 1
+        self.has_previous = True
+        self.current = 1 - self.current
+
+    def flush(self):
+        """Append pending records to the day files and drop expired days."""
+        if not self.pending:
+            return
+        records = np.array(self.pending, dtype=RECORD_DTYPE)
+        self.pending = []
+
+        days = np.array([day_file(self.motion_dir, self.cam_name, ts).name for ts in records['ts']])
+        for name in np.unique(days):
+            path = self.motion_dir / self.cam_name / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'ab') as f:
+                records[days == name].tofile(f)
+
+        oldest_kept = (datetime.now() - timedelta(days=self.max_days)).strftime('%Y%m%d')
+        for path in (self.motion_dir / self.cam_name).glob('*.motion'):
+            if path.stem < oldest_kept:
+                path.unlink(missing_ok=True)
+
+
+def query_motion(motion_dir: Path, cam_name: str, start: float, end: float):
+    """Return motion records for [start, end) as a NumPy structured array."""
+    chunks = []
+    day = datetime.fromtimestamp(start).date()
+    while day <= datetime.fromtimestamp(end).date():
+        path = motion_dir / cam_name / f"{day.strftime('%Y%m%d')}.motion"
+        if path.exists() and path.stat().st_size:
+            records = np.memmap(path, dtype=RECORD_DTYPE, mode='r')
+            lo, hi = np.searchsorted(records['ts'], [start, end])
+            chunks.append(np.array(records[lo:hi]))
+        day += timedelta(days=1)
+    if not chunks:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.concatenate(chunks)
+
+
+def find_events(records, min_changed: float, gap: float = MOTION_EVENT_GAP) -> List[Dict[str, float]]:
+    """Group active records into events: start, end and peak change fraction."""
+    active = records[records['changed'] >= min_changed]
+    if not len(active):
+        return []
+    # A new event starts wherever the gap to the previous active record is large
+    breaks = np.flatnonzero(np.diff(active['ts']) > gap) + 1
+    events = []
+    for group in np.split(active, breaks):
+        events.append({
+            "start": float(group['ts'][0]),
+            "end": float(group['ts'][-1]),
+            "peak_changed": float(group['changed'].max()),
+            "mean_score": float(group['score'].mean()),
+        })
+    return events
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """User + system CPU seconds of a running process (Linux /proc)."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+async def benchmark(cam_name: str, config: Dict[str, Any], seconds: float):
+    """Run one analyzer and report its CPU use (FFmpeg + NumPy scoring)."""
+    analyzer = MotionAnalyzer(cam_name, config, live_hls_dir(config))
+    task = asyncio.create_task(analyzer.run())
+    while analyzer.process is None:
+        await asyncio.sleep(0.1)
+
+    wall_start = time.monotonic()
+    python_start = time.process_time()
+    ffmpeg_start = process_cpu_seconds(analyzer.process.pid)
+    await asyncio.sleep(seconds)
+    ffmpeg_cpu = process_cpu_seconds(analyzer.process.pid) - ffmpeg_start
+    python_cpu = time.process_time() - python_start
+    wall = time.monotonic() - wall_start
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    print(f"Camera: {cam_name}  frames scored: {analyzer.frames_scored} in {wall:.1f}s")
+    print(f"FFmpeg decode CPU: {ffmpeg_cpu:.2f}s ({100 * ffmpeg_cpu / wall:.1f}% of one core)")
+    print(f"Python scoring CPU: {python_cpu:.2f}s ({100 * python_cpu / wall:.1f}% of one core)")
+    print(f"Total per camera: {100 * (ffmpeg_cpu + python_cpu) / wall:.1f}% of one core")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if np is None:
+        raise SystemExit("NumPy is required: sudo apt install python3-numpy")
+
+    parser = argparse.ArgumentParser(description="Query or benchmark the motion index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    query_parser = subparsers.add_parser("query", help="list motion events in a time range")
+    query_parser.add_argument("cam")
+    query_parser.add_argument("--start", required=True, help="ISO-8601 time")
+    query_parser.add_argument("--end", required=True, help="ISO-8601 time")
+    query_parser.add_argument("--min-changed", type=float, default=0.02,
+                              help="fraction of pixels that must change (default 0.02)")
+    bench_parser = subparsers.add_parser("benchmark", help="measure CPU use for one camera")
+    bench_parser.add_argument("cam")
+    bench_parser.add_argument("--seconds", type=float, default=60)
+    args = parser.parse_args()
+
+    config = load_stream_config()
+    if args.command == "benchmark":
+        asyncio.run(benchmark(args.cam, config, args.seconds))
+        return
+
+    start = datetime.fromisoformat(args.start).timestamp()
+    end = datetime.fromisoformat(args.end).timestamp()
+    records = query_motion(Path(config["motion_dir"]), args.cam, start, end)
+    for event in find_events(records, args.min_changed):
+        print(f"{datetime.fromtimestamp(event['start']).isoformat(timespec='seconds')} - "
+              f"{datetime.fromtimestamp(event['end']).isoformat(timespec='seconds')}  "
+              f"peak {event['peak_changed']:.1%}  score {event['mean_score']:.1f}")
+    print(f"{len(records)} samples scanned")
+
+
+if __name__ == "__main__":
+    main()
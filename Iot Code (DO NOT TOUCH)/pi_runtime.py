@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Pi Runtime
+Runs the device manager, HLS launcher and HLS uploader in one process.
+
+The three services normally run as separate systemd units, each with its own
+Python interpreter, config loading, logging and polling loops. pi_runtime.py
+is an optional replacement (pi-runtime.service) that hosts them together:
+
+- HLS launcher: the camera supervisors run as asyncio tasks, unchanged.
+- Uploader: an asyncio task fed in memory with the segments FFmpeg just
+  finished (read from each camera's live playlist when it changes). New
+  segments go out on the uploader's per-camera lanes, before the playlists
+  that reference them, over one shared SSH connection (ControlMaster),
+  skipping anything the uploader's manifest says the VPS already has. Every FULL_SYNC_INTERVAL a full scan
+  catches up on missed files and a delete-only rsync cleans up the VPS.
+  Every push is recorded in UploadMetrics (status file, optional /metrics).
+- Device manager: runs in a background thread (it is blocking code) on the
+  shared config cache and the module's pooled Firebase session, and reads
+  the supervisors' health and the uploader's progress directly to publish
+  streams_online/streams_total and camera_feeds/<cam>/status.
+
+Each component is supervised: if the device manager returns or an asyncio
+task dies with an exception, it is logged and restarted with exponential
+backoff (reset once the component has stayed up for RESTART_STABLE seconds).
+
+camera_config.json and vps_config.json are parsed once into a shared
+DeviceStateCache and re-read only when they change.
+
+Usage:
+    python3 pi_runtime.py
+    python3 pi_runtime.py benchmark --seconds 60
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import ffmpeg_hls_launcher as launcher
+import hls_uploader as uploader
+import instrumentation
+import raspi_device_manager as manager
+from device_state import DeviceStateCache
+from stream_config import snapshot_name
+from upload_metrics import UploadMetrics, start_metrics_server
+
+# Configuration
+LOG_FILE = Path(__file__).parent / "pi_runtime.log"
+SEGMENT_POLL_INTERVAL = 0.5  # seconds between live playlist checks
+UPLOAD_BACKOFF_MAX = 60  # upper bound for the retry delay after a failed upload
+RESTART_DELAY = 2  # first delay before restarting a failed component
+RESTART_BACKOFF_MAX = 300  # upper bound for the restart delay
+RESTART_STABLE = 600  # seconds of uptime after which the restart delay is reset
+MANAGER_STOP_TIMEOUT = 5  # seconds to wait for the device manager thread on shutdown
+BENCHMARK_WARMUP = 20  # seconds before measuring, so startup work is not counted
+STANDALONE_SCRIPTS = ["raspi_device_manager.py", "ffmpeg_hls_launcher.py", "hls_uploader.py"]
+
+logger = logging.getLogger("pi_runtime")
+
+
+def playlist_segments(playlist: Path) -> List[str]:
+    """Segment file names listed in a live playlist."""
+    try:
+        lines = playlist.read_text().splitlines()
+    except OSError:
+        return []
+    return [line.strip() for line in lines if line.strip() and not line.startswith('#')]
+
+
+async def track_segments(supervisors: Dict[str, "launcher.CameraSupervisor"], queue: asyncio.Queue):
+    """Queue newly finished segments (plus the playlist and snapshot) whenever a live playlist changes."""
+    seen: Dict[str, set] = {}
+    mtimes: Dict[str, int] = {}
+    while True:
+        await asyncio.sleep(SEGMENT_POLL_INTERVAL)
+        for cam_name in list(supervisors):
+            playlist = launcher.HLS_OUTPUT_DIR / f"{cam_name}.m3u8"
+            try:
+                mtime = playlist.stat().st_mtime_ns
+            except OSError:
+                continue
+            if mtimes.get(cam_name) == mtime:
+                continue
+            mtimes[cam_name] = mtime
+
+            names = playlist_segments(playlist)
+            new = [name for name in names if name not in seen.get(cam_name, ())]
+            seen[cam_name] = set(names)
+            snapshot = snapshot_name(cam_name, launcher.STREAM_CONFIG)
+            queue.put_nowait(new + [playlist.name] + ([snapshot] if snapshot else []))
+
+
+async def run_uploader(state: DeviceStateCache, segments: asyncio.Queue, metrics: UploadMetrics):
+    """Upload segments as FFmpeg finishes them, with a periodic full sync."""
+    config = state.config("vps_config")
+    if not config or not (config.get("vps_host") or config.get("local_target_dir")):
+        logger.warning("No VPS configured (vps_config.json), uploader disabled")
+        return
+
+    upload_interval = config.get('upload_interval', 2)
+    if config.get('metrics_port'):
+        start_metrics_server(metrics, config['metrics_port'], launcher.STREAM_CONFIG['metrics_host'])
+    failures = 0
+    while not await asyncio.to_thread(uploader.test_vps_connection, config):
+        failures += 1
+        await asyncio.sleep(min(upload_interval * (2 ** failures), UPLOAD_BACKOFF_MAX))
+    manifest = uploader.UploadManifest()
+    await asyncio.to_thread(manifest.reconcile, config)
+    metrics.watch_local(uploader.segment_times, manifest.confirmed)
+    lanes = uploader.UploadLanes(config, manifest, metrics)
+    try:
+        await _upload_loop(state, segments, metrics, manifest, lanes, upload_interval)
+    finally:
+        lanes.stop()  # a restarted uploader starts its own lane workers
+
+
+async def _upload_loop(state: DeviceStateCache, segments: asyncio.Queue, metrics: UploadMetrics,
+                       manifest: "uploader.UploadManifest", lanes: "uploader.UploadLanes", upload_interval: float):
+    failures = 0
+    last_full_sync = 0.0
+    while True:
+        batch = await segments.get()
+        while not segments.empty():
+            batch.extend(segments.get_nowait())
+        config = lanes.config = state.config("vps_config")
+
+        full_sync = time.monotonic() - last_full_sync >= uploader.FULL_SYNC_INTERVAL
+        lanes.submit(await asyncio.to_thread(manifest.changed, None if full_sync else batch))
+        success = lanes.healthy()
+
+        if success and full_sync:
+            success, _ = await asyncio.to_thread(uploader.run_rsync, config)
+            last_full_sync = time.monotonic()
+        await asyncio.to_thread(metrics.export)
+
+        if success:
+            failures = 0
+            continue
+        failures += 1
+        last_full_sync = 0.0  # resend whatever was missed with the next full sync
+        delay = min(upload_interval * (2 ** failures), UPLOAD_BACKOFF_MAX)
+        logger.warning(f"Upload failed (attempt #{failures}). Retrying in {delay} seconds...")
+        await asyncio.sleep(delay)
+
+
+class Backoff:
+    """Restart delay that doubles per failure and resets after a stable run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+
+    def next_delay(self, uptime: float) -> float:
+        if uptime >= RESTART_STABLE:
+            self.failures = 0
+        self.failures += 1
+        delay = min(RESTART_DELAY * (2 ** (self.failures - 1)), RESTART_BACKOFF_MAX)
+        logger.warning(f"🔁 Restarting {self.name} in {delay:.0f}s (restart #{self.failures})")
+        return delay
+
+
+async def supervise(name: str, component, stop_event: asyncio.Event):
+    """Run component() until shutdown, restarting it with backoff when it raises."""
+    backoff = Backoff(name)
+    while not stop_event.is_set():
+        started = time.monotonic()
+        try:
+            await component()
+            return  # finished on purpose (e.g. uploader disabled)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ {name} crashed: {e}", exc_info=True)
+        try:
+            await asyncio.wait_for(stop_event.wait(), backoff.next_delay(time.monotonic() - started))
+        except asyncio.TimeoutError:
+            pass
+
+
+def supervise_manager(stop: threading.Event, **kwargs):
+    """Device manager thread: main() returns on errors, so run it again until shutdown."""
+    backoff = Backoff("device manager")
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            manager.main(stop_event=stop, **kwargs)
+        except Exception as e:
+            logger.error(f"❌ device manager crashed: {e}", exc_info=True)
+        if stop.is_set():
+            return
+        stop.wait(backoff.next_delay(time.monotonic() - started))
+
+
+async def run_runtime():
+    """Run all three services until a shutdown signal."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    state = DeviceStateCache(manager.STATE_FILE, {
+        "camera_config": (manager.CONFIG_FILE, manager.load_camera_config),
+        "vps_config": (manager.VPS_CONFIG_FILE, manager.load_vps_config),
+    })
+    camera_config = state.config("camera_config")
+    if not camera_config:
+        logger.error("No camera configuration found. Exiting.")
+        return
+
+    supervisors, background = await launcher.start_streams(camera_config)
+    segments: asyncio.Queue = asyncio.Queue()
+    upload_metrics = UploadMetrics()
+    tasks = [
+        asyncio.create_task(supervise("segment tracker", lambda: track_segments(supervisors, segments), stop_event)),
+        asyncio.create_task(supervise("uploader", lambda: run_uploader(state, segments, upload_metrics), stop_event)),
+    ]
+
+    manager_stop = threading.Event()
+    manager_thread = threading.Thread(
+        target=supervise_manager,
+        args=(manager_stop,),
+        kwargs={
+            "state": state,
+            "stream_metrics": lambda: {name: s.metrics() for name, s in list(supervisors.items())},
+            "upload_status": upload_metrics.uploaded_snapshot,
+        },
+        name="device-manager",
+        daemon=True,  # may be blocked waiting for a claim; must not hold up exit
+    )
+    manager_thread.start()
+
+    await stop_event.wait()
+    logger.info("Received shutdown signal.")
+    manager_stop.set()
+    for task in tasks:
+        task.cancel()
+    await launcher.stop_streams(supervisors, background)
+    await asyncio.to_thread(manager_thread.join, MANAGER_STOP_TIMEOUT)
+
+
+def _process_table() -> Dict[int, Tuple[int, str, float]]:
+    """pid -> (ppid, command name, CPU seconds incl. reaped children) from /proc."""
+    table = {}
+    ticks = os.sysconf('SC_CLK_TCK')
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                head, _, rest = f.read().rpartition(')')
+        except OSError:
+            continue
+        fields = rest.split()
+        cpu = sum(int(value) for value in fields[11:15]) / ticks  # utime stime cutime cstime
+        table[int(entry)] = (int(fields[1]), head.partition('(')[2], cpu)
+    return table
+
+
+def _tree(root: int, table: Dict[int, Tuple[int, str, float]]) -> List[int]:
+    """root and its descendants, excluding FFmpeg (identical in both layouts)."""
+    pids = [root]
+    for pid in pids:
+        pids.extend(child for child, (ppid, _, _) in table.items() if ppid == pid)
+    return [pid for pid in pids if table.get(pid, (0, '', 0))[1] != 'ffmpeg']
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def measure_layout(name: str, commands: List[List[str]], seconds: float, warmup: float):
+    """Start a layout, let it settle, then sample RSS and CPU of its Python processes."""
+    here = Path(__file__).parent
+    processes = [subprocess.Popen(cmd, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for cmd in commands]
+    try:
+        time.sleep(warmup)
+        roots = [p.pid for p in processes]
+        cpu_of = lambda table: sum(table[pid][2] for root in roots for pid in _tree(root, table) if pid in table)
+        start_table = _process_table()
+        start_cpu, start = cpu_of(start_table), time.monotonic()
+
+        rss_samples = []
+        while time.monotonic() - start < seconds:
+            table = _process_table()
+            rss_samples.append(sum(_rss_kb(pid) for root in roots for pid in _tree(root, table)))
+            time.sleep(1)
+        cpu = cpu_of(_process_table()) - start_cpu
+        wall = time.monotonic() - start
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print(f"{name:18s} processes {len(processes)}  RSS avg {sum(rss_samples) / len(rss_samples) / 1024:.1f} MB "
+          f"(peak {max(rss_samples) / 1024:.1f} MB)  idle CPU {100 * cpu / wall:.2f}% of one core")
+
+
+def benchmark(seconds: float, warmup: float):
+    """Compare the three-process layout with pi_runtime.py (stop the systemd units first)."""
+    print(f"Measuring {seconds:.0f}s per layout after {warmup:.0f}s warm-up (FFmpeg excluded)...")
+    measure_layout("three processes", [[sys.executable, script] for script in STANDALONE_SCRIPTS],
+                   seconds, warmup)
+    measure_layout("pi_runtime", [[sys.executable, __file__]], seconds, warmup)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Pi services in one process.")
+    subparsers = parser.add_subparsers(dest="command")
+    bench_parser = subparsers.add_parser("benchmark", help="compare RSS/CPU with the three-process layout")
+    bench_parser.add_argument("--seconds", type=float, default=60)
+    bench_parser.add_argument("--warmup", type=float, default=BENCHMARK_WARMUP)
+    args = parser.parse_args()
+
+    # One log for everything (replaces the handlers the service modules set up on import)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(LOG_FILE),
+            logging.StreamHandler()
+        ],
+        force=True
+    )
+
+    if args.command == "benchmark":
+        benchmark(args.seconds, args.warmup)
+        return
+
+    instrumentation.setup("pi_runtime")
+    logger.info("=" * 60)
+    logger.info("Pi Runtime Starting (device manager + HLS launcher + uploader)...")
+    logger.info("=" * 60)
+    asyncio.run(run_runtime())
+
+
+if __name__ == "__main__":
+    main()
@@ -5,26 +5,49 @@ Manages device registration, claim verification, and camera feed publishing to F
 
 Architecture:
 - Device ID: pi_<12 hex chars from MAC>
-- Checks claim status in /device_registry/<deviceId>/
-- Publishes camera feeds to /users/<uid>/devices/<deviceId>/camera_feeds/
+- Checks claim status in /device_registry/<deviceId>/ (RTDB event stream, or polling)
+- Publishes camera feeds to /users/<uid>/devices/<deviceId>/camera_feeds/<cam>/url
+  and live stream health to camera_feeds/<cam>/status (see stream_status.py)
 - Updates device_info in /users/<uid>/devices/<deviceId>/device_info/
+- Both are sent as one multi-location PATCH at /users/<uid>/devices/<deviceId>/,
+  journaled locally while offline (see firebase_batch.py)
 """
 
 import json
 import logging
+import threading
 import time
 import subprocess
 import socket
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, List, Tuple, Union
+
+from device_state import DeviceStateCache
+import instrumentation
+from firebase_batch import WriteCoalescer
+from stream_config import load_stream_config, snapshot_name
+from stream_status import (STATUS_SAMPLE_INTERVAL, MetricsSource, StreamStatusTracker,
+                           UploadSource, load_samples)
 
 # Configuration
 FIREBASE_DB_URL = "https://testing-151e6-default-rtdb.asia-southeast1.firebasedatabase.app"
 CONFIG_FILE = Path(__file__).parent / "camera_config.json"
+VPS_CONFIG_FILE = Path(__file__).parent / "vps_config.json"
+STATE_FILE = Path(__file__).parent / "device_state.json"  # cached claim/registry state
 LOG_FILE = Path(__file__).parent / "raspi_device_manager.log"
-CHECK_INTERVAL = 5  # seconds between claim status checks
+JOURNAL_DIR = Path(__file__).parent / "firebase_journal"  # writes pending while offline, one file per root
+CHECK_INTERVAL = 5  # seconds between claim status checks (poll mode)
 UPDATE_INTERVAL = 30  # seconds between device_info updates
+REGISTRY_MODE = "stream"  # "stream": RTDB event stream, "poll": GET every CHECK_INTERVAL
+STREAM_READ_TIMEOUT = 90  # Firebase sends keep-alive every ~30s; reconnect if silent longer
+STREAM_BACKOFF_MIN = 1  # seconds before the first reconnect
+STREAM_BACKOFF_MAX = 60  # upper bound for the reconnect delay
+HTTP_RETRIES = 3  # retries per request on connection errors and 5xx
+SERVER_TIMESTAMP = {".sv": "timestamp"}  # filled in by Firebase on write
+STREAM_CONFIG = load_stream_config()  # snapshot settings shared with the launcher
 
 # Setup logging
 logging.basicConfig(
@@ -71,11 +94,13 @@ def get_mac_address() -> str:
         raise
 
 
-def get_device_id() -> str:
+def get_device_id(mac: Optional[str] = None) -> str:
     """
     Generate device ID in format: pi_<12 hex characters>
+    mac overrides the detected address (used by fleet_sim.py).
     """
-    mac = get_mac_address()
+    if mac is None:
+        mac = get_mac_address()
     if len(mac) != 12:
         logger.warning(f"MAC address length unexpected: {len(mac)}, expected 12")
     device_id = f"pi_{mac[:12]}"
@@ -111,92 +136,325 @@ def get_local_ip() -> str:
             return "0.0.0.0"
 
 
-def firebase_get(path: str) -> Optional[Dict[str, Any]]:
+# Database secret / ID token, or a function returning a currently valid one (called per request)
+Auth = Union[str, Callable[[], Optional[str]], None]
+
+
+def auth_params(auth: Auth) -> Dict[str, str]:
+    token = auth() if callable(auth) else auth
+    return {'auth': token} if token else {}
+
+
+class FirebaseClient:
     """
-    GET request to Firebase RTDB.
-    Path should NOT include leading slash or .json
-    Returns parsed JSON or None if 404
+    Firebase RTDB REST client over one pooled keep-alive session.
+    Paths should NOT include leading slash or .json
+
+    update() remembers what was last written to each path and PATCHes only
+    the fields that changed, so a heartbeat is a few dozen bytes instead of
+    the whole object, and an unchanged object is not sent at all.
     """
-    url = f"{FIREBASE_DB_URL}/{path}.json"
-    
-    try:
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 404:
-            logger.debug(f"Firebase GET {path}: Not found (404)")
+
+    def __init__(self, db_url: str, auth: Auth = None):
+        self.db_url = db_url.rstrip('/')
+        self.auth = auth  # sent with every request
+        self.session = requests.Session()
+        retry = Retry(
+            total=HTTP_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({'GET', 'PUT', 'PATCH'})
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        self._written: Dict[str, Dict[str, Any]] = {}
+
+    def _url(self, path: str) -> str:
+        return f"{self.db_url}/{path}.json"
+
+    @instrumentation.traced("firebase.get")
+    def get(self, path: str, params: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        GET request to Firebase RTDB (params e.g. {'shallow': 'true'}).
+        Returns parsed JSON or None if 404
+        """
+        try:
+            response = self.session.get(self._url(path), params={**auth_params(self.auth), **(params or {})},
+                                        timeout=10)
+
+            if response.status_code == 404:
+                logger.debug(f"Firebase GET {path}: Not found (404)")
+                return None
+
+            if response.status_code == 200:
+                data = response.json()
+                logger.debug(f"Firebase GET {path}: Success")
+                return data
+
+            logger.warning(f"Firebase GET {path}: Unexpected status {response.status_code}")
             return None
-        
-        if response.status_code == 200:
-            data = response.json()
-            logger.debug(f"Firebase GET {path}: Success")
-            return data
-        
-        logger.warning(f"Firebase GET {path}: Unexpected status {response.status_code}")
-        return None
-        
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Firebase GET {path}: Request failed - {e}")
-        return None
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Firebase GET {path}: Request failed - {e}")
+            return None
+
+    def put(self, path: str, data: Dict[str, Any]) -> bool:
+        """
+        PUT request to Firebase RTDB (replaces the node).
+        Returns True if successful, False otherwise
+        """
+        if self._write('PUT', path, data):
+            self._written[path] = dict(data)
+            return True
+        self._written.pop(path, None)
+        return False
+
+    def patch(self, path: str, data: Dict[str, Any]) -> bool:
+        """
+        PATCH request to Firebase RTDB (updates only the given children).
+        Returns True if successful, False otherwise
+        """
+        return self._write('PATCH', path, data)
+
+    def update(self, path: str, data: Dict[str, Any], touch: Optional[Dict[str, Any]] = None,
+               replace: bool = False) -> bool:
+        """
+        Write only the fields of data that differ from the last successful
+        write to path. Fields in touch (e.g. a server-timestamp heartbeat)
+        are sent every time. Skips the request when there is nothing to send.
+        With replace, the first write is a PUT so stale children are removed.
+        """
+        last = self._written.get(path)
+        if last is None and replace and not touch:
+            return self.put(path, data)
+        if last is None:
+            changes = dict(data)
+        else:
+            changes = {key: value for key, value in data.items() if last.get(key) != value}
+            changes.update({key: None for key in last if key not in data})  # null deletes
+        if touch:
+            changes.update(touch)
+
+        if not changes:
+            logger.debug(f"Firebase {path}: unchanged, write skipped")
+            return True
+
+        if self.patch(path, changes):
+            self._written[path] = dict(data)
+            return True
+        self._written.pop(path, None)  # state unknown, send everything next time
+        return False
+
+    @instrumentation.traced("firebase.write")
+    def _write(self, method: str, path: str, data: Dict[str, Any]) -> bool:
+        try:
+            response = self.session.request(
+                method,
+                self._url(path),
+                params={**auth_params(self.auth), 'print': 'silent'},  # 204 with no body: nothing to download
+                json=data,
+                timeout=10
+            )
+
+            if response.status_code in [200, 204]:
+                logger.info(f"Firebase {method} {path}: Success ({', '.join(data)})")
+                return True
+
+            # Detailed error handling
+            error_msg = f"Firebase {method} {path}: Failed with status {response.status_code}"
+
+            if response.status_code == 401:
+                error_msg += " - Authentication required (check Firebase security rules)"
+            elif response.status_code == 403:
+                error_msg += " - Permission denied (check Firebase security rules allow unauthenticated writes)"
+            elif response.status_code == 404:
+                error_msg += " - Path not found (check path structure)"
+            else:
+                error_msg += f" - {response.text}"
+
+            logger.error(error_msg)
+
+            # Try to parse error response
+            try:
+                error_data = response.json()
+                if isinstance(error_data, dict) and 'error' in error_data:
+                    logger.error(f"Firebase error: {error_data['error']}")
+            except:
+                logger.error(f"Response body: {response.text[:200]}")
+
+            return False
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Firebase {method} {path}: Request failed - {e}")
+            return False
+
+
+firebase = FirebaseClient(FIREBASE_DB_URL)
+
+
+def firebase_get(path: str) -> Optional[Dict[str, Any]]:
+    """GET request to Firebase RTDB. Returns parsed JSON or None if 404"""
+    return firebase.get(path)
 
 
 def firebase_put(path: str, data: Dict[str, Any]) -> bool:
+    """PUT request to Firebase RTDB. Returns True if successful, False otherwise"""
+    return firebase.put(path, data)
+
+
+def apply_stream_event(snapshot: Any, path: str, data: Any) -> Any:
     """
-    PUT request to Firebase RTDB.
-    Path should NOT include leading slash or .json
-    Returns True if successful, False otherwise
+    Apply a streaming `put` at `path` to a local copy of the node.
+    `patch` events are applied as one put per child key.
     """
-    url = f"{FIREBASE_DB_URL}/{path}.json"
-    
-    try:
-        response = requests.put(
-            url,
-            json=data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
-        
-        if response.status_code in [200, 204]:
-            logger.info(f"Firebase PUT {path}: Success")
-            return True
-        
-        # Detailed error handling
-        error_msg = f"Firebase PUT {path}: Failed with status {response.status_code}"
-        
-        if response.status_code == 401:
-            error_msg += " - Authentication required (check Firebase security rules)"
-        elif response.status_code == 403:
-            error_msg += " - Permission denied (check Firebase security rules allow unauthenticated writes)"
-        elif response.status_code == 404:
-            error_msg += " - Path not found (check path structure)"
-        else:
-            error_msg += f" - {response.text}"
-        
-        logger.error(error_msg)
-        
-        # Try to parse error response
+    keys = [key for key in path.split('/') if key]
+    if not keys:
+        return data
+
+    if not isinstance(snapshot, dict):
+        snapshot = {}
+    node = snapshot
+    for key in keys[:-1]:
+        child = node.get(key)
+        if not isinstance(child, dict):
+            child = {}
+            node[key] = child
+        node = child
+    if data is None:
+        node.pop(keys[-1], None)
+    else:
+        node[keys[-1]] = data
+    return snapshot
+
+
+def firebase_stream(path: str, on_change: Callable[[Any], None], stop_event: threading.Event,
+                    db_url: str = FIREBASE_DB_URL, auth: Auth = None):
+    """
+    Subscribe to a node with the RTDB REST streaming API (text/event-stream).
+    Keeps a local copy of the node and calls on_change(snapshot) after every
+    put/patch. Reconnects with exponential backoff until stop_event is set.
+    """
+    url = f"{db_url.rstrip('/')}/{path}.json"
+    backoff = STREAM_BACKOFF_MIN
+
+    while not stop_event.is_set():
+        snapshot = None
         try:
-            error_data = response.json()
-            if isinstance(error_data, dict) and 'error' in error_data:
-                logger.error(f"Firebase error: {error_data['error']}")
-        except:
-            logger.error(f"Response body: {response.text[:200]}")
-        
-        return False
-        
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Firebase PUT {path}: Request failed - {e}")
-        return False
+            with requests.get(
+                url,
+                headers={'Accept': 'text/event-stream'},
+                params=auth_params(auth) or None,  # fresh token on every reconnect
+                stream=True,
+                timeout=(10, STREAM_READ_TIMEOUT)
+            ) as response:
+                if response.status_code != 200:
+                    raise requests.exceptions.RequestException(
+                        f"unexpected status {response.status_code}")
+                logger.info(f"📡 Firebase stream connected: {path}")
+
+                event = None
+                # chunk_size=None yields data as each chunk arrives instead of waiting to fill a buffer
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if stop_event.is_set():
+                        return
+                    if line.startswith('event:'):
+                        event = line[len('event:'):].strip()
+                    elif line.startswith('data:') and event in ('put', 'patch'):
+                        payload = json.loads(line[len('data:'):])
+                        base = payload.get('path', '/')
+                        if event == 'put':
+                            snapshot = apply_stream_event(snapshot, base, payload.get('data'))
+                        else:
+                            for key, value in (payload.get('data') or {}).items():
+                                snapshot = apply_stream_event(snapshot, f"{base.rstrip('/')}/{key}", value)
+                        backoff = STREAM_BACKOFF_MIN
+                        on_change(snapshot)
+                    elif line.startswith('data:') and event in ('cancel', 'auth_revoked'):
+                        logger.warning(f"Firebase stream {path}: {event} {line[len('data:'):].strip()}")
+                        break
+            logger.info(f"Firebase stream {path} closed. Reconnecting in {backoff}s...")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Firebase stream {path}: {e}. Reconnecting in {backoff}s...")
+        stop_event.wait(backoff)
+        backoff = min(backoff * 2, STREAM_BACKOFF_MAX)
+
+
+class RegistryListener:
+    """
+    Mirrors /device_registry/<deviceId> from a background streaming connection,
+    so claim and name/zone changes arrive immediately without polling.
+    """
+
+    def __init__(self, device_id: str, db_url: str = FIREBASE_DB_URL):
+        self.path = f"device_registry/{device_id}"
+        self.data: Optional[Dict[str, Any]] = None
+        self.synced = False  # True once the first event has arrived
+        self._version = 0
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=firebase_stream,
+            args=(self.path, self._on_change, self._stop_event, db_url),
+            name="registry-stream",
+            daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
 
+    def stop(self):
+        self._stop_event.set()
 
-def wait_until_claimed(device_id: str) -> Optional[str]:
+    def _on_change(self, snapshot: Any):
+        with self._condition:
+            self.data = snapshot if isinstance(snapshot, dict) else None
+            self.synced = True
+            self._version += 1
+            self._condition.notify_all()
+
+    def snapshot(self) -> Tuple[Optional[Dict[str, Any]], bool, int]:
+        """(data, synced, version), read together."""
+        with self._condition:
+            return self.data, self.synced, self._version
+
+    def wait_changed(self, version: int, timeout: float) -> bool:
+        """
+        Wait up to timeout seconds for a change after version (from snapshot()).
+        Returns at once if one already happened, so none is missed between
+        reading the data and waiting.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._version != version, timeout)
+
+    def wait_for(self, predicate: Callable[[Optional[Dict[str, Any]]], bool]) -> Dict[str, Any]:
+        """Block until predicate(data) is true and return the data."""
+        with self._condition:
+            self._condition.wait_for(lambda: predicate(self.data))
+            return self.data
+
+
+def is_claimed(device_data: Optional[Dict[str, Any]]) -> bool:
+    return bool(device_data and device_data.get("claimed") and device_data.get("owner_uid"))
+
+
+def wait_until_claimed(device_id: str, listener: Optional[RegistryListener] = None) -> Optional[str]:
     """
-    Poll Firebase until device is claimed.
+    Wait until device is claimed, via the registry stream if a listener is
+    given, otherwise by polling Firebase.
     Returns owner_uid if claimed, None if error/timeout.
     """
     logger.info(f"Waiting for device {device_id} to be claimed...")
     logger.info(f"To claim this device, go to Settings → Device Management in the dashboard")
     logger.info(f"Enter device ID: {device_id}")
-    
+
+    if listener is not None:
+        device_data = listener.wait_for(is_claimed)
+        owner_uid = device_data["owner_uid"]
+        logger.info(f"✅ Device claimed! Owner UID: {owner_uid}")
+        return owner_uid
+
     attempt = 0
     while True:
         attempt += 1
@@ -206,7 +464,7 @@ def wait_until_claimed(device_id: str) -> Optional[str]:
         
         if device_data is None:
             logger.info("Device not found in registry. Waiting for claim...")
-        elif device_data.get("claimed") and device_data.get("owner_uid"):
+        elif is_claimed(device_data):
             owner_uid = device_data["owner_uid"]
             logger.info(f"✅ Device claimed! Owner UID: {owner_uid}")
             return owner_uid
@@ -245,12 +503,11 @@ def load_camera_config() -> Dict[str, str]:
 
 def load_vps_config() -> Optional[Dict[str, Any]]:
     """Load VPS configuration if available."""
-    vps_config_file = Path(__file__).parent / "vps_config.json"
-    if not vps_config_file.exists():
+    if not VPS_CONFIG_FILE.exists():
         return None
     
     try:
-        with open(vps_config_file, 'r') as f:
+        with open(VPS_CONFIG_FILE, 'r') as f:
             config = json.load(f)
         logger.info(f"Loaded VPS config: {config.get('vps_public_url', 'Not configured')}")
         return config
@@ -259,15 +516,18 @@ def load_vps_config() -> Optional[Dict[str, Any]]:
         return None
 
 
-def generate_hls_urls(local_ip: str, camera_config: Dict[str, str]) -> Dict[str, str]:
+def generate_hls_urls(local_ip: str, camera_config: Dict[str, str],
+                      vps_config: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
     """
     Generate HLS URLs for each camera.
     Uses VPS public URL if configured, otherwise falls back to local IP.
+    Pass the cached vps_config to avoid re-reading the file.
     """
     hls_urls = {}
     
     # Check if VPS is configured
-    vps_config = load_vps_config()
+    if vps_config is None:
+        vps_config = load_vps_config()
     if vps_config and vps_config.get('vps_public_url'):
         # Use VPS public URL
         base_url = vps_config['vps_public_url'].rstrip('/')
@@ -284,23 +544,31 @@ def generate_hls_urls(local_ip: str, camera_config: Dict[str, str]) -> Dict[str,
     return hls_urls
 
 
-def update_device_info(device_id: str, owner_uid: str, device_name: str, zone: str, local_ip: str) -> bool:
+def update_device_info(device_id: str, owner_uid: str, device_name: str, zone: str, local_ip: str,
+                       writer: Optional[WriteCoalescer] = None,
+                       vps_config: Optional[Dict[str, Any]] = None,
+                       stream_metrics: Optional[Dict[str, Dict[str, Any]]] = None) -> bool:
     """
     Update device_info in Firebase.
     Path: /users/<owner_uid>/devices/<device_id>/device_info/
     Uses VPS hostname if configured, otherwise uses local IP.
+    With a writer the changes are queued for the next batched PATCH.
+    Pass the cached vps_config to avoid re-reading the file.
+    stream_metrics (per-camera launcher metrics, pi_runtime.py) adds
+    streams_online / streams_total.
     """
     # Check if VPS is configured
-    vps_config = load_vps_config()
+    if vps_config is None:
+        vps_config = load_vps_config()
     if vps_config and vps_config.get('vps_public_url'):
         # Extract hostname from VPS URL (remove http:// or https://)
         vps_url = vps_config['vps_public_url']
         ip_address = vps_url.replace('http://', '').replace('https://', '').split('/')[0]
-        logger.info(f"Using VPS hostname for ip_address: {ip_address}")
+        logger.debug(f"Using VPS hostname for ip_address: {ip_address}")
     else:
         # Fallback to local IP
         ip_address = local_ip
-        logger.info(f"Using local IP for ip_address: {ip_address}")
+        logger.debug(f"Using local IP for ip_address: {ip_address}")
     
     device_info = {
         "device_id": device_id,
@@ -309,27 +577,88 @@ def update_device_info(device_id: str, owner_uid: str, device_name: str, zone: s
         "zone": zone,
         "ip_address": ip_address,
         "firmware_version": "1.0.0",
-        "last_online": int(time.time() * 1000)  # milliseconds timestamp
     }
+    if stream_metrics is not None:
+        device_info["streams_total"] = len(stream_metrics)
+        device_info["streams_online"] = sum(1 for m in stream_metrics.values() if m.get("running"))
     
+    # Only changed fields are sent; last_online (ms) is stamped by Firebase on every call
+    if writer is not None:
+        writer.update("device_info", device_info, touch={"last_online": SERVER_TIMESTAMP})
+        return True
     path = f"users/{owner_uid}/devices/{device_id}/device_info"
-    return firebase_put(path, device_info)
+    return firebase.update(path, device_info, touch={"last_online": SERVER_TIMESTAMP})
 
 
-def publish_camera_feeds(device_id: str, owner_uid: str, hls_urls: Dict[str, str]) -> bool:
+def publish_camera_feeds(device_id: str, owner_uid: str, hls_urls: Dict[str, str],
+                         writer: Optional[WriteCoalescer] = None) -> bool:
     """
     Publish camera feed URLs to Firebase.
-    Path: /users/<owner_uid>/devices/<device_id>/camera_feeds/
+    Path: /users/<owner_uid>/devices/<device_id>/camera_feeds/<cam>/url
+    With snapshots enabled also camera_feeds/<cam>/snapshot/url, the thumbnail
+    next to the playlist (status and snapshot/updated_at: see publish_stream_status)
+    With a writer the changes are queued for the next batched PATCH.
     """
+    feeds = {}
+    for cam_name, url in hls_urls.items():
+        feeds[cam_name] = {"url": url}
+        snapshot = snapshot_name(cam_name, STREAM_CONFIG)
+        if snapshot:
+            feeds[cam_name]["snapshot"] = {"url": f"{url.rsplit('/', 1)[0]}/{snapshot}"}
+    if writer is not None:
+        writer.update("camera_feeds", feeds, replace=True)
+        return True
     path = f"users/{owner_uid}/devices/{device_id}/camera_feeds"
-    return firebase_put(path, hls_urls)
+    return firebase.update(path, feeds, replace=True)
 
 
-def get_device_info_from_registry(device_id: str) -> Optional[Dict[str, Any]]:
+def publish_stream_status(get_writer: Callable[[], Optional[WriteCoalescer]],
+                          get_cameras: Callable[[], List[str]],
+                          stop_event: threading.Event,
+                          stream_metrics: MetricsSource = None,
+                          upload_status: UploadSource = None):
+    """
+    Sample stream health every STATUS_SAMPLE_INTERVAL seconds and queue
+    camera_feeds/<cam>/status (and snapshot/updated_at) writes when the tracker says so.
+    Runs in its own thread; pauses while there is no writer (unclaimed).
+    """
+    tracker = StreamStatusTracker()
+    writer = None
+    while not stop_event.wait(STATUS_SAMPLE_INTERVAL):
+        current = get_writer()
+        if current is not writer:
+            tracker.reset()  # new owner/root: publish everything again
+            writer = current
+        if writer is None:
+            continue
+
+        now = time.time()
+        cameras = get_cameras()
+        for cam_name in set(tracker.cameras()) - set(cameras):
+            tracker.forget(cam_name)
+        try:
+            samples = load_samples(cameras, now, stream_metrics, upload_status)
+        except Exception as e:
+            logger.warning(f"Could not read stream status: {e}")
+            continue
+        for cam_name, sample in samples.items():
+            status = tracker.update(cam_name, sample, now)
+            if status is not None:
+                writer.update(f"camera_feeds/{cam_name}/status", status)
+            snapshot_at = tracker.snapshot(cam_name, sample, now)
+            if snapshot_at is not None:
+                writer.set(f"camera_feeds/{cam_name}/snapshot/updated_at", snapshot_at)
+
+
+def get_device_info_from_registry(device_id: str, listener: Optional[RegistryListener] = None) -> Optional[Dict[str, Any]]:
     """
     Get device info from device_registry (name, zone, etc.)
+    Uses the streamed copy when a listener is running, so no request is made.
     """
-    device_data = firebase_get(f"device_registry/{device_id}")
+    if listener is not None:
+        device_data = listener.data
+    else:
+        device_data = firebase_get(f"device_registry/{device_id}")
     if device_data:
         return {
             "name": device_data.get("name", "Unknown Camera Server"),
@@ -338,113 +667,210 @@ def get_device_info_from_registry(device_id: str) -> Optional[Dict[str, Any]]:
     return None
 
 
-def main():
+def device_root(owner_uid: str, device_id: str) -> str:
+    return f"users/{owner_uid}/devices/{device_id}"
+
+
+def main(state: Optional[DeviceStateCache] = None,
+         stream_metrics: MetricsSource = None,
+         stop_event: Optional[threading.Event] = None,
+         upload_status: UploadSource = None):
     """
     Main execution loop for Raspberry Pi device manager.
+    pi_runtime.py passes its shared config cache, the launcher's and
+    uploader's in-memory metrics and a stop event; standalone runs use none
+    of them (stream status then comes from the services' /dev/shm files).
     """
     logger.info("=" * 60)
     logger.info("Raspberry Pi Device Manager Starting...")
     logger.info("=" * 60)
     
+    # Cached claim/registry state and configs (parsed once, reloaded when the files change)
+    if state is None:
+        state = DeviceStateCache(STATE_FILE, {
+            "camera_config": (CONFIG_FILE, load_camera_config),
+            "vps_config": (VPS_CONFIG_FILE, load_vps_config),
+        })
+    metrics = stream_metrics or (lambda: None)
+    
     # Generate device ID
     device_id = get_device_id()
     logger.info(f"Device ID: {device_id}")
+    if state.get("device_id") not in (None, device_id):
+        logger.warning("Cached state belongs to another device ID, discarding it")
+        state.clear()
+    state.update(device_id=device_id)
     
     # Get local IP
     local_ip = get_local_ip()
     logger.info(f"Local IP: {local_ip}")
     
     # Load camera configuration
-    camera_config = load_camera_config()
+    camera_config = state.config("camera_config")
     if not camera_config:
         logger.error("No camera configuration found. Exiting.")
         return
     
     logger.info(f"📹 Camera configuration loaded: {len(camera_config)} camera(s) - {list(camera_config.keys())}")
     
-    # Wait until device is claimed
-    owner_uid = wait_until_claimed(device_id)
-    if not owner_uid:
-        logger.error("Failed to get owner UID. Exiting.")
-        return
-    
-    # Get device info from registry
-    device_info = get_device_info_from_registry(device_id)
-    if device_info:
-        device_name = device_info["name"]
-        zone = device_info["zone"]
+    # Subscribe to the registry entry (claim, name, zone) instead of polling it
+    listener = None
+    if REGISTRY_MODE == "stream":
+        listener = RegistryListener(device_id)
+        listener.start()
+
+    # Resume from the cached claim right away; the registry revalidates it in the loop
+    owner_uid = state.get("owner_uid")
+    if owner_uid:
+        logger.info(f"⚡ Using cached claim (owner UID: {owner_uid}), revalidating in background")
     else:
-        logger.warning("Could not get device info from registry, using defaults")
-        device_name = "Raspberry Pi Camera Server"
-        zone = "Unknown Zone"
+        # Wait until device is claimed
+        owner_uid = wait_until_claimed(device_id, listener)
+        if not owner_uid:
+            logger.error("Failed to get owner UID. Exiting.")
+            return
+        state.update(owner_uid=owner_uid)
+    
+    # Get device info from the cache, or from the registry the first time
+    device_name = state.get("name")
+    zone = state.get("zone")
+    if not device_name:
+        device_info = get_device_info_from_registry(device_id, listener)
+        if device_info:
+            device_name = device_info["name"]
+            zone = device_info["zone"]
+            state.update(name=device_name, zone=zone)
+        else:
+            logger.warning("Could not get device info from registry, using defaults")
+            device_name = "Raspberry Pi Camera Server"
+            zone = "Unknown Zone"
     
     # Generate HLS URLs
-    hls_urls = generate_hls_urls(local_ip, camera_config)
+    hls_urls = generate_hls_urls(local_ip, camera_config, state.config("vps_config"))
     logger.info(f"📹 Generated {len(hls_urls)} HLS URL(s): {list(hls_urls.keys())}")
     
     if not hls_urls:
         logger.warning("⚠️  No HLS URLs generated! Check camera_config.json has valid camera entries.")
     
+    # device_info and camera_feeds go out together as one PATCH on the device node
+    writer = WriteCoalescer(firebase, device_root(owner_uid, device_id), JOURNAL_DIR)
+    
     # Initial update: device_info and camera_feeds
     logger.info("=" * 60)
     logger.info("Publishing initial device information...")
     logger.info("=" * 60)
     logger.info(f"📝 Writing to: /users/{owner_uid}/devices/{device_id}/device_info")
-    if update_device_info(device_id, owner_uid, device_name, zone, local_ip):
-        logger.info("✅ Device info updated successfully")
-    else:
-        logger.error("❌ Failed to update device info")
-        logger.error("⚠️  Make sure Firebase security rules allow unauthenticated writes to device_info")
-        logger.error("⚠️  The rule should be: 'device_info': { '.write': true }")
+    update_device_info(device_id, owner_uid, device_name, zone, local_ip, writer,
+                       state.config("vps_config"), metrics())
     
     if hls_urls:
         logger.info(f"📹 Writing to: /users/{owner_uid}/devices/{device_id}/camera_feeds")
         logger.info(f"📹 Publishing {len(hls_urls)} camera feed(s): {list(hls_urls.keys())}")
-        if publish_camera_feeds(device_id, owner_uid, hls_urls):
-            logger.info("✅ Camera feeds published successfully")
-            logger.info(f"📹 Camera feeds available at: {list(hls_urls.values())}")
-        else:
-            logger.error("❌ Failed to publish camera feeds")
-            logger.error("⚠️  Make sure Firebase security rules allow unauthenticated writes to camera_feeds")
+        publish_camera_feeds(device_id, owner_uid, hls_urls, writer)
     else:
         logger.warning("⚠️  Skipping camera feed publishing - no HLS URLs generated")
         logger.warning("⚠️  Check camera_config.json and ensure cameras are configured")
     
+    if writer.flush():
+        logger.info("✅ Device info and camera feeds published successfully")
+        if hls_urls:
+            logger.info(f"📹 Camera feeds available at: {list(hls_urls.values())}")
+    else:
+        logger.error("❌ Failed to publish device info / camera feeds (journaled, will retry)")
+        logger.error("⚠️  Make sure Firebase security rules allow unauthenticated writes to device_info and camera_feeds")
+        logger.error("⚠️  The rule should be: 'device_info': { '.write': true }")
+    
+    # Per-camera stream status, sampled more often than the heartbeat
+    status_stop = threading.Event()
+    threading.Thread(
+        target=publish_stream_status,
+        args=(lambda: writer, lambda: list(camera_config), status_stop, stream_metrics, upload_status),
+        name="stream-status",
+        daemon=True
+    ).start()
+    
     # Continuous update loop
     logger.info("Entering continuous update loop...")
     logger.info(f"Updating device_info every {UPDATE_INTERVAL} seconds")
     
+    seen_version = listener.snapshot()[2] if listener is not None else 0
     try:
-        while True:
-            time.sleep(UPDATE_INTERVAL)
+        while stop_event is None or not stop_event.is_set():
+            # Wake early if the registry stream reports a change (e.g. name/zone edited)
+            if listener is not None:
+                listener.wait_changed(seen_version, UPDATE_INTERVAL)
+            else:
+                time.sleep(UPDATE_INTERVAL)
             
-            # Update device_info (keep last_online current)
-            logger.info("Updating device_info...")
-            if update_device_info(device_id, owner_uid, device_name, zone, local_ip):
-                logger.info("✅ Device info updated (last_online timestamp refreshed)")
+            # Revalidate the (possibly cached) claim against the registry
+            if listener is not None:
+                registry_data, registry_known, seen_version = listener.snapshot()
             else:
-                logger.warning("⚠️ Failed to update device_info")
+                registry_data = firebase_get(f"device_registry/{device_id}")
+                registry_known = registry_data is not None
+            if registry_known and not is_claimed(registry_data):
+                logger.warning("⚠️ Device is no longer claimed. Pausing updates until it is claimed again.")
+                writer.close()
+                writer = None  # also pauses stream status writes
+                state.update(owner_uid=None)
+                owner_uid = wait_until_claimed(device_id, listener)
+                registry_data = listener.data if listener is not None else firebase_get(f"device_registry/{device_id}")
+            elif registry_data and registry_data["owner_uid"] != owner_uid:
+                logger.info(f"👤 Owner changed: {owner_uid} → {registry_data['owner_uid']}")
+                owner_uid = registry_data["owner_uid"]
+            state.update(owner_uid=owner_uid)
+            
+            if writer is None or writer.root != device_root(owner_uid, device_id):
+                # The old writer gets its last attempt before the new one starts
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                # Feeds go in before the status thread sees the new writer
+                new_writer = WriteCoalescer(firebase, device_root(owner_uid, device_id), JOURNAL_DIR)
+                publish_camera_feeds(device_id, owner_uid, hls_urls, new_writer)
+                writer = new_writer
             
             # Re-check device info from registry (in case user updated name/zone)
-            updated_info = get_device_info_from_registry(device_id)
-            if updated_info:
-                device_name = updated_info["name"]
-                zone = updated_info["zone"]
+            if registry_data:
+                device_name = registry_data.get("name", "Unknown Camera Server")
+                zone = registry_data.get("zone", "Unknown Zone")
+                state.update(name=device_name, zone=zone)
+            
+            # Update device_info (keep last_online current)
+            logger.info("Updating device_info...")
+            update_device_info(device_id, owner_uid, device_name, zone, local_ip, writer,
+                               state.config("vps_config"), metrics())
             
-            # Re-publish camera feeds (in case IP changed)
+            # Re-publish camera feeds (in case IP or camera/VPS config changed)
+            changed_configs = state.changed()
+            camera_config = state.config("camera_config")
             current_ip = get_local_ip()
-            if current_ip != local_ip:
-                logger.info(f"IP address changed: {local_ip} → {current_ip}")
+            if current_ip != local_ip or changed_configs:
+                if current_ip != local_ip:
+                    logger.info(f"IP address changed: {local_ip} → {current_ip}")
                 local_ip = current_ip
-                hls_urls = generate_hls_urls(local_ip, camera_config)
-                publish_camera_feeds(device_id, owner_uid, hls_urls)
+                hls_urls = generate_hls_urls(local_ip, camera_config, state.config("vps_config"))
+                publish_camera_feeds(device_id, owner_uid, hls_urls, writer)
+            
+            # One round trip for everything queued above
+            if writer.flush():
+                logger.info("✅ Device info updated (last_online timestamp refreshed)")
+            else:
+                logger.warning("⚠️ Failed to update device_info (journaled, will retry)")
             
     except KeyboardInterrupt:
         logger.info("Received interrupt signal. Shutting down...")
     except Exception as e:
         logger.error(f"Unexpected error in main loop: {e}", exc_info=True)
+    finally:
+        status_stop.set()
+        if writer is not None:
+            writer.close()
+        if listener is not None:
+            listener.stop()
 
 
 if __name__ == "__main__":
+    instrumentation.setup("raspi_device_manager")
     main()
 
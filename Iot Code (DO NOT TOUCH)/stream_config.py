@@ -0,0 +1,85 @@
+"""
+Stream Storage Configuration
+Shared settings for where HLS segments live on the Pi and how the DVR keeps history.
+
+stream_config.json is optional. Without it the launcher and uploader behave as
+before: live segments are written to /var/www/html/hls on the SD card and no
+history is kept.
+
+storage_mode:
+- "disk":  live segments in disk_hls_dir (SD card, served by the Pi's Nginx)
+- "tmpfs": live segments in tmpfs_hls_dir (RAM, no flash wear)
+
+With dvr_enabled the launcher also copies every finished segment into dvr_dir,
+keeping at most dvr_max_hours per camera and dvr_max_gb in total.
+
+With motion_enabled (needs NumPy) each camera also gets a low-priority motion
+analyzer that writes an activity index to motion_dir (see motion_index.py).
+
+With snapshot_enabled FFmpeg also writes a small thumbnail <cam>.<snapshot_format>
+(jpg or webp, snapshot_width wide) next to the live playlist every
+snapshot_interval seconds, from the same RTSP input. The uploader sends it
+like a segment and the device manager publishes it under camera_feeds/<cam>/snapshot.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Configuration
+STREAM_CONFIG_FILE = Path(__file__).parent / "stream_config.json"
+
+DEFAULT_STREAM_CONFIG = {
+    "storage_mode": "disk",
+    "disk_hls_dir": "/var/www/html/hls",
+    "tmpfs_hls_dir": "/dev/shm/hls",
+    "dvr_enabled": False,
+    "dvr_dir": "/home/pi/dvr",
+    "dvr_max_hours": 24,
+    "dvr_max_gb": 8,
+    "dvr_host": "127.0.0.1",  # DVR playback address; "0.0.0.0" exposes the archive to the network
+    "dvr_port": 8090,
+    "metrics_host": "127.0.0.1",  # upload metrics address (metrics_port is set in vps_config.json)
+    "motion_enabled": False,
+    "motion_dir": "/home/pi/motion",
+    "motion_fps": 1,  # at most this many scored frames per second
+    "motion_width": 160,
+    "motion_height": 90,
+    "motion_threshold": 12,  # per-pixel change (0-255) that counts as motion
+    "motion_max_days": 30,
+    "snapshot_enabled": False,
+    "snapshot_interval": 10,  # seconds between thumbnails
+    "snapshot_width": 320,
+    "snapshot_format": "jpg",  # "jpg" or "webp"
+}
+
+logger = logging.getLogger(__name__)
+
+
+def load_stream_config() -> Dict[str, Any]:
+    """Load stream_config.json on top of the defaults."""
+    config = dict(DEFAULT_STREAM_CONFIG)
+    if not STREAM_CONFIG_FILE.exists():
+        return config
+
+    try:
+        with open(STREAM_CONFIG_FILE, 'r') as f:
+            config.update(json.load(f))
+    except Exception as e:
+        logger.error(f"Error loading stream config, using defaults: {e}")
+    return config
+
+
+def live_hls_dir(config: Dict[str, Any]) -> Path:
+    """Directory FFmpeg writes live segments to and the uploader reads from."""
+    if config.get("storage_mode") == "tmpfs":
+        return Path(config["tmpfs_hls_dir"])
+    return Path(config["disk_hls_dir"])
+
+
+def snapshot_name(cam_name: str, config: Dict[str, Any]) -> Optional[str]:
+    """File name of a camera's thumbnail in the live directory, or None if snapshots are off."""
+    if not config.get("snapshot_enabled"):
+        return None
+    return f"{cam_name}.{config.get('snapshot_format', 'jpg')}"
@@ -0,0 +1,184 @@
+"""
+Stream Health Probe
+Parses FFmpeg `-progress` output to tell a live stream from a stalled one.
+
+FFmpeg writes a block of key=value lines (frame, fps, bitrate, out_time_us,
+speed, drop_frames, ...) terminated by `progress=continue` roughly twice a
+second. The launcher feeds those lines in as they arrive; this module keeps
+the latest numbers per camera and decides whether the stream is stalled:
+
+- no progress block at all for PROGRESS_TIMEOUT seconds,
+- the frame counter has not moved for FRAME_STALL_TIMEOUT seconds, or
+- the measured speed stayed below SLOW_SPEED_THRESHOLD for SLOW_SPEED_TIMEOUT.
+
+A low-motion scene still produces frames, so it is never treated as a stall.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Configuration
+PROGRESS_TIMEOUT = 20  # seconds without any progress block before restarting
+FRAME_STALL_TIMEOUT = 10  # seconds without a new frame before restarting
+SPEED_WINDOW = 10  # seconds of wall time used to measure speed
+SLOW_SPEED_THRESHOLD = 0.9  # live input should keep up at ~1.0x
+SLOW_SPEED_TIMEOUT = 30  # seconds below the threshold before restarting
+METRICS_FILE = Path("/dev/shm/ffmpeg_hls_metrics.json")  # RAM-backed, no SD writes
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_number(value: str) -> Optional[float]:
+    """Parse an FFmpeg progress value ('N/A', '1.02x', '812.3kbits/s')."""
+    value = value.strip()
+    for suffix in ('kbits/s', 'x'):
+        if value.endswith(suffix):
+            value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class StreamHealth:
+    """Latest FFmpeg progress numbers and stall detection for one camera."""
+
+    def __init__(self, cam_name: str):
+        self.cam_name = cam_name
+        self.reset()
+
+    def reset(self):
+        """Forget everything about the previous FFmpeg run."""
+        now = time.monotonic()
+        self.started_at = now
+        self.last_progress_at: Optional[float] = None
+        self.last_frame_change_at = now
+        self.slow_since: Optional[float] = None
+        self.frame = 0
+        self.fps = 0.0
+        self.bitrate_kbps = 0.0
+        self.total_size = 0
+        self.out_time_s = 0.0
+        self.speed = 0.0  # cumulative, as reported by FFmpeg
+        self.measured_speed: Optional[float] = None  # over the last SPEED_WINDOW
+        self.drop_frames = 0
+        self.dup_frames = 0
+        self._window_start: Optional[tuple] = None
+        self._block: Dict[str, str] = {}
+
+    def feed_line(self, line: str):
+        """Consume one `key=value` line of FFmpeg progress output."""
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return
+        if key == 'progress':
+            self._apply_block(self._block)
+            self._block = {}
+        else:
+            self._block[key] = value
+
+    def _apply_block(self, block: Dict[str, str]):
+        now = time.monotonic()
+        self.last_progress_at = now
+
+        frame = _parse_number(block.get('frame', ''))
+        if frame is not None and int(frame) != self.frame:
+            self.frame = int(frame)
+            self.last_frame_change_at = now
+
+        for attr, key in (('fps', 'fps'), ('bitrate_kbps', 'bitrate'), ('speed', 'speed')):
+            number = _parse_number(block.get(key, ''))
+            if number is not None:
+                setattr(self, attr, number)
+        for attr, key in (('total_size', 'total_size'), ('drop_frames', 'drop_frames'),
+                          ('dup_frames', 'dup_frames')):
+            number = _parse_number(block.get(key, ''))
+            if number is not None:
+                setattr(self, attr, int(number))
+
+        out_time_us = _parse_number(block.get('out_time_us', block.get('out_time_ms', '')))
+        if out_time_us is not None and out_time_us >= 0:
+            self.out_time_s = out_time_us / 1_000_000
+            self._update_speed(now)
+
+    def _update_speed(self, now: float):
+        """Measure speed over a sliding wall-clock window."""
+        if self._window_start is None:
+            self._window_start = (now, self.out_time_s)
+            return
+        window_wall, window_out = self._window_start
+        elapsed = now - window_wall
+        if elapsed < SPEED_WINDOW:
+            return
+        self.measured_speed = (self.out_time_s - window_out) / elapsed
+        self._window_start = (now, self.out_time_s)
+
+        if self.measured_speed < SLOW_SPEED_THRESHOLD:
+            if self.slow_since is None:
+                self.slow_since = now - elapsed
+        else:
+            self.slow_since = None
+
+    def stall_reason(self) -> Optional[str]:
+        """Return why the stream looks stalled, or None if it is healthy."""
+        now = time.monotonic()
+        if self.last_progress_at is None:
+            waited = now - self.started_at
+            if waited > PROGRESS_TIMEOUT:
+                return f"no progress output after {waited:.1f}s"
+            return None
+        if now - self.last_progress_at > PROGRESS_TIMEOUT:
+            return f"no progress output for {now - self.last_progress_at:.1f}s"
+        if now - self.last_frame_change_at > FRAME_STALL_TIMEOUT:
+            return f"frame count stuck at {self.frame} for {now - self.last_frame_change_at:.1f}s"
+        if self.slow_since is not None and now - self.slow_since > SLOW_SPEED_TIMEOUT:
+            return (f"speed {self.measured_speed:.2f}x below {SLOW_SPEED_THRESHOLD}x "
+                    f"for {now - self.slow_since:.1f}s")
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Metrics snapshot for export."""
+        now = time.monotonic()
+        return {
+            "frame": self.frame,
+            "fps": self.fps,
+            "bitrate_kbps": self.bitrate_kbps,
+            "total_size": self.total_size,
+            "out_time_s": round(self.out_time_s, 3),
+            "speed": self.speed,
+            "measured_speed": (round(self.measured_speed, 3)
+                               if self.measured_speed is not None else None),
+            "drop_frames": self.drop_frames,
+            "dup_frames": self.dup_frames,
+            "seconds_since_progress": (round(now - self.last_progress_at, 1)
+                                       if self.last_progress_at is not None else None),
+            "seconds_since_new_frame": round(now - self.last_frame_change_at, 1),
+        }
+
+
+async def read_progress(stream: asyncio.StreamReader, health: StreamHealth):
+    """Feed FFmpeg progress lines into `health` until the pipe closes."""
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:
+            continue  # over-long line, already discarded by the reader
+        if not line:
+            return
+        health.feed_line(line.decode('utf-8', errors='replace'))
+
+
+def write_metrics(metrics: Dict[str, Any], path: Path = METRICS_FILE):
+    """Atomically write the per-camera metrics JSON file."""
+    tmp_path = path.with_suffix('.tmp')
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(metrics, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.debug(f"Could not write stream metrics: {e}")
@@ -0,0 +1,212 @@
+"""
+Stream Status
+Turns launcher and uploader metrics into a compact per-camera status for Firebase.
+
+The device manager writes it to camera_feeds/<cam>/status, next to the feed
+URL, so the dashboard can show a feed as offline without loading its HLS URL:
+
+    state          "live", "degraded" (slow input or uploads lagging) or "offline"
+    since          when the state last changed (epoch ms, Pi clock)
+    last_segment   newest finished segment (epoch ms)
+    bitrate_kbps   FFmpeg output bitrate
+    fps            FFmpeg output frame rate
+    upload_lag_s   newest local segment minus newest segment confirmed on the VPS
+    restarts       FFmpeg restarts since the launcher started
+
+The status is not a heartbeat: it is only rewritten when something changes,
+so a Pi that loses power leaves its last state behind. The dashboard treats
+the feed as offline as well once device_info/last_online (refreshed every
+UPDATE_INTERVAL) is more than a few heartbeats old.
+
+Sources are the launcher's metrics (/dev/shm/ffmpeg_hls_metrics.json, or in
+memory under pi_runtime.py) and the uploader's status file.
+
+Writes are kept small so hundreds of cameras do not flood RTDB:
+- hysteresis: a new state must be seen STATE_CONFIRM_SAMPLES times in a row,
+- dead bands: numbers only count as changed once they move past DEADBANDS,
+- rate limit: without a state change a camera is written at most every
+  STATUS_MIN_INTERVAL seconds, and only if something changed,
+- delta encoding: the WriteCoalescer sends only the fields that differ.
+
+With snapshots enabled (stream_config.json) the thumbnail's capture time goes
+to camera_feeds/<cam>/snapshot/updated_at, at most every SNAPSHOT_MIN_INTERVAL
+seconds; the dashboard appends it to the snapshot URL to bypass caches.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from stream_health import METRICS_FILE, SLOW_SPEED_THRESHOLD
+
+# Configuration
+STATUS_SAMPLE_INTERVAL = 5  # seconds between status samples
+STATUS_MIN_INTERVAL = 30  # seconds between writes for one camera without a state change
+STATE_CONFIRM_SAMPLES = 2  # consecutive samples needed to change state
+SEGMENT_STALE = 10  # seconds without a new segment before a camera is offline
+METRICS_STALE = 20  # seconds before the launcher's metrics file is considered dead
+UPLOAD_STATUS_FILE = Path("/dev/shm/hls_uploader_status.json")  # written by hls_uploader.py
+LAG_DEGRADED = 10  # upload lag (s) that marks a stream degraded
+LAG_OFFLINE = 60  # upload lag (s) at which viewers effectively see nothing
+SNAPSHOT_MIN_INTERVAL = 30  # seconds between snapshot timestamp writes for one camera
+DEADBANDS = {  # field: (absolute, relative) change needed before it is republished
+    "bitrate_kbps": (50, 0.2),
+    "fps": (1, 0),
+    "upload_lag_s": (2, 0.5),
+    "restarts": (0, 0),
+}
+
+logger = logging.getLogger(__name__)
+
+MetricsSource = Optional[Callable[[], Dict[str, Dict[str, Any]]]]
+UploadSource = Optional[Callable[[], Dict[str, float]]]
+
+
+def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_upload_status() -> Dict[str, float]:
+    """{cam: uploaded_segment_at} from the uploader's status file."""
+    cameras = (_read_json(UPLOAD_STATUS_FILE) or {}).get("cameras", {})
+    return {cam: info["uploaded_segment_at"] for cam, info in cameras.items()
+            if isinstance(info, dict) and info.get("uploaded_segment_at")}
+
+
+def load_samples(cameras: Iterable[str], now: float, stream_metrics: MetricsSource = None,
+                 upload_status: UploadSource = None) -> Dict[str, Dict[str, Any]]:
+    """
+    One sample per camera from the launcher metrics and upload status,
+    read from memory when the callables are given, otherwise from the files.
+    """
+    if stream_metrics is not None:
+        metrics = stream_metrics()
+    else:
+        data = _read_json(METRICS_FILE) or {}
+        fresh = now - data.get("updated_at", 0) <= METRICS_STALE
+        metrics = data.get("cameras", {}) if fresh else {}
+
+    uploaded = upload_status() if upload_status is not None else read_upload_status()
+
+    samples = {}
+    for cam_name in cameras:
+        cam = metrics.get(cam_name, {})
+        last_segment_at = cam.get("last_segment_at")
+        upload_lag = None
+        if last_segment_at and cam_name in uploaded:
+            upload_lag = round(max(0.0, last_segment_at - uploaded[cam_name]), 1)
+        samples[cam_name] = {
+            "running": bool(cam.get("running")),
+            "last_segment_at": last_segment_at,
+            "bitrate_kbps": round(cam["bitrate_kbps"]) if cam.get("bitrate_kbps") is not None else None,
+            "fps": round(cam["fps"], 1) if cam.get("fps") is not None else None,
+            "speed": cam.get("measured_speed"),
+            "upload_lag_s": upload_lag,
+            "restarts": cam.get("restart_count"),
+            "snapshot_at": cam.get("snapshot_at"),
+        }
+    return samples
+
+
+def classify(sample: Dict[str, Any], now: float) -> str:
+    """Instantaneous state of one sample (before hysteresis)."""
+    last_segment_at = sample.get("last_segment_at")
+    lag = sample.get("upload_lag_s")
+    if not sample.get("running") or not last_segment_at or now - last_segment_at > SEGMENT_STALE:
+        return "offline"
+    if lag is not None and lag > LAG_OFFLINE:
+        return "offline"
+    speed = sample.get("speed")
+    if (speed is not None and speed < SLOW_SPEED_THRESHOLD) or (lag is not None and lag > LAG_DEGRADED):
+        return "degraded"
+    return "live"
+
+
+def _within(old: Any, new: Any, band: Tuple[float, float]) -> bool:
+    if old is None or new is None:
+        return old == new
+    absolute, relative = band
+    return abs(new - old) <= max(absolute, relative * abs(old))
+
+
+class StreamStatusTracker:
+    """Decides, per camera, which status (if any) should be written."""
+
+    def __init__(self):
+        self._published: Dict[str, Dict[str, Any]] = {}
+        self._published_at: Dict[str, float] = {}
+        self._pending: Dict[str, Tuple[str, int]] = {}  # cam -> (candidate state, samples seen)
+        self._snapshots: Dict[str, Tuple[float, float]] = {}  # cam -> (snapshot_at published, written at)
+
+    def reset(self):
+        """Forget what was published (e.g. writes now go to a new owner)."""
+        self._published.clear()
+        self._published_at.clear()
+        self._pending.clear()
+        self._snapshots.clear()
+
+    def forget(self, cam_name: str):
+        self._published.pop(cam_name, None)
+        self._published_at.pop(cam_name, None)
+        self._pending.pop(cam_name, None)
+        self._snapshots.pop(cam_name, None)
+
+    def cameras(self) -> Iterable[str]:
+        return list(self._published)
+
+    def update(self, cam_name: str, sample: Dict[str, Any], now: float) -> Optional[Dict[str, Any]]:
+        """Return the status to write for this sample, or None if nothing needs writing."""
+        last = self._published.get(cam_name)
+        raw_state = classify(sample, now)
+
+        state = raw_state if last is None else last["state"]
+        if last is not None and raw_state != last["state"]:
+            candidate, count = self._pending.get(cam_name, (raw_state, 0))
+            count = count + 1 if candidate == raw_state else 1
+            self._pending[cam_name] = (raw_state, count)
+            if count >= STATE_CONFIRM_SAMPLES:
+                state = raw_state
+        else:
+            self._pending.pop(cam_name, None)
+
+        status: Dict[str, Any] = {
+            "state": state,
+            "since": last["since"] if last is not None and last["state"] == state else int(now * 1000),
+        }
+        for key, band in DEADBANDS.items():
+            value = sample.get(key)
+            if state == "offline" and key != "restarts":
+                value = None  # stale numbers would only mislead
+            old = last.get(key) if last is not None else None
+            status[key] = old if last is not None and _within(old, value, band) else value
+
+        if last is not None and state == last["state"]:
+            if now - self._published_at[cam_name] < STATUS_MIN_INTERVAL:
+                return None
+            if all(status[key] == last.get(key) for key in DEADBANDS):
+                return None
+
+        last_segment_at = sample.get("last_segment_at")
+        status["last_segment"] = int(last_segment_at * 1000) if last_segment_at else None
+        self._published[cam_name] = status
+        self._published_at[cam_name] = now
+        self._pending.pop(cam_name, None)
+        if last is None or state != last["state"]:
+            logger.info(f"📶 {cam_name}: stream {state}")
+        return {key: value for key, value in status.items() if value is not None}
+
+    def snapshot(self, cam_name: str, sample: Dict[str, Any], now: float) -> Optional[int]:
+        """Snapshot timestamp (epoch ms) to write for this sample, or None."""
+        snapshot_at = sample.get("snapshot_at")
+        if not snapshot_at:
+            return None
+        published, written_at = self._snapshots.get(cam_name, (0.0, 0.0))
+        if snapshot_at <= published or now - written_at < SNAPSHOT_MIN_INTERVAL:
+            return None
+        self._snapshots[cam_name] = (snapshot_at, now)
+        return int(snapshot_at * 1000)
@@ -0,0 +1,254 @@
+"""
+Upload Metrics
+Per-cycle numbers for the HLS uploader and a rolling-window summary.
+
+rsync runs with --stats and --itemize-changes, so every cycle reports which
+segments were actually sent and how many bytes went over the wire.
+UploadMetrics keeps the last METRICS_WINDOW seconds of cycles and derives:
+
+- throughput: bytes/s really sent (after rsync compression)
+- segment latency: segment finished on the Pi -> confirmed on the VPS
+- backlog depth: segments on local disk not yet confirmed on the VPS
+- lag gauge: per camera, newest segment on local disk minus newest confirmed one
+
+Backlog and lag come from a scan of the local HLS directory at summary time
+(watch_local()), since an upload lane only sees its own camera's batch.
+
+The summary is written to /dev/shm/hls_uploader_status.json after every cycle
+(stream_status.py reads the per-camera part) and, when metrics_port is set in
+vps_config.json, served as Prometheus text on http://<host>:<port>/metrics
+(and as JSON on /metrics.json). host is metrics_host from stream_config.json,
+the Pi itself by default.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from stream_health import write_metrics
+from stream_status import UPLOAD_STATUS_FILE
+
+# Configuration
+METRICS_WINDOW = 300  # seconds of upload cycles kept for rates and percentiles
+ITEMIZE_PATTERN = re.compile(r'^([<>ch.*][fdLDS+][^ ]*) +(.+)$')
+STATS_PATTERNS = {
+    "files_transferred": re.compile(r'Number of regular files transferred: ([\d,]+)'),
+    "file_bytes": re.compile(r'Total transferred file size: ([\d,]+)'),
+    "literal_bytes": re.compile(r'Literal data: ([\d,]+)'),
+    "bytes_sent": re.compile(r'Total bytes sent: ([\d,]+)'),
+    "bytes_received": re.compile(r'Total bytes received: ([\d,]+)'),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_rsync_output(stdout: str) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Files sent (from --itemize-changes) and the --stats numbers. Output of
+    several rsync runs may be concatenated; their stats are summed.
+    """
+    sent = []
+    for line in stdout.splitlines():
+        match = ITEMIZE_PATTERN.match(line)
+        if match and match.group(1).startswith('<f'):
+            sent.append(match.group(2).strip())
+    stats = {}
+    for key, pattern in STATS_PATTERNS.items():
+        values = [int(value.replace(',', '')) for value in pattern.findall(stdout)]
+        if values:
+            stats[key] = sum(values)
+    return sent, stats
+
+
+def camera_of(name: str) -> str:
+    """Camera a live file belongs to: segments are <cam>_NNN.ts, playlists <cam>.m3u8."""
+    stem, _, suffix = name.rpartition('.')
+    return stem.rsplit('_', 1)[0] if suffix == 'ts' else stem
+
+
+def newest_by_camera(segment_times: Dict[str, float]) -> Dict[str, float]:
+    newest: Dict[str, float] = {}
+    for name, mtime in segment_times.items():
+        cam_name = camera_of(name)
+        newest[cam_name] = max(newest.get(cam_name, 0.0), mtime)
+    return newest
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+
+class UploadMetrics:
+    """Rolling-window upload statistics. Thread-safe (the HTTP server reads it)."""
+
+    def __init__(self, window: float = METRICS_WINDOW):
+        self.window = window
+        self.cycles: Deque[Tuple[float, float, int, int, bool]] = deque()  # end, duration, bytes, segments, ok
+        self.latencies: Deque[Tuple[float, str, float]] = deque()  # end, camera, seconds
+        self.uploaded: Dict[str, float] = {}  # cam -> newest segment confirmed on the VPS
+        self.local_segments: Optional[Callable[[], Dict[str, float]]] = None  # name -> mtime on local disk
+        self.is_confirmed: Callable[[str], bool] = lambda name: False
+        self.totals: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def watch_local(self, local_segments: Callable[[], Dict[str, float]], is_confirmed: Callable[[str], bool]):
+        """Sources for backlog and lag: a local directory scan and the upload manifest."""
+        self.local_segments = local_segments
+        self.is_confirmed = is_confirmed
+
+    def record(self, local: Dict[str, float], started: float, ok: bool, stdout: str = ""):
+        """
+        Record one rsync run. local maps the segment names that existed (or
+        were offered) when it started to their modification times.
+        """
+        now = time.time()
+        sent, stats = parse_rsync_output(stdout) if ok else ([], {})
+        bytes_sent = stats.get("bytes_sent", 0)
+        segments_sent = sum(1 for name in sent if name.endswith('.ts'))
+        with self._lock:
+            newest = newest_by_camera(local)
+            if ok:
+                for cam_name, mtime in newest.items():
+                    self.uploaded[cam_name] = max(self.uploaded.get(cam_name, 0.0), mtime)
+                for name in sent:
+                    if name in local:
+                        self.latencies.append((now, camera_of(name), now - local[name]))
+            self.cycles.append((now, now - started, bytes_sent, segments_sent, ok))
+            self.totals["cycles"] += 1
+            self.totals["failures"] += 0 if ok else 1
+            self.totals["bytes_sent"] += bytes_sent
+            self.totals["segments_sent"] += segments_sent
+            self._expire(now)
+
+    def uploaded_snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.uploaded)
+
+    def _expire(self, now: float):
+        while self.cycles and now - self.cycles[0][0] > self.window:
+            self.cycles.popleft()
+        while self.latencies and now - self.latencies[0][0] > self.window:
+            self.latencies.popleft()
+
+    def summary(self) -> Dict[str, Any]:
+        """Rolling-window numbers plus per-camera lag and backlog against the local disk."""
+        local = self.local_segments() if self.local_segments else {}
+        backlog = Counter(camera_of(name) for name in local if not self.is_confirmed(name))
+        local_newest = newest_by_camera(local)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            cycles = list(self.cycles)
+            latencies = [latency for _, _, latency in self.latencies]
+            span = max(now - cycles[0][0] + cycles[0][1], 1.0) if cycles else self.window
+            cameras = {}
+            for cam_name in sorted(set(local_newest) | set(self.uploaded)):
+                newest = local_newest.get(cam_name)
+                uploaded = self.uploaded.get(cam_name)
+                cam_latencies = [latency for _, cam, latency in self.latencies if cam == cam_name]
+                cameras[cam_name] = {
+                    "newest_local_at": newest,
+                    "uploaded_segment_at": uploaded,
+                    "lag_s": round(max(0.0, newest - uploaded), 1) if newest and uploaded else None,
+                    "latency_p50_s": _percentile(cam_latencies, 0.5),
+                    "latency_p95_s": _percentile(cam_latencies, 0.95),
+                    "backlog_segments": backlog.get(cam_name, 0),
+                }
+            lags = [cam["lag_s"] for cam in cameras.values() if cam["lag_s"] is not None]
+            return {
+                "updated_at": now,
+                "window_s": self.window,
+                "cycles": len(cycles),
+                "failures": sum(1 for cycle in cycles if not cycle[4]),
+                "throughput_bps": round(sum(cycle[2] for cycle in cycles) / span),
+                "segments_sent": sum(cycle[3] for cycle in cycles),
+                "cycle_duration_s": {
+                    "avg": round(sum(cycle[1] for cycle in cycles) / len(cycles), 3) if cycles else None,
+                    "max": round(max(cycle[1] for cycle in cycles), 3) if cycles else None,
+                },
+                "segment_latency_s": {
+                    "p50": _percentile(latencies, 0.5),
+                    "p95": _percentile(latencies, 0.95),
+                    "max": round(max(latencies), 3) if latencies else None,
+                },
+                "backlog_segments": sum(backlog.values()),
+                "lag_s": max(lags) if lags else None,
+                "cameras": cameras,
+                "totals": dict(self.totals),
+            }
+
+    def export(self):
+        """Write the summary to the RAM-backed status file."""
+        write_metrics(self.summary(), UPLOAD_STATUS_FILE)
+
+    def prometheus(self) -> str:
+        """Summary in Prometheus text exposition format."""
+        summary = self.summary()
+        lines = []
+
+        def metric(name: str, kind: str, value: Any, labels: str = ""):
+            if value is None:
+                return
+            if not any(line.startswith(f"# TYPE {name} ") for line in lines):
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{labels} {value}")
+
+        totals = summary["totals"]
+        metric("hls_upload_cycles_total", "counter", totals.get("cycles", 0))
+        metric("hls_upload_failures_total", "counter", totals.get("failures", 0))
+        metric("hls_upload_bytes_sent_total", "counter", totals.get("bytes_sent", 0))
+        metric("hls_upload_segments_sent_total", "counter", totals.get("segments_sent", 0))
+        metric("hls_upload_throughput_bytes_per_second", "gauge", summary["throughput_bps"])
+        metric("hls_upload_cycle_duration_seconds_avg", "gauge", summary["cycle_duration_s"]["avg"])
+        for quantile in ("p50", "p95"):
+            metric("hls_upload_segment_latency_seconds", "gauge", summary["segment_latency_s"][quantile],
+                   f'{{quantile="0.{quantile[1:]}"}}')
+        metric("hls_upload_backlog_segments", "gauge", summary["backlog_segments"])
+        for cam_name, cam in sorted(summary["cameras"].items()):
+            metric("hls_upload_lag_seconds", "gauge", cam["lag_s"], f'{{camera="{cam_name}"}}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    metrics: Optional[UploadMetrics] = None
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A003
+        return
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path == '/metrics':
+            body = self.metrics.prometheus().encode('utf-8')
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == '/metrics.json':
+            body = json.dumps(self.metrics.summary(), indent=2).encode('utf-8')
+            content_type = "application/json; charset=utf-8"
+        else:
+            self.send_error(404, "Not Found")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(metrics: UploadMetrics, port: int,
+                         host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics and /metrics.json from a background thread."""
+    MetricsRequestHandler.metrics = metrics
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except OSError as e:
+        logger.warning(f"Upload metrics endpoint disabled (port {port}): {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="upload-metrics-http", daemon=True).start()
+    logger.info(f"📈 Upload metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,267 @@
+"""
+Chat Instrumentation
+On-demand sampling profiler, timing spans and stack dumps for chatbot_api.py.
+
+The chatbot's copy of the Pi daemons' `Iot Code (DO NOT TOUCH)/instrumentation.py`,
+kept to what the API uses (span() and setup()), since the API is deployed
+without the Pi folder. Nothing happens unless .env sets one of:
+
+    INSTRUMENT=1            enable spans and the SIGUSR2 profiler
+    INSTRUMENT_PORT=9475    also serve the endpoint below on 127.0.0.1 (implies INSTRUMENT=1)
+
+When off, span() returns a shared no-op context manager.
+
+- Spans: `with span("chat.llm"):` times a block; count, errors, total and
+  p50/p95/max of the last SPAN_SAMPLES durations are kept per name, plus the
+  spans running right now.
+- Profiler: `kill -USR2 <pid>` samples every thread's stack each
+  PROFILE_INTERVAL seconds for PROFILE_SECONDS, then writes collapsed stacks
+  ("thread;module:function;... count", the input of flamegraph.pl and
+  speedscope) to PROFILE_DIR/<service>-<time>.collapsed.
+- Endpoint (local only):
+      /spans               span statistics and active spans (JSON)
+      /stacks              current stack of every thread (text)
+      /profile?seconds=10  run the profiler now and return collapsed stacks
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# Configuration
+PROFILE_SIGNAL = signal.SIGUSR2
+PROFILE_INTERVAL = 0.01  # seconds between stack samples
+PROFILE_SECONDS = 30  # length of a signal-triggered profile
+PROFILE_MAX_SECONDS = 300  # upper bound for /profile?seconds=
+PROFILE_DIR = Path(tempfile.gettempdir())
+SPAN_SAMPLES = 512  # durations kept per span name for percentiles
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_service = "service"
+_NULL_SPAN = nullcontext()
+
+
+class SpanStats:
+    """Durations of one span name."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent: Deque[float] = deque(maxlen=SPAN_SAMPLES)
+
+    def add(self, seconds: float, failed: bool):
+        self.count += 1
+        self.errors += 1 if failed else 0
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+        pick = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 2) if recent else None
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_s": round(self.total, 3),
+            "p50_ms": pick(0.5),
+            "p95_ms": pick(0.95),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+_spans: Dict[str, SpanStats] = {}
+_active: Dict[int, Tuple[str, str, float]] = {}  # id -> (span, thread, started)
+_lock = threading.Lock()
+_profiling = threading.Lock()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+class _Timed:
+    """One running span; registered in _active until it exits."""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        with _lock:
+            _active[id(self)] = (self.name, threading.current_thread().name, self.started)
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.monotonic() - self.started
+        with _lock:
+            del _active[id(self)]
+            stats = _spans.get(self.name)
+            if stats is None:
+                stats = _spans[self.name] = SpanStats()
+            stats.add(elapsed, exc_type is not None)
+
+
+def span(name: str):
+    """Context manager timing a block (a no-op unless instrumentation is on)."""
+    return _Timed(name) if _enabled else _NULL_SPAN
+
+
+def span_report() -> Dict[str, Any]:
+    """Span statistics plus the spans currently running."""
+    now = time.monotonic()
+    with _lock:
+        return {
+            "service": _service,
+            "pid": os.getpid(),
+            "spans": {name: stats.to_dict() for name, stats in sorted(_spans.items())},
+            "active": sorted(
+                ({"span": name, "thread": thread, "running_ms": round((now - started) * 1000, 1)}
+                 for name, thread, started in _active.values()),
+                key=lambda entry: -entry["running_ms"]),
+        }
+
+
+def _thread_names() -> Dict[int, str]:
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def dump_stacks() -> str:
+    """Current stack of every thread, innermost call last."""
+    names = _thread_names()
+    parts = []
+    for ident, frame in sys._current_frames().items():
+        parts.append(f'Thread "{names.get(ident, ident)}" ({ident}):\n'
+                     + ''.join(traceback.format_stack(frame)))
+    return '\n'.join(parts)
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def profile(seconds: float, interval: float = PROFILE_INTERVAL) -> Counter:
+    """Sample all threads (except this one) for seconds; {collapsed stack: samples}."""
+    samples: Counter = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = _thread_names()
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                samples[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+        time.sleep(interval)
+    return samples
+
+
+def format_collapsed(samples: Counter) -> str:
+    return ''.join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+def _profile_to_file(seconds: float):
+    if not _profiling.acquire(blocking=False):
+        logger.warning("Profiler already running, signal ignored")
+        return
+    try:
+        logger.info(f"🔬 Profiling {_service} for {seconds:.0f}s...")
+        samples = profile(seconds)
+        path = PROFILE_DIR / f"{_service}-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+        path.write_text(format_collapsed(samples))
+        logger.info(f"🔬 Profile written: {path} ({sum(samples.values())} samples)")
+    except OSError as e:
+        logger.error(f"Could not write profile: {e}")
+    finally:
+        _profiling.release()
+
+
+def _on_profile_signal(signum, frame):
+    threading.Thread(target=_profile_to_file, args=(PROFILE_SECONDS,),
+                     name="profiler", daemon=True).start()
+
+
+class InstrumentationHandler(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A003
+        return
+
+    def do_GET(self) -> None:  # noqa: N802
+        url = urlparse(self.path)
+        if url.path == '/spans':
+            body = json.dumps(span_report(), indent=2).encode('utf-8')
+            content_type = "application/json; charset=utf-8"
+        elif url.path == '/stacks':
+            body = dump_stacks().encode('utf-8')
+            content_type = "text/plain; charset=utf-8"
+        elif url.path == '/profile':
+            try:
+                seconds = float(parse_qs(url.query).get('seconds', ['10'])[0])
+            except ValueError:
+                self.send_error(400, "seconds must be a number")
+                return
+            if not _profiling.acquire(blocking=False):
+                self.send_error(409, "Profiler already running")
+                return
+            try:
+                body = format_collapsed(profile(min(max(seconds, 0.1), PROFILE_MAX_SECONDS))).encode('utf-8')
+            finally:
+                _profiling.release()
+            content_type = "text/plain; charset=utf-8"
+        else:
+            self.send_error(404, "Not Found")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def setup(service: str, port: Optional[int] = None) -> bool:
+    """
+    Enable instrumentation for this process if INSTRUMENT / INSTRUMENT_PORT
+    (or port) say so. Call once from the entry point. Returns True if enabled.
+    """
+    global _enabled, _service
+    port = port or int(os.getenv("INSTRUMENT_PORT", "0") or 0)
+    if not port and os.getenv("INSTRUMENT", "").strip().lower() not in {"1", "true", "yes", "on"}:
+        return False
+    _service = service
+    _enabled = True
+
+    try:
+        signal.signal(PROFILE_SIGNAL, _on_profile_signal)
+    except ValueError:
+        logger.warning("Instrumentation set up outside the main thread, SIGUSR2 profiler disabled")
+
+    if port:
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", port), InstrumentationHandler)
+        except OSError as e:
+            logger.warning(f"Instrumentation endpoint disabled (port {port}): {e}")
+        else:
+            threading.Thread(target=server.serve_forever, name="instrumentation-http", daemon=True).start()
+            logger.info(f"🔬 Instrumentation on http://127.0.0.1:{port}/spans")
+    logger.info(f"🔬 Instrumentation enabled for {service} (profile: kill -USR2 {os.getpid()})")
+    return True
@@ -1,4 +1,7 @@
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import os
+from typing import Any, NamedTuple, Optional
+
+from langchain_openai import ChatOpenAI
 from langchain_chroma import Chroma
 import gradio as gr
 
@@ -6,65 +9,85 @@ import gradio as gr
 from dotenv import load_dotenv
 load_dotenv()
 
+from prompt_builder import CacheStats
+from rag_stream import make_stream_response
+from index_versions import HotSwapIndex
+from embedding_index import (EMBEDDING_QUANTIZATION, Int8Index, collection_name, index_path,
+                             int8_aretrieve, make_embeddings)
+
 # configuration
 DATA_PATH = r"data"
 CHROMA_PATH = r"chroma_db"
+CONCURRENCY_LIMIT = int(os.getenv("CHATBOT_CONCURRENCY_LIMIT", "16"))  # chats answered at once
+QUEUE_SIZE = int(os.getenv("CHATBOT_QUEUE_SIZE", "64"))  # chats waiting before new ones are turned away
 
-embeddings_model = OpenAIEmbeddings(model="text-embedding-3-large")
+# EMBEDDING_DIMENSIONS / EMBEDDING_QUANTIZATION must match what ingest_database.py used
+embeddings_model = make_embeddings()
 
 # initiate the model
-llm = ChatOpenAI(temperature=0.5, model='gpt-4o-mini')
+llm = ChatOpenAI(temperature=0.5, model='gpt-4o-mini', stream_usage=True)
+cache_stats = CacheStats()
 
-# connect to the chromadb
-vector_store = Chroma(
-    collection_name="example_collection",
-    embedding_function=embeddings_model,
-    persist_directory=CHROMA_PATH, 
-)
-
-# Set up the vectorstore to be the retriever
 num_results = 5
-retriever = vector_store.as_retriever(search_kwargs={'k': num_results})
 
-# call this function for every message added to the chatbot
-def stream_response(message, history):
-    #print(f"Input: {message}. History: {history}\n")
 
-    # retrieve the relevant chunks based on the question asked
-    docs = retriever.invoke(message)
+class RagIndex(NamedTuple):
+    path: str
+    vector_store: Chroma
+    retriever: Any
+    int8_index: Optional[Int8Index]
+
 
-    # add all the chunks to 'knowledge'
-    knowledge = ""
+# connect to the chromadb (one version of chroma_db, see index_versions.py)
+def open_index(path):
+    vector_store = Chroma(
+        collection_name=collection_name(),
+        embedding_function=embeddings_model,
+        persist_directory=str(path),
+    )
 
-    for doc in docs:
-        knowledge += doc.page_content+"\n\n"
+    # Set up the vectorstore to be the retriever
+    retriever = vector_store.as_retriever(search_kwargs={'k': num_results})
 
+    # with int8 quantization, rank chunks on the compact int8 copy of the vectors instead
+    int8_index = None
+    if EMBEDDING_QUANTIZATION == "int8":
+        int8_index = Int8Index.load(index_path(path, collection_name()))
+        if int8_index is None:
+            print("int8 index not found, run ingest_database.py with EMBEDDING_QUANTIZATION=int8. Using Chroma search.")
 
-    # make the call to the LLM (including prompt)
-    if message is not None:
+    # warm up: the first query loads the vector index from disk, do it before serving
+    sample = vector_store.get(limit=1, include=["embeddings"])
+    if len(sample["embeddings"]):
+        vector_store.similarity_search_by_vector(list(sample["embeddings"][0]), k=1)
 
-        partial_message = ""
+    return RagIndex(str(path), vector_store, retriever, int8_index)
 
-        rag_prompt = f"""
-        You are an assistent which answers questions based on knowledge which is provided to you.
-        While answering, you don't use your internal knowledge, 
-        but solely the information in the "The knowledge" section.
-        You don't mention anything to the user about the povided knowledge.
 
-        The question: {message}
+# langchain_chroma has no close(); chromadb keeps one System per directory for the
+# life of the process, so stop and forget the one of the version swapped out
+def release_index(index):
+    from chromadb.api.client import SharedSystemClient
 
-        Conversation history: {history}
+    system = SharedSystemClient._identifer_to_system.pop(index.path, None)
+    if system is not None:
+        system.stop()
 
-        The knowledge: {knowledge}
 
-        """
+# re-ingesting flips chroma_db/CURRENT; the new version is opened in the background
+# and swapped in between requests, without a restart
+rag_index = HotSwapIndex(CHROMA_PATH, open_index, release_index)
 
-        #print(rag_prompt)
+# retrieve the relevant chunks based on the question asked
+async def retrieve(message):
+    with rag_index.use() as index:
+        if index.int8_index is not None:
+            return await int8_aretrieve(index.vector_store, embeddings_model, index.int8_index, message, num_results)
+        return await index.retriever.ainvoke(message)
 
-        # stream the response to the Gradio App
-        for response in llm.stream(rag_prompt):
-            partial_message += response.content
-            yield partial_message
+# called for every message added to the chatbot; async, so one event loop streams many
+# answers at once and a stopped chat closes its LLM stream (see rag_stream.py)
+stream_response = make_stream_response(retrieve, llm, cache_stats)
 
 # initiate the Gradio app
 chatbot = gr.ChatInterface(stream_response, textbox=gr.Textbox(placeholder="Send to the LLM...",
@@ -73,5 +96,5 @@ chatbot = gr.ChatInterface(stream_response, textbox=gr.Textbox(placeholder="Send
     scale=7),
 )
 
-# launch the Gradio app
-chatbot.launch()
\ No newline at end of file
+# launch the Gradio app (without an explicit limit Gradio answers one chat at a time)
+chatbot.queue(default_concurrency_limit=CONCURRENCY_LIMIT, max_size=QUEUE_SIZE).launch()
\ No newline at end of file
@@ -8,13 +8,18 @@ from __future__ import annotations
 
 import json
 import os
+import time
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from typing import Any
 
 from dotenv import load_dotenv
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 
+import chat_instrumentation as instrumentation
+from client_limits import ClientRateLimiter, FairScheduler, FirebaseTokenVerifier, bearer_token, client_key
+from intent_router import IntentRouter, RouterStats
+from prompt_builder import CacheStats, build_messages, to_gemini, to_langchain
+
 load_dotenv()
 
 PORT = int(os.getenv("CHATBOT_API_PORT", "8000"))
@@ -24,6 +29,15 @@ MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "openai").strip().lower()
 ENABLE_GEMINI = os.getenv("ENABLE_GEMINI", "false").strip().lower() in {"1", "true", "yes", "on"}
 USE_GEMINI = ENABLE_GEMINI and MODEL_PROVIDER in ("gemini", "google")
 
+# Per-client limits (clients = verified Firebase uid, else IP address)
+RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", "10"))
+RATE_BURST = int(os.getenv("CHAT_RATE_BURST", "5"))
+MAX_TRACKED_CLIENTS = int(os.getenv("CHAT_MAX_TRACKED_CLIENTS", "4096"))
+UPSTREAM_SLOTS = int(os.getenv("CHAT_UPSTREAM_SLOTS", "4"))  # LLM calls in flight at once
+QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "30"))
+TRUST_PROXY = os.getenv("CHAT_TRUST_PROXY", "false").strip().lower() in {"1", "true", "yes", "on"}  # behind nginx
+FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID", "testing-151e6")  # audience of the users' ID tokens
+
 # Optional Google AI Studio / Gemini support
 GENAI_MODEL = os.getenv("GENAI_MODEL", "gemini-2.0-flash")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -45,6 +59,19 @@ llm = None
 if not USE_GEMINI:
     llm = ChatOpenAI(model=MODEL, temperature=TEMPERATURE)
 
+cache_stats = CacheStats()
+rate_limiter = ClientRateLimiter(RATE_PER_MINUTE / 60.0, RATE_BURST, MAX_TRACKED_CLIENTS)
+scheduler = FairScheduler(UPSTREAM_SLOTS)
+verify_token = FirebaseTokenVerifier(FIREBASE_PROJECT_ID)
+try:
+    import google.auth  # noqa: F401  (FirebaseTokenVerifier)
+except ImportError:
+    print("google-auth is not installed: chat limits apply per IP address, not per signed-in user")
+
+# Greetings and sensor-reading questions are answered locally (see intent_router.py)
+router = IntentRouter()
+router_stats = RouterStats()
+
 
 def _normalize_error_message(error: Exception) -> tuple[int, str]:
     error_text = " ".join(str(error).lower().split())
@@ -72,36 +99,26 @@ def _normalize_error_message(error: Exception) -> tuple[int, str]:
     return 500, "Failed to generate response from GPT."
 
 
-def _json_response(handler: BaseHTTPRequestHandler, status_code: int, payload: dict[str, Any]) -> None:
+def _json_response(
+    handler: BaseHTTPRequestHandler,
+    status_code: int,
+    payload: dict[str, Any],
+    headers: dict[str, str] | None = None,
+) -> None:
     body = json.dumps(payload).encode("utf-8")
     handler.send_response(status_code)
     handler.send_header("Content-Type", "application/json; charset=utf-8")
     handler.send_header("Content-Length", str(len(body)))
     handler.send_header("Access-Control-Allow-Origin", "*")
-    handler.send_header("Access-Control-Allow-Headers", "Content-Type")
-    handler.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
+    handler.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+    handler.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+    handler.send_header("Access-Control-Expose-Headers", "X-RateLimit-Limit, X-RateLimit-Remaining, X-RateLimit-Reset, Retry-After")
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
     handler.end_headers()
     handler.wfile.write(body)
 
 
-def _build_messages(history: list[dict[str, str]], message: str) -> list[Any]:
-    messages: list[Any] = [SystemMessage(content=SYSTEM_PROMPT)]
-
-    for item in history[-10:]:
-        role = (item.get("role") or "").strip().lower()
-        content = (item.get("content") or "").strip()
-        if not content:
-            continue
-
-        if role == "user":
-            messages.append(HumanMessage(content=content))
-        elif role == "assistant":
-            messages.append(AIMessage(content=content))
-
-    messages.append(HumanMessage(content=message))
-    return messages
-
-
 class ChatbotHandler(BaseHTTPRequestHandler):
     def log_message(self, format: str, *args: Any) -> None:  # noqa: A003
         return
@@ -112,54 +129,111 @@ class ChatbotHandler(BaseHTTPRequestHandler):
             return
         self.send_error(404, "Not Found")
 
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path != "/api/router-stats":
+            self.send_error(404, "Not Found")
+            return
+
+        client = client_key(self.headers, self.client_address[0], TRUST_PROXY, verify_token)
+        decision = rate_limiter.check(client)
+        limit_headers = decision.headers()
+        if not decision.allowed:
+            _json_response(self, 429, {"error": "Too many requests, please wait a moment and retry."}, limit_headers)
+            return
+        # Only signed-in users see the stats; an IP key means no verified token
+        if not client.startswith("uid:"):
+            _json_response(self, 401, {"error": "Sign in to view router stats."}, limit_headers)
+            return
+
+        _json_response(self, 200, router_stats.report(), limit_headers)
+
     def do_POST(self) -> None:  # noqa: N802
+        with instrumentation.span("chat.post"):
+            self._handle_post()
+
+    def _handle_post(self) -> None:
         if self.path != "/api/chat":
             self.send_error(404, "Not Found")
             return
 
+        client = client_key(self.headers, self.client_address[0], TRUST_PROXY, verify_token)
+        decision = rate_limiter.check(client)
+        limit_headers = decision.headers()
+        if not decision.allowed:
+            _json_response(self, 429, {"error": "Too many messages, please wait a moment and retry."}, limit_headers)
+            return
+
         content_length = int(self.headers.get("Content-Length", "0"))
         raw_body = self.rfile.read(content_length).decode("utf-8") if content_length else "{}"
 
         try:
             body = json.loads(raw_body)
         except json.JSONDecodeError:
-            _json_response(self, 400, {"error": "Invalid JSON body."})
+            _json_response(self, 400, {"error": "Invalid JSON body."}, limit_headers)
             return
 
         message = (body.get("message") or "").strip()
         history = body.get("history") or []
 
         if not message:
-            _json_response(self, 400, {"error": "Message is required."})
+            _json_response(self, 400, {"error": "Message is required."}, limit_headers)
             return
 
         if not isinstance(history, list):
             history = []
 
+        # Answer greetings and sensor-reading questions without the LLM
+        started = time.monotonic()
+        with instrumentation.span("chat.route"):
+            route = router.route(message, bearer_token(self.headers))
+        router_stats.record(route, time.monotonic() - started)
+        if route.reply is not None:
+            _json_response(self, 200, {"reply": route.reply, "route": route.intent}, limit_headers)
+            return
+
+        # Wait for an upstream slot; slots go round-robin across clients
+        with instrumentation.span("chat.queue"):
+            if not scheduler.acquire(client, QUEUE_TIMEOUT):
+                _json_response(self, 503, {"error": "The chatbot is busy, please retry shortly."},
+                               {**limit_headers, "Retry-After": "5"})
+                return
+
         try:
-            # Branch between OpenAI (LangChain) or Google Generative AI (Gemini)
-            if USE_GEMINI:
-                if genai is None:
-                    raise RuntimeError("Gemini is enabled but google-genai is not available or GOOGLE_API_KEY is missing.")
-                resp = genai.models.generate_content(
-                    model=GENAI_MODEL,
-                    contents=message,
-                )
-                reply = (resp.text or "").strip() if resp else ""
-            else:
-                if llm is None:
-                    raise RuntimeError("OpenAI model is not initialized.")
-                response = llm.invoke(_build_messages(history, message))
-                reply = (response.content or "").strip()
+            with instrumentation.span("chat.llm"):
+                # System prompt first and the question last, so both providers can reuse
+                # their cached prompt prefix across requests (see prompt_builder.py)
+                messages = build_messages(SYSTEM_PROMPT, message, history)
+
+                # Branch between OpenAI (LangChain) or Google Generative AI (Gemini)
+                if USE_GEMINI:
+                    if genai is None:
+                        raise RuntimeError("Gemini is enabled but google-genai is not available or GOOGLE_API_KEY is missing.")
+                    system_instruction, contents = to_gemini(messages)
+                    resp = genai.models.generate_content(
+                        model=GENAI_MODEL,
+                        contents=contents,
+                        config={"system_instruction": system_instruction},
+                    )
+                    reply = (resp.text or "").strip() if resp else ""
+                    usage = cache_stats.record(getattr(resp, "usage_metadata", None))
+                else:
+                    if llm is None:
+                        raise RuntimeError("OpenAI model is not initialized.")
+                    response = llm.invoke(to_langchain(messages))
+                    reply = (response.content or "").strip()
+                    usage = cache_stats.record(response.usage_metadata)
         except Exception as exc:  # pragma: no cover - network/API errors
             status_code, error_message = _normalize_error_message(exc)
-            _json_response(self, status_code, {"error": error_message, "details": str(exc)})
+            _json_response(self, status_code, {"error": error_message, "details": str(exc)}, limit_headers)
             return
+        finally:
+            scheduler.release()
 
-        _json_response(self, 200, {"reply": reply})
+        _json_response(self, 200, {"reply": reply, "route": route.intent, "usage": usage}, limit_headers)
 
 
 if __name__ == "__main__":
+    instrumentation.setup("chatbot_api")
     server = ThreadingHTTPServer(("0.0.0.0", PORT), ChatbotHandler)
     print(f"Chatbot API listening on http://localhost:{PORT}/api/chat")
     server.serve_forever()
@@ -0,0 +1,168 @@
+"""Near-duplicate chunk detection for ingest_database.py (MinHash + LSH banding).
+
+Revised editions of the same manual, plus the splitter's chunk overlap, produce
+many chunks that differ only by a word or two. Embedding them costs API calls
+and storage and lets one passage fill several of the chatbot's top-k slots.
+
+Each chunk is reduced to its set of SHINGLE_SIZE-word shingles and a MinHash
+signature of NUM_PERM values; the share of equal values estimates the Jaccard
+similarity of two chunks. Signatures are split into LSH_BANDS bands, and only
+chunks sharing an identical band are compared, so a new chunk is checked
+against a few candidates instead of the whole collection. Candidates at or
+above DEDUP_THRESHOLD are duplicates.
+
+The hash parameters come from a fixed seed, so signatures recomputed from the
+stored chunk text match across runs and machines.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# configuration
+SHINGLE_SIZE = 3  # words per shingle (chunks are ~300 characters, ~50 words)
+NUM_PERM = 128  # MinHash values per signature
+LSH_BANDS = 32  # 32 bands x 4 rows: pairs at 0.8 similarity share a band >99.9% of the time
+DEDUP_THRESHOLD = 0.8  # estimated Jaccard similarity counted as a duplicate
+SEED = 1
+
+_rng = np.random.default_rng(SEED)
+_A = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)  # odd multipliers
+_B = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[str]:
+    """Lowercased word n-grams, so whitespace, case and punctuation changes don't matter."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature: the minimum of NUM_PERM universal hashes over the shingles."""
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles(text)), dtype=np.uint64)
+    # multiply-shift hashing: (a * x + b) mod 2**64 (uint64 wrap-around), top 32 bits
+    return ((np.outer(hashes, _A) + _B) >> np.uint64(32)).min(axis=0)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class NearDuplicateIndex:
+    """LSH index of MinHash signatures, keyed by chunk id."""
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, bands: int = LSH_BANDS):
+        self.threshold = threshold
+        self.rows = NUM_PERM // bands
+        self.buckets: list[dict[bytes, list[str]]] = [defaultdict(list) for _ in range(bands)]
+        self.signatures: dict[str, np.ndarray] = {}
+
+    def _bands(self, signature: np.ndarray):
+        for band, bucket in enumerate(self.buckets):
+            yield bucket, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: str, signature: np.ndarray) -> None:
+        self.signatures[key] = signature
+        for bucket, band_key in self._bands(signature):
+            bucket[band_key].append(key)
+
+    def find(self, signature: np.ndarray) -> tuple[str | None, float]:
+        """Most similar indexed chunk at or above the threshold, or (None, best similarity)."""
+        candidates = {key for bucket, band_key in self._bands(signature) for key in bucket.get(band_key, ())}
+        best_key, best = None, 0.0
+        for key in candidates:
+            score = similarity(signature, self.signatures[key])
+            if score > best:
+                best_key, best = key, score
+        return (best_key, best) if best >= self.threshold else (None, best)
+
+
+def provenance(metadata: dict) -> str:
+    """Short "file.pdf p3" label of where a chunk came from."""
+    source = os.path.basename(str(metadata.get("source", "?")))
+    page = metadata.get("page")
+    return f"{source} p{page + 1}" if isinstance(page, int) else source
+
+
+def _record_duplicate(metadata: dict, label: str) -> dict | None:
+    """
+    metadata with label added to duplicate_sources, or None if the chunk already
+    comes from there (its own file and page, or a copy recorded earlier). Chroma
+    metadata values must be scalars, so sources are kept as a "; " joined string.
+    """
+    sources = [s for s in metadata.get("duplicate_sources", "").split("; ") if s]
+    if label == provenance(metadata) or label in sources:
+        return None
+    sources.append(label)
+    return {**metadata, "duplicate_count": int(metadata.get("duplicate_count", 0)) + 1,
+            "duplicate_sources": "; ".join(sources)}
+
+
+@dataclass
+class DedupResult:
+    kept: list = field(default_factory=list)  # new chunks to embed
+    kept_ids: list[str] = field(default_factory=list)
+    stored_updates: dict[str, dict] = field(default_factory=dict)  # stored id -> merged metadata
+    within_batch: int = 0
+    against_stored: int = 0
+    already_stored: int = 0  # re-ingested chunks whose source is already recorded on the stored chunk
+    saved_characters: int = 0
+
+    @property
+    def dropped(self) -> int:
+        """Duplicates skipped (already stored chunks not included)."""
+        return self.within_batch + self.against_stored
+
+
+def dedup_chunks(chunks: list, new_ids: list[str], stored: dict,
+                 threshold: float = DEDUP_THRESHOLD) -> DedupResult:
+    """
+    Drop chunks that nearly duplicate a stored chunk or an earlier chunk of the
+    batch. Each duplicate is merged into the chunk it matched: its file and page
+    are appended to that chunk's duplicate_sources metadata. A chunk matching a
+    stored chunk from the same file and page (or an already recorded copy) is
+    counted as already_stored and changes nothing. `stored` is the
+    vector_store.get(include=["documents", "metadatas"]) result.
+    """
+    index = NearDuplicateIndex(threshold)
+    stored_metadata = {}
+    for key, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+        index.add(key, minhash(text))
+        stored_metadata[key] = metadata or {}
+
+    result = DedupResult()
+    batch: dict[str, object] = {}
+    for chunk, key in zip(chunks, new_ids):
+        signature = minhash(chunk.page_content)
+        match, _ = index.find(signature)
+        if match is None:
+            index.add(key, signature)
+            batch[key] = chunk
+            result.kept.append(chunk)
+            result.kept_ids.append(key)
+            continue
+
+        label = provenance(chunk.metadata)
+        if match in batch:
+            batch[match].metadata = _record_duplicate(batch[match].metadata, label) or batch[match].metadata
+            result.within_batch += 1
+            result.saved_characters += len(chunk.page_content)
+            continue
+        updated = _record_duplicate(result.stored_updates.get(match, stored_metadata[match]), label)
+        if updated is None:
+            result.already_stored += 1
+            continue
+        result.stored_updates[match] = updated
+        result.against_stored += 1
+        result.saved_characters += len(chunk.page_content)
+    return result
@@ -0,0 +1,223 @@
+"""Per-client rate limits and fair upstream queuing for chatbot_api.py.
+
+- ClientRateLimiter: one token bucket per client (refilled at `rate` requests
+  per second, up to `burst`), kept in an LRU OrderedDict of at most
+  `max_clients` entries. An evicted client comes back with a full bucket,
+  which is the same as a client that has been idle long enough.
+- FairScheduler: at most `slots` requests talk to the LLM at once. Waiting
+  requests are queued per client and slots are handed out round-robin
+  across clients, so one client with many queued requests cannot make
+  everyone else wait behind all of them.
+
+Clients are identified by client_key(): the uid of a verified Firebase ID token
+(FirebaseTokenVerifier: signature, project, expiry) when the request carries
+one, otherwise the IP address. Unverified headers are never used, so a client
+cannot get a fresh bucket (or scheduler turn) by sending a new made-up value.
+
+tests/test_client_limits.py load-tests both with a fake LLM: one noisy client
+floods the API while three others send a few questions.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Callable
+
+# configuration
+MAX_QUEUED_PER_CLIENT = 4  # waiting requests per client before new ones are rejected
+MAX_VERIFIED_TOKENS = 4096  # verified ID tokens remembered until they expire
+CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+CERTS_TTL = 3600.0  # seconds between downloads of Firebase's token signing certificates
+
+
+def bearer_token(headers) -> str | None:
+    auth = headers.get("Authorization") or ""
+    if not auth.lower().startswith("bearer "):
+        return None
+    return auth[7:].strip() or None
+
+
+class FirebaseTokenVerifier:
+    """
+    uid of a Firebase ID token whose signature, audience (project), issuer and
+    expiry check out, else None. Verified tokens are cached until they expire,
+    so each user's token is checked once. Needs google-auth; without it every
+    token counts as unverified.
+    """
+
+    def __init__(self, project_id: str, max_tokens: int = MAX_VERIFIED_TOKENS,
+                 decode: Callable[[str], dict[str, Any]] | None = None):
+        self.project_id = project_id
+        self.max_tokens = max_tokens
+        self._decode = decode or self._google_decode
+        self._verified: OrderedDict[str, tuple[str, float]] = OrderedDict()  # token hash -> (uid, exp)
+        self._certs: dict[str, str] = {}
+        self._certs_fetched = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, token: str | None) -> str | None:
+        if not token or not self.project_id:
+            return None
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        now = time.time()
+        with self._lock:
+            cached = self._verified.get(key)
+            if cached is not None and cached[1] > now:
+                self._verified.move_to_end(key)
+                return cached[0]
+        try:
+            claims = self._decode(token)
+        except Exception:
+            return None  # bad signature, wrong project, expired or malformed
+        uid = claims.get("user_id") or claims.get("sub")
+        if claims.get("iss") != f"https://securetoken.google.com/{self.project_id}" or not uid:
+            return None
+        with self._lock:
+            self._verified[key] = (uid, float(claims.get("exp", now)))
+            while len(self._verified) > self.max_tokens:
+                self._verified.popitem(last=False)
+        return uid
+
+    def _google_decode(self, token: str) -> dict[str, Any]:
+        from google.auth import jwt
+        from google.auth.transport.requests import Request
+
+        with self._lock:
+            if time.monotonic() - self._certs_fetched >= CERTS_TTL or not self._certs:
+                response = Request()(CERTS_URL, method="GET")
+                if response.status != 200:
+                    raise ValueError(f"could not fetch signing certificates: {response.status}")
+                self._certs = json.loads(response.data.decode("utf-8"))
+                self._certs_fetched = time.monotonic()
+            certs = self._certs
+        return jwt.decode(token, certs=certs, audience=self.project_id)
+
+
+def client_key(headers, address: str, trust_proxy: bool = False,
+               verify: Callable[[str | None], str | None] | None = None) -> str:
+    """Rate-limit identity: the verified Firebase uid if any, else the (proxied) client IP."""
+    uid = verify(bearer_token(headers)) if verify is not None else None
+    if uid:
+        return "uid:" + uid
+    if trust_proxy:
+        forwarded = headers.get("X-Real-IP") or (headers.get("X-Forwarded-For") or "").split(",")[0].strip()
+        if forwarded:
+            return "ip:" + forwarded
+    return "ip:" + address
+
+
+@dataclass
+class RateDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float  # seconds until the bucket is full again
+    retry_after: float  # seconds until the next request is allowed (0 if allowed)
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(int(self.reset + 0.999)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(int(self.retry_after + 0.999))
+        return headers
+
+
+class ClientRateLimiter:
+    """Token bucket per client with LRU eviction of idle clients."""
+
+    def __init__(self, rate: float, burst: int, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # client -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def check(self, client: str, now: float | None = None) -> RateDecision:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+        return RateDecision(
+            allowed=allowed,
+            limit=self.burst,
+            remaining=int(tokens),
+            reset=(self.burst - tokens) / self.rate,
+            retry_after=0.0 if allowed else (1.0 - tokens) / self.rate,
+        )
+
+
+class _Ticket:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class FairScheduler:
+    """Round-robin across clients for a fixed number of upstream slots."""
+
+    def __init__(self, slots: int, max_queued_per_client: int = MAX_QUEUED_PER_CLIENT):
+        self.free = slots
+        self.max_queued_per_client = max_queued_per_client
+        self._queues: OrderedDict[str, deque[_Ticket]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _dispatch(self) -> None:
+        while self.free > 0 and self._queues:
+            client, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(client)  # next slot goes to the next client
+            else:
+                del self._queues[client]
+            ticket.granted = True
+            self.free -= 1
+            ticket.event.set()
+
+    def acquire(self, client: str, timeout: float) -> bool:
+        """Wait for an upstream slot; False if the client's queue is full or timeout passes."""
+        ticket = _Ticket()
+        with self._lock:
+            queue = self._queues.get(client)
+            if queue is None:
+                queue = self._queues[client] = deque()
+            elif len(queue) >= self.max_queued_per_client:
+                return False
+            queue.append(ticket)
+            self._dispatch()
+
+        if ticket.event.wait(timeout):
+            return True
+        with self._lock:
+            if ticket.granted:  # granted right as the wait timed out
+                return True
+            queue = self._queues.get(client)
+            if queue is not None:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[client]
+        return False
+
+    def release(self) -> None:
+        with self._lock:
+            self.free += 1
+            self._dispatch()
@@ -0,0 +1,133 @@
+"""Embedding size and int8 vector index settings shared by ingest and the chatbot.
+
+text-embedding-3 models are trained Matryoshka-style: the first N dimensions of
+a vector, renormalized, are themselves a good N-dimensional embedding. Setting
+EMBEDDING_DIMENSIONS (for example 256, 512 or 1024) asks the API for shortened
+vectors, so Chroma stores and searches N floats per chunk instead of 3072.
+Vectors of different sizes cannot share a collection, so each size gets its
+own (example_collection_512d); the full size keeps example_collection.
+
+EMBEDDING_QUANTIZATION=int8 also keeps an int8 copy of the collection's vectors
+(one float scale per vector) in <chroma_db>/<collection>.int8.npz, written by
+ingest_database.py. chatbot.py then ranks chunks with an exact dot product over
+that copy (1 byte per dimension instead of 4) and loads the winning documents
+from Chroma by id.
+
+eval_embeddings.py measures recall and latency of each setting against the
+full-size vectors, to pick the smallest index that keeps answer quality.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_openai import OpenAIEmbeddings
+
+load_dotenv()
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0") or 0) or None  # None = full size
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "none").strip().lower()  # "none" or "int8"
+BASE_COLLECTION = "example_collection"
+SEARCH_BLOCK_ROWS = 4096  # int8 rows converted to float at a time while searching
+
+
+def make_embeddings(dimensions: int | None = EMBEDDING_DIMENSIONS) -> OpenAIEmbeddings:
+    """Embeddings model returning vectors of the given size (the API truncates and renormalizes)."""
+    if dimensions:
+        return OpenAIEmbeddings(model=EMBEDDING_MODEL, dimensions=dimensions)
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+
+def collection_name(dimensions: int | None = EMBEDDING_DIMENSIONS) -> str:
+    return f"{BASE_COLLECTION}_{dimensions}d" if dimensions else BASE_COLLECTION
+
+
+def index_path(chroma_path: str | Path, collection: str) -> Path:
+    return Path(chroma_path) / f"{collection}.int8.npz"
+
+
+def truncate(vectors: np.ndarray, dimensions: int | None) -> np.ndarray:
+    """First dimensions of each row, renormalized to unit length (same as the API's dimensions parameter)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dimensions:
+        vectors = vectors[..., :dimensions]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector scalar quantization: vectors ~= codes * scales[:, None]."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class Int8Index:
+    """Exact inner-product search over int8-quantized unit vectors."""
+
+    def __init__(self, ids: list[str], codes: np.ndarray, scales: np.ndarray):
+        self.ids = ids
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def build(cls, ids: list[str], vectors: np.ndarray) -> "Int8Index":
+        codes, scales = quantize_int8(truncate(vectors, None))
+        return cls(list(ids), codes, scales)
+
+    @classmethod
+    def load(cls, path: Path) -> "Int8Index | None":
+        try:
+            with np.load(path) as data:
+                return cls([str(i) for i in data["ids"]], data["codes"], data["scales"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, path: Path) -> None:
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, ids=np.array(self.ids), codes=self.codes, scales=self.scales)
+        os.replace(tmp_path, path)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate cosine similarity of query (unit length) with every stored vector."""
+        query = np.asarray(query, dtype=np.float32)
+        out = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), SEARCH_BLOCK_ROWS):
+            block = self.codes[start:start + SEARCH_BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ query
+        return out * self.scales
+
+    def search(self, query: np.ndarray, k: int) -> list[tuple[str, float]]:
+        if not self.ids:
+            return []
+        scores = self.scores(truncate(query, None))
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+def build_int8_index(vector_store, path: Path) -> Int8Index:
+    """Quantize every vector in a Chroma collection and save the index next to it."""
+    data = vector_store.get(include=["embeddings"])
+    index = Int8Index.build(data["ids"], np.asarray(data["embeddings"], dtype=np.float32))
+    index.save(path)
+    return index
+
+
+async def int8_aretrieve(vector_store, embeddings_model: OpenAIEmbeddings, index: Int8Index,
+                         query: str, k: int) -> list:
+    """Top-k documents for query, ranked by the int8 index and loaded from Chroma."""
+    ids = [doc_id for doc_id, _ in index.search(await embeddings_model.aembed_query(query), k)]
+    docs = {doc.id: doc for doc in await vector_store.aget_by_ids(ids)}
+    return [docs[doc_id] for doc_id in ids if doc_id in docs]
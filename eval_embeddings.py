@@ -0,0 +1,133 @@
+"""Offline recall-vs-latency evaluation of shortened and int8-quantized embeddings.
+
+Reads the full-size vectors of the chunks already ingested into
+example_collection (run ingest_database.py without EMBEDDING_DIMENSIONS first)
+and, for every size in --dims, truncates them locally and renormalizes them.
+This is what the API's `dimensions` parameter does, so nothing is re-embedded.
+Each setting (size x float32/int8) is scored against exact full-size search:
+
+    recall@k   share of the full-size top-k chunks that the setting also returns
+    query_ms   median brute-force search time per query
+    index_mb   vector storage for the whole corpus; int8 counts the float32
+               collection too, since Chroma keeps it next to the int8 copy
+    search_mb  vectors scanned per query (the int8 copy alone for int8)
+
+Queries are the questions in --queries (one per line, embedded once at full
+size), or else --sample stored chunks used as pseudo-queries (with the chunk
+itself left out of the results).
+
+Usage:
+    python eval_embeddings.py --queries questions.txt --dims 256 512 1024 --k 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_chroma import Chroma
+
+from index_versions import current_version
+from embedding_index import BASE_COLLECTION, Int8Index, make_embeddings, quantize_int8, truncate
+
+load_dotenv()
+
+# configuration
+CHROMA_PATH = r"chroma_db"
+DEFAULT_DIMS = [256, 512, 1024]
+
+
+def top_k(scores: np.ndarray, k: int, exclude: int | None = None) -> set[int]:
+    if exclude is not None:
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+    return set(np.argpartition(-scores, k - 1)[:k].tolist())
+
+
+def evaluate(doc_vectors: np.ndarray, query_vectors: np.ndarray, dims: list[int], k: int,
+             self_queries: list[int] | None = None) -> list[dict]:
+    """Recall@k, median query time and index size of each setting versus exact full-size search."""
+    full_docs = truncate(doc_vectors, None)
+    full_queries = truncate(query_vectors, None)
+    exclude = self_queries or [None] * len(full_queries)
+    baseline = [top_k(full_docs @ q, k, ex) for q, ex in zip(full_queries, exclude)]
+
+    results = []
+    for size in dims + [None]:
+        docs = truncate(doc_vectors, size)
+        queries = truncate(query_vectors, size)
+        int8 = Int8Index(list(range(len(docs))), *quantize_int8(docs))
+        for kind, score, nbytes, search_bytes in (
+            ("float32", lambda q: docs @ q, docs.nbytes, docs.nbytes),
+            ("int8", int8.scores, docs.nbytes + int8.nbytes, int8.nbytes),
+        ):
+            hits, times = 0, []
+            for q, ex, expected in zip(queries, exclude, baseline):
+                started = time.perf_counter()
+                found = top_k(score(q), k, ex)
+                times.append(time.perf_counter() - started)
+                hits += len(found & expected)
+            results.append({
+                "dims": size or docs.shape[1],
+                "kind": kind,
+                "recall": hits / (k * len(queries)),
+                "query_ms": statistics.median(times) * 1000,
+                "index_mb": nbytes / 1e6,
+                "search_mb": search_bytes / 1e6,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dims", type=int, nargs="+", default=DEFAULT_DIMS, help="Sizes to compare")
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per question (chatbot uses 5)")
+    parser.add_argument("--queries", help="Text file with one evaluation question per line")
+    parser.add_argument("--sample", type=int, default=200, help="Stored chunks used as queries without --queries")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="Recall needed for the recommendation")
+    args = parser.parse_args()
+
+    vector_store = Chroma(collection_name=BASE_COLLECTION, persist_directory=str(current_version(CHROMA_PATH)))
+    data = vector_store.get(include=["embeddings"])
+    doc_vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    if len(doc_vectors) <= args.k:
+        raise SystemExit(f"{BASE_COLLECTION} has {len(doc_vectors)} chunks, ingest the corpus at full size first")
+
+    self_queries = None
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        query_vectors = np.asarray(make_embeddings(None).embed_documents(questions), dtype=np.float32)
+    else:
+        rng = np.random.default_rng(0)
+        self_queries = rng.choice(len(doc_vectors), min(args.sample, len(doc_vectors)), replace=False).tolist()
+        query_vectors = doc_vectors[self_queries]
+
+    dims = sorted(d for d in set(args.dims) if d < doc_vectors.shape[1])
+    results = evaluate(doc_vectors, query_vectors, dims, args.k, self_queries)
+
+    print(f"{len(doc_vectors)} chunks, {len(query_vectors)} queries, k={args.k}\n")
+    print(f"{'dims':>6} {'vectors':>8} {'recall@k':>9} {'query ms':>9} {'index MB':>9} {'search MB':>10}")
+    for r in results:
+        print(f"{r['dims']:>6} {r['kind']:>8} {r['recall']:>9.3f} {r['query_ms']:>9.3f} "
+              f"{r['index_mb']:>9.2f} {r['search_mb']:>10.2f}")
+
+    # int8 adds to the stored index, so only the size is chosen by storage; int8 is an extra
+    # that shrinks what each query scans, worth it when its recall holds at that size
+    good = [r for r in results if r["kind"] == "float32" and r["recall"] >= args.min_recall]
+    if good:
+        best = min(good, key=lambda r: r["index_mb"])
+        size = best["dims"] if best["dims"] < doc_vectors.shape[1] else "(unset)"
+        print(f"\nSmallest index with recall >= {args.min_recall}: EMBEDDING_DIMENSIONS={size}")
+        int8 = next(r for r in results if r["kind"] == "int8" and r["dims"] == best["dims"])
+        if int8["recall"] >= args.min_recall:
+            print(f"EMBEDDING_QUANTIZATION=int8 keeps recall {int8['recall']:.3f} at that size and cuts the "
+                  f"vectors scanned per query from {best['search_mb']:.2f} to {int8['search_mb']:.2f} MB "
+                  f"(storage grows to {int8['index_mb']:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
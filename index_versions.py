@@ -0,0 +1,176 @@
+"""Versioned Chroma directories with an atomically flipped CURRENT pointer.
+
+    chroma_db/
+        CURRENT                  name of the live version, e.g. "20261019-142501"
+        versions/20261019-142501/
+        versions/20261020-091240/
+
+ingest_database.py copies the live version into a new directory, ingests into
+the copy and, once everything (including the int8 index) is written, replaces
+CURRENT in one rename. A chatbot reading the live version never sees a
+half-written index. KEEP_VERSIONS old versions are kept for rollback (write
+the older name into CURRENT).
+
+Without CURRENT the directory itself is the index (the layout before versions
+existed); the first versioned ingest starts from a copy of it.
+
+HotSwapIndex is the chatbot side: each request pins the live index for its
+retrieval; when CURRENT changes, the new version is opened and warmed on a
+background thread, swapped in between requests, and the old one is released
+once its last request is done.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+# configuration
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+KEEP_VERSIONS = 3  # newest versions kept on disk, the live one included
+CHECK_INTERVAL = 5.0  # seconds between CURRENT checks in the chatbot
+
+logger = logging.getLogger(__name__)
+
+
+def current_version(root: str | Path) -> Path:
+    """Directory of the live index."""
+    root = Path(root)
+    try:
+        name = (root / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return root
+    return root / VERSIONS_DIR / name
+
+
+def new_version(root: str | Path) -> Path:
+    """Fresh version directory holding a copy of the live index."""
+    root = Path(root)
+    source = current_version(root)
+    target = root / VERSIONS_DIR / time.strftime("%Y%m%d-%H%M%S")
+    while target.exists():
+        target = target.with_name(target.name + "-1")
+    if source.exists():
+        shutil.copytree(source, target,
+                        ignore=shutil.ignore_patterns(CURRENT_FILE, VERSIONS_DIR) if source == root else None)
+    else:
+        target.mkdir(parents=True)
+    return target
+
+
+def publish(root: str | Path, version: Path) -> None:
+    """Make version the live index (atomic rename of CURRENT)."""
+    root = Path(root)
+    tmp_path = root / (CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version.name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, root / CURRENT_FILE)
+
+
+def prune(root: str | Path, keep: int = KEEP_VERSIONS) -> list[Path]:
+    """Delete all but the newest keep versions (never the live one)."""
+    live = current_version(root)
+    versions = sorted(p for p in (Path(root) / VERSIONS_DIR).iterdir() if p.is_dir())
+    removed = [p for p in versions[:-keep] if p != live] if keep > 0 else []
+    for path in removed:
+        shutil.rmtree(path, ignore_errors=True)
+    return removed
+
+
+class _Slot:
+    """One opened index version and the requests using it."""
+
+    def __init__(self, path: Path, index: Any):
+        self.path = path
+        self.index = index
+        self.users = 0
+        self.retired = False
+
+
+class HotSwapIndex:
+    """
+    Live index of a versioned directory, swapped in the background when CURRENT
+    changes. open_index(path) opens a version (and should warm it, e.g. with one
+    query); release(index) frees a version no longer in use.
+    """
+
+    def __init__(self, root: str | Path, open_index: Callable[[Path], Any],
+                 release: Callable[[Any], None] | None = None, check_interval: float = CHECK_INTERVAL):
+        self.root = Path(root)
+        self.open_index = open_index
+        self.release = release
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        path = current_version(self.root)
+        self._slot = _Slot(path, open_index(path))
+        self._next_check = time.monotonic() + check_interval
+        self._loading: Path | None = None
+
+    @property
+    def path(self) -> Path:
+        return self._slot.path
+
+    @contextmanager
+    def use(self) -> Iterator[Any]:
+        """The live index, pinned until the block ends."""
+        self._check()
+        with self._lock:
+            slot = self._slot
+            slot.users += 1
+        try:
+            yield slot.index
+        finally:
+            with self._lock:
+                slot.users -= 1
+                done = slot.retired and slot.users == 0
+            if done:
+                self._release(slot)
+
+    def _check(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        path = current_version(self.root)
+        with self._lock:
+            if path == self._slot.path or self._loading is not None:
+                return
+            self._loading = path
+        threading.Thread(target=self._load, args=(path,), name="index-swap", daemon=True).start()
+
+    def _load(self, path: Path) -> None:
+        try:
+            started = time.monotonic()
+            index = self.open_index(path)
+        except Exception as exc:
+            logger.warning(f"Could not open index {path}, keeping {self._slot.path}: {exc}")
+            with self._lock:
+                self._loading = None
+            return
+
+        with self._lock:
+            old = self._slot
+            self._slot = _Slot(path, index)
+            self._loading = None
+            old.retired = True
+            done = old.users == 0
+        logger.info(f"Switched index to {path.name} (opened in {time.monotonic() - started:.1f}s)")
+        if done:
+            self._release(old)
+
+    def _release(self, slot: _Slot) -> None:
+        if self.release is not None:
+            try:
+                self.release(slot.index)
+            except Exception as exc:
+                logger.warning(f"Could not release index {slot.path}: {exc}")
+        slot.index = None
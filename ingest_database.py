@@ -1,6 +1,5 @@
 from langchain_community.document_loaders import PyPDFDirectoryLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai.embeddings import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from uuid import uuid4
 
@@ -8,18 +7,27 @@ from uuid import uuid4
 from dotenv import load_dotenv
 load_dotenv()
 
+from chunk_dedup import dedup_chunks
+from index_versions import new_version, prune, publish
+from embedding_index import (EMBEDDING_DIMENSIONS, EMBEDDING_QUANTIZATION, build_int8_index,
+                             collection_name, index_path, make_embeddings)
+
 # configuration
 DATA_PATH = r"data"
 CHROMA_PATH = r"chroma_db"
 
-# initiate the embeddings model
-embeddings_model = OpenAIEmbeddings(model="text-embedding-3-large")
+# initiate the embeddings model (EMBEDDING_DIMENSIONS shortens the vectors, see embedding_index.py)
+embeddings_model = make_embeddings()
+
+# ingest into a copy of the live index; the chatbot keeps reading the live one
+# until CURRENT is flipped at the end (see index_versions.py)
+version_path = new_version(CHROMA_PATH)
 
 # initiate the vector store
 vector_store = Chroma(
-    collection_name="example_collection",
+    collection_name=collection_name(),
     embedding_function=embeddings_model,
-    persist_directory=CHROMA_PATH,
+    persist_directory=str(version_path),
 )
 
 # loading the PDF document
@@ -41,5 +49,29 @@ chunks = text_splitter.split_documents(raw_documents)
 # creating unique ID's
 uuids = [str(uuid4()) for _ in range(len(chunks))]
 
+# dropping near-duplicate chunks (within this batch and against what is already stored),
+# recording where each duplicate came from on the chunk that is kept
+stored = vector_store.get(include=["documents", "metadatas"])
+dedup = dedup_chunks(chunks, uuids, stored)
+if dedup.stored_updates:
+    vector_store._collection.update(ids=list(dedup.stored_updates),
+                                    metadatas=list(dedup.stored_updates.values()))
+
 # adding chunks to vector store
-vector_store.add_documents(documents=chunks, ids=uuids)
\ No newline at end of file
+if dedup.kept:
+    vector_store.add_documents(documents=dedup.kept, ids=dedup.kept_ids)
+
+# keep the int8 copy of the vectors in step with the collection
+if EMBEDDING_QUANTIZATION == "int8":
+    index = build_int8_index(vector_store, index_path(version_path, collection_name()))
+    print(f"int8 index: {len(index.ids)} vectors, {index.nbytes / 1e6:.1f} MB")
+
+# make the new version live and drop old ones
+publish(CHROMA_PATH, version_path)
+removed = prune(CHROMA_PATH)
+print(f"Published index version {version_path.name}" + (f", removed {len(removed)} old" if removed else ""))
+
+print(f"Split {len(chunks)} chunks: {dedup.within_batch} near-duplicates within the batch, "
+      f"{dedup.against_stored} near-duplicates of stored chunks, {dedup.already_stored} already stored")
+print(f"Embeddings saved: {dedup.dropped} ({dedup.saved_characters} characters, ~{dedup.saved_characters // 4} tokens)")
+print(f"Added {len(dedup.kept)} chunks to {collection_name()} ({EMBEDDING_DIMENSIONS or 'full'} dimensions)")
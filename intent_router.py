@@ -0,0 +1,337 @@
+"""Local fast path for chatbot_api.py: answer trivial and sensor questions without the LLM.
+
+IntentRouter.route() classifies a message in well under a millisecond:
+
+1. Regex rules catch the unambiguous cases: bare greetings, thanks and
+   goodbyes, advice questions ("why", "should", "how to", ...), which always
+   go to the LLM, and questions naming a sensor metric. Those only count as
+   sensor questions with a cue that they are about the user's own readings
+   ("my", "current", "now", "zone A", "readings", ...); general-knowledge
+   wording ("need", "prefer", "affect", "used for", ...) without one goes to
+   the LLM ("What pH does durian prefer?").
+2. Anything else is scored against a few example phrases per intent (cosine
+   similarity of character 3-gram counts). A close enough match wins,
+   otherwise the message is open-ended and goes to the LLM.
+
+Greetings, thanks, goodbyes and help get a template reply. Sensor questions
+("what's the soil moisture in zone A") are answered from a snapshot of the
+user's devices in the Realtime Database: the device ids under
+/users/<uid>/devices (a shallow read), then only device_info and sensor_data
+of each device, never their rollups or camera feeds. It is fetched with the
+Firebase ID token the dashboard sends as `Authorization: Bearer <token>`, so
+the database rules decide what a user may read, and it is cached for
+SNAPSHOT_TTL seconds per token.
+
+RouterStats keeps the share of requests answered locally and their latency
+(GET /api/router-stats). tests/test_intent_router.py routes a sample of
+messages against a fake snapshot.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+# configuration
+RTDB_URL = os.getenv("FIREBASE_DATABASE_URL", "https://testing-151e6-default-rtdb.asia-southeast1.firebasedatabase.app")
+SNAPSHOT_TTL = 30.0  # seconds a user's device snapshot is reused (sensors upload every few seconds)
+SNAPSHOT_CACHE_SIZE = 256  # users kept in the snapshot cache
+FETCH_TIMEOUT = 5.0
+FETCH_WORKERS = 8  # device reads in flight at once for one snapshot
+SCORE_THRESHOLD = 0.5  # minimum similarity for the scorer to pick a local intent
+LATENCY_SAMPLES = 512
+
+# metric key in sensor_data -> (label, unit, words that name it)
+METRICS = {
+    "moisture": ("soil moisture", "%", ("moisture", "moist", "wet", "dry", "humidity", "water level")),
+    "temperature": ("soil temperature", "°C", ("temperature", "temp", "hot", "cold", "warm")),
+    "ph": ("pH", "", ("ph", "acidity", "acidic", "alkaline")),
+    "ec": ("EC", " µS/cm", ("ec", "conductivity", "salinity", "salt")),
+    "n": ("nitrogen", " mg/kg", ("nitrogen",)),
+    "p": ("phosphorus", " mg/kg", ("phosphorus", "phosphorous")),
+    "k": ("potassium", " mg/kg", ("potassium",)),
+}
+NPK_WORDS = ("npk", "nutrient", "nutrients", "fertility")
+
+REPLIES = {
+    "greeting": "Hello! Ask me about your durian orchard, or about your sensors, "
+                "e.g. \"What's the soil moisture in zone A?\"",
+    "thanks": "You're welcome! Let me know if there is anything else.",
+    "goodbye": "Goodbye! Happy growing.",
+    "help": "I can answer durian growing questions and read your sensors: soil moisture, temperature, "
+            "pH, EC and N/P/K, per zone (\"pH in zone B\") or for all zones (\"current readings\").",
+}
+
+EXAMPLES = {
+    "greeting": ["hi", "hello", "hey", "hello there", "good morning", "good evening", "hi bot", "sawasdee"],
+    "thanks": ["thanks", "thank you", "thank you so much", "thanks a lot", "great thanks", "thx", "ok thanks"],
+    "goodbye": ["bye", "goodbye", "see you", "see you later", "bye bye", "good night"],
+    "help": ["help", "what can you do", "what can i ask", "how do i use this", "what do you know"],
+    "sensor": ["what is the soil moisture", "current readings", "show my sensor readings", "sensor data now",
+               "latest sensor values", "how are my sensors", "what are the readings in zone a"],
+    "open": ["why are the durian leaves turning yellow", "how should i fertilize my durian trees",
+             "when is the best time to harvest durian", "what causes root rot",
+             "how much water does a young durian tree need", "tell me about durian varieties"],
+}
+
+_ADVICE = re.compile(r"\b(why|should|recommend\w*|advi[cs]e|how (do|can|to|should)|what (to|should|can i do)|"
+                     r"fix|improve|cause[sd]?|treat\w*|prevent|best|normal|ideal|optimal|enough|ok|okay|good for|too)\b")
+_GREETING = re.compile(r"^(hi+|hello+|hey+|yo|hiya|good (morning|afternoon|evening)|sawa?sdee( kh?a| krub)?)"
+                       r"( there| bot| chatbot)?$")
+_THANKS = re.compile(r"^((ok(ay)?|great|cool|perfect|nice)[ ,]*)?(thanks?( you)?( so much| a lot)?|thx|ty)$")
+_GOODBYE = re.compile(r"^(bye( bye)?|goodbye|see (you|ya)( later)?|good ?night)$")
+_CURRENT = re.compile(r"\b(current|currently|now|latest|today|reading|readings|sensor|sensors|is it|zone\s*[a-z0-9]+)\b")
+_OWN = re.compile(r"\b(my|our|show|level|levels|value|values)\b")
+_GENERAL = re.compile(r"\b(need|needs|prefer\w*|affect\w*|kill\w*|used for|requir\w*|toleran\w*|tolerate\w*|"
+                      r"damage\w*|mean|means|range|effect)\b")
+_ZONE = re.compile(r"\bzone\s*([a-z0-9]+)\b")
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _normalize(message: str) -> str:
+    return " ".join(_WORD.findall(message.lower()))
+
+
+def _vector(text: str) -> Counter:
+    padded = f" {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _unit(vector: Counter) -> dict[str, float]:
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {gram: v / norm for gram, v in vector.items()}
+
+
+class IntentScorer:
+    """Cosine similarity of character 3-grams with the closest example phrase."""
+
+    def __init__(self, examples: dict[str, list[str]] = EXAMPLES):
+        self.examples = [(intent, _unit(_vector(phrase))) for intent, phrases in examples.items() for phrase in phrases]
+
+    def score(self, text: str) -> tuple[str, float]:
+        query = _unit(_vector(text))
+        best, best_score = "open", 0.0
+        for intent, example in self.examples:
+            score = sum(weight * example.get(gram, 0.0) for gram, weight in query.items())
+            if score > best_score:
+                best, best_score = intent, score
+        return best, best_score
+
+
+def _token_uid(id_token: str) -> str | None:
+    """uid claim of a Firebase ID token (not verified here; the database verifies the token)."""
+    try:
+        payload = id_token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return claims.get("user_id") or claims.get("sub")
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
+def _get_json(path: str, id_token: str, **params: str) -> Any:
+    url = f"{RTDB_URL}/{path}.json?" + urllib.parse.urlencode({"auth": id_token, **params})
+    with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def fetch_devices(uid: str, id_token: str) -> dict[str, Any] | None:
+    """
+    {device id: {name, zone, type, sensor_data}} of the user's devices, read
+    with the user's own token; None if the database refuses it. Camera servers
+    (pi_*) are skipped, they have no sensor_data.
+    """
+    root = f"users/{urllib.parse.quote(uid)}/devices"
+    try:
+        device_ids = [d for d in _get_json(root, id_token, shallow="true") or {} if not d.startswith("pi_")]
+        paths = [f"{root}/{urllib.parse.quote(d)}/{part}" for d in device_ids for part in ("device_info", "sensor_data")]
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            nodes = list(pool.map(lambda path: _get_json(path, id_token), paths))
+    except (urllib.error.URLError, TimeoutError, ValueError):
+        return None
+
+    devices = {}
+    for device_id, info, data in zip(device_ids, nodes[0::2], nodes[1::2]):
+        info = info if isinstance(info, dict) else {}
+        devices[device_id] = {"name": info.get("name"), "zone": info.get("zone"),
+                              "type": info.get("type", "sensor"), "sensor_data": data}
+    return devices
+
+
+class SensorSnapshots:
+    """Per-user device snapshots, cached by token for SNAPSHOT_TTL in a bounded LRU."""
+
+    def __init__(self, fetch: Callable[[str, str], dict | None] = fetch_devices,
+                 ttl: float = SNAPSHOT_TTL, max_users: int = SNAPSHOT_CACHE_SIZE):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_users = max_users
+        self._cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, id_token: str) -> dict | None:
+        # keyed by the token itself: the uid inside it is only trusted once the database accepted the token
+        key = hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and now - cached[0] < self.ttl:
+                self._cache.move_to_end(key)
+                return cached[1]
+
+        uid = _token_uid(id_token)
+        devices = self.fetch(uid, id_token) if uid else None
+        if devices is None:
+            return None
+        with self._lock:
+            self._cache[key] = (now, devices)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+        return devices
+
+
+def _format_value(metric: str, value: Any) -> str:
+    label, unit, _ = METRICS[metric]
+    if isinstance(value, float):
+        value = f"{value:.1f}"
+    return f"{label} {value}{unit}"
+
+
+def _age(updated_at: Any) -> str:
+    if not isinstance(updated_at, (int, float)):
+        return ""
+    minutes = max(0, int((time.time() * 1000 - updated_at) / 60000))
+    if minutes < 1:
+        return " (just now)"
+    if minutes < 120:
+        return f" ({minutes} min ago)"
+    return f" ({minutes // 60} h ago)"
+
+
+def _zone_id(zone: Any) -> str:
+    """"Zone A" (as stored in device_info) and "a" (as asked) both become "A"."""
+    return re.sub(r"^zone\s*", "", str(zone or "?").strip(), flags=re.IGNORECASE).upper()
+
+
+def sensor_reply(devices: dict, metrics: list[str], zone: str | None) -> str:
+    """Readings of the user's soil sensors, optionally for one zone."""
+    rows = []
+    for device_id, device in sorted(devices.items()):
+        if not isinstance(device, dict) or device.get("type", "sensor") != "sensor" or device_id.startswith("pi_"):
+            continue
+        device_zone = _zone_id(device.get("zone"))
+        if zone and device_zone != _zone_id(zone):
+            continue
+        data = device.get("sensor_data")
+        if not isinstance(data, dict):
+            continue
+        values = [_format_value(m, data[m]) for m in (metrics or list(METRICS)) if data.get(m) is not None]
+        if values:
+            name = device.get("name") or device_id
+            rows.append(f"Zone {device_zone} ({name}): {', '.join(values)}{_age(data.get('updated_at'))}")
+
+    where = f" in zone {zone.upper()}" if zone else ""
+    if not rows:
+        return f"I couldn't find any sensor readings{where}. Check that the sensor is online in the dashboard."
+    return "\n".join(rows)
+
+
+@dataclass
+class Route:
+    intent: str  # greeting, thanks, goodbye, help, sensor or open
+    reply: str | None  # None: send to the LLM
+
+
+class IntentRouter:
+    def __init__(self, snapshots: SensorSnapshots | None = None, threshold: float = SCORE_THRESHOLD):
+        self.snapshots = snapshots or SensorSnapshots()
+        self.scorer = IntentScorer()
+        self.threshold = threshold
+
+    def classify(self, message: str) -> tuple[str, list[str], str | None]:
+        """(intent, metrics named, zone named)."""
+        text = _normalize(message)
+        words = set(text.split())
+        metrics = [key for key, (_, _, names) in METRICS.items()
+                   if any((name in words) if " " not in name else (name in text) for name in names)]
+        if words & set(NPK_WORDS):
+            metrics += [m for m in ("n", "p", "k") if m not in metrics]
+        zone_match = _ZONE.search(text)
+        zone = zone_match.group(1) if zone_match else None
+
+        if not text:
+            return "open", metrics, zone
+        for intent, pattern in (("greeting", _GREETING), ("thanks", _THANKS), ("goodbye", _GOODBYE)):
+            if pattern.match(text):
+                return intent, metrics, zone
+        if _ADVICE.search(text):
+            return "open", metrics, zone
+        if metrics:
+            if _CURRENT.search(text):
+                return "sensor", metrics, zone
+            if _GENERAL.search(text):
+                return "open", metrics, zone  # about durian in general, not this orchard
+            if _OWN.search(text) or len(words) <= 4:
+                return "sensor", metrics, zone
+
+        intent, score = self.scorer.score(text)
+        if score < self.threshold or (intent == "sensor" and len(words) > 12):
+            intent = "open"
+        return intent, metrics, zone
+
+    def route(self, message: str, id_token: str | None = None) -> Route:
+        intent, metrics, zone = self.classify(message)
+        if intent in REPLIES:
+            return Route(intent, REPLIES[intent])
+        if intent != "sensor":
+            return Route("open", None)
+        if not id_token:
+            return Route(intent, "Sign in to the dashboard to ask about your sensor readings.")
+        devices = self.snapshots.get(id_token)
+        if devices is None:
+            return Route(intent, "I couldn't read your sensor data right now. Please try again in a moment.")
+        return Route(intent, sensor_reply(devices, metrics, zone))
+
+
+class RouterStats:
+    """Share of requests answered locally and the latency of those answers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.by_intent: Counter = Counter()
+        self.local_latency: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, route: Route, seconds: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.by_intent[route.intent] += 1
+            if route.reply is not None:
+                self.local_latency.append(seconds)
+
+    def report(self) -> dict[str, Any]:
+        with self._lock:
+            local = self.requests - self.by_intent["open"]
+            recent = sorted(self.local_latency)
+            pick = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 2) if recent else None
+            return {
+                "requests": self.requests,
+                "local": local,
+                "local_fraction": round(local / self.requests, 3) if self.requests else 0.0,
+                "by_intent": dict(self.by_intent),
+                "local_p50_ms": pick(0.5),
+                "local_p95_ms": pick(0.95),
+            }
@@ -68,13 +68,25 @@ document.addEventListener('DOMContentLoaded', function() {
 
         let lastError;
 
+        // Signed-in users send their Firebase ID token so the API can answer
+        // sensor questions ("soil moisture in zone A") from their own data
+        const headers = {
+            'Content-Type': 'application/json'
+        };
+        const currentUser = window.firebaseAuth && window.firebaseAuth.currentUser;
+        if (currentUser) {
+            try {
+                headers.Authorization = `Bearer ${await currentUser.getIdToken()}`;
+            } catch (error) {
+                console.warn('⚠️ Could not get ID token for the chatbot:', error);
+            }
+        }
+
         for (const apiUrl of chatbotApiCandidates) {
             try {
                 const response = await fetch(apiUrl, {
                     method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
+                    headers,
                     body: JSON.stringify({
                         message,
                         history: conversationHistory
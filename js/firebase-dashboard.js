@@ -6,6 +6,10 @@ import { auth } from './firebase-config.js';
 // Database URL (from Firebase config)
 const DB_URL = "https://testing-151e6-default-rtdb.asia-southeast1.firebasedatabase.app";
 
+// A Pi refreshes device_info/last_online every 30 s; after this long without it the Pi is gone
+// and its last published camera status (e.g. "live") can no longer be trusted
+const DEVICE_STALE_MS = 3 * 30 * 1000;
+
 class FirebaseDashboardManager {
     constructor() {
         this.currentUser = null;
@@ -159,7 +163,16 @@ class FirebaseDashboardManager {
 
         try {
             const url = `${DB_URL}/users/${this.currentUser.uid}/devices/${deviceId}/camera_feeds.json?auth=${this.idToken}`;
-            const response = await fetch(url);
+            const heartbeatUrl = `${DB_URL}/users/${this.currentUser.uid}/devices/${deviceId}/device_info/last_online.json?auth=${this.idToken}`;
+            const [response, heartbeat] = await Promise.all([fetch(url), fetch(heartbeatUrl)]);
+
+            if (heartbeat.ok) {
+                const lastOnline = await heartbeat.json();
+                const device = this.devices.get(deviceId);
+                if (device && lastOnline) {
+                    device.last_online = lastOnline;
+                }
+            }
 
             if (response.ok) {
                 const cameraFeeds = await response.json();
@@ -181,6 +194,37 @@ class FirebaseDashboardManager {
         }
     }
 
+    /**
+     * Load min/max/mean rollups of one sensor metric (written by sensor_rollup.py on the Pi)
+     * Path: /users/<uid>/devices/<deviceId>/sensor_rollups/<1m|1h|1d>/<metric>/<bucket>
+     * Returns [{t, min, max, mean, n}] sorted by bucket start (t in epoch ms)
+     */
+    async loadSensorRollups(deviceId, metric, resolution = '1h', since = null) {
+        if (!this.currentUser || !this.idToken) {
+            return [];
+        }
+
+        try {
+            let url = `${DB_URL}/users/${this.currentUser.uid}/devices/${deviceId}/sensor_rollups/${resolution}/${metric}.json?auth=${this.idToken}`;
+            if (since) {
+                // Bucket keys are epoch seconds (same length), so key order is time order
+                url += `&orderBy="$key"&startAt="${Math.floor(since / 1000)}"`;
+            }
+            const response = await fetch(url);
+            if (!response.ok) {
+                return [];
+            }
+
+            const buckets = await response.json() || {};
+            return Object.entries(buckets)
+                .map(([key, [min, max, mean, n]]) => ({ t: Number(key) * 1000, min, max, mean, n }))
+                .sort((a, b) => a.t - b.t);
+        } catch (error) {
+            console.error(`❌ Error fetching ${resolution} ${metric} rollups for ${deviceId}:`, error);
+            return [];
+        }
+    }
+
     /**
      * Update device sensor data and trigger dashboard update
      */
@@ -409,6 +453,27 @@ class FirebaseDashboardManager {
         return device && device.type === 'camera_server' ? device.cameraFeeds : null;
     }
 
+    /**
+     * True when the device has not refreshed device_info/last_online for a few heartbeats
+     * (powered off, crashed or offline). Its camera_feeds status is then stale as well.
+     */
+    isDeviceStale(device) {
+        return !device || !device.last_online || Date.now() - device.last_online > DEVICE_STALE_MS;
+    }
+
+    /**
+     * Thumbnail URL of a camera feed ({url, snapshot: {url, updated_at}}), or null
+     * The Pi refreshes it every few seconds; updated_at busts browser/CDN caches
+     * Use it for grids/previews instead of loading the HLS stream
+     */
+    getSnapshotUrl(feed) {
+        const snapshot = feed && typeof feed === 'object' ? feed.snapshot : null;
+        if (!snapshot || !snapshot.url) {
+            return null;
+        }
+        return snapshot.updated_at ? `${snapshot.url}?t=${snapshot.updated_at}` : snapshot.url;
+    }
+
     /**
      * Remove device from user (hard delete)
      * Removes from both device_registry and user's devices
@@ -280,12 +280,48 @@ class CameraFeedManager {
             return;
         }
 
-        // Get first feed URL
-        const firstFeedUrl = cameraFeeds[feedNames[0]];
+        // Get first feed URL ({url, status} object; older Pis publish the URL string only)
+        const firstFeed = cameraFeeds[feedNames[0]];
+        const firstFeedUrl = typeof firstFeed === 'string' ? firstFeed : (firstFeed && firstFeed.url);
+        const feedStatus = firstFeed && typeof firstFeed === 'object' ? firstFeed.status : null;
         console.log('📹 Camera feed URL:', firstFeedUrl);
         console.log('📹 Camera device:', cameraDevice.name, '| Zone:', zoneName);
         console.log('📹 Available feeds:', feedNames);
+
+        // The status is only rewritten on changes, so a Pi that died keeps its last state ("live"):
+        // without a recent heartbeat the feed counts as offline too
+        const piStale = feedStatus && this.firebaseDashboard.isDeviceStale(cameraDevice);
+        if (feedStatus && (feedStatus.state === 'offline' || piStale)) {
+            // The Pi reports this stream as down: show it without probing the dead HLS URL
+            console.log(piStale ? '📴 Camera server stopped sending heartbeats, not loading'
+                                : '📴 Camera feed offline according to the Pi, not loading');
+            if (this.hlsPlayer) {
+                try {
+                    this.hlsPlayer.destroy();
+                } catch (e) {
+                    console.warn('Warning cleaning up HLS player:', e);
+                }
+                this.hlsPlayer = null;
+            }
+            const videoElement = document.getElementById('cameraVideo');
+            const placeholder = document.getElementById('cameraPlaceholder');
+            if (videoElement) videoElement.style.display = 'none';
+            if (placeholder) {
+                placeholder.style.display = 'flex';
+                const statusValue = placeholder.querySelector('.stat-value.live');
+                if (statusValue) statusValue.textContent = 'Offline';
+            }
+            this.currentFeedUrl = null;
+            return;
+        }
         
+        // Show the Pi's thumbnail (if it publishes one) while the HLS stream starts
+        const snapshotUrl = this.firebaseDashboard.getSnapshotUrl(firstFeed);
+        const video = document.getElementById('cameraVideo');
+        if (snapshotUrl && video) {
+            video.poster = window.location.protocol === 'https:' ? this.convertToHttps(snapshotUrl) : snapshotUrl;
+        }
+
         // Only load if URL has changed
         if (firstFeedUrl === this.currentFeedUrl && this.hlsPlayer) {
             // Same feed already playing, don't reload
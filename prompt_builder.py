@@ -0,0 +1,134 @@
+"""Prompt layout that keeps provider-side prompt caching effective.
+
+OpenAI and Gemini reuse the computed prefix of a prompt when a new request
+starts with exactly the same tokens as a recent one (OpenAI from 1024 tokens,
+automatically), which cuts time-to-first-token and input cost. That only works
+if everything that changes per request comes last, so messages are built from
+most to least stable:
+
+    1. system rules          identical for every request
+    2. retrieved knowledge   sorted by source, page and text, so the same chunks
+                             give the same bytes whatever order retrieval returned
+    3. conversation history  grows at the end, earlier turns stay in place
+    4. the question
+
+Messages are plain {"role", "content"} dicts; to_langchain() and to_gemini()
+adapt them to each client. CacheStats adds up the cached-token counts the
+providers report in their usage metadata.
+
+tests/test_prompt_builder.py checks, with a fake provider, that the prefix
+stays byte-identical across questions.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from typing import Any, Iterable
+
+# configuration
+HISTORY_TURNS = 10  # most recent history messages kept
+
+RAG_RULES = (
+    "You are an assistant which answers questions based on knowledge which is provided to you. "
+    "While answering, you don't use your internal knowledge, but solely the information in the "
+    '"The knowledge" message. You don\'t mention anything to the user about the provided knowledge.'
+)
+
+
+def _doc_key(doc: Any) -> tuple[str, int, str]:
+    metadata = getattr(doc, "metadata", None) or {}
+    page = metadata.get("page")
+    return str(metadata.get("source", "")), page if isinstance(page, int) else -1, doc.page_content
+
+
+def knowledge_text(docs: Iterable[Any]) -> str:
+    """Retrieved chunks in a fixed order (source, page, text), without exact repeats."""
+    seen = set()
+    parts = []
+    for doc in sorted(docs, key=_doc_key):
+        text = doc.page_content.strip()
+        if text and text not in seen:
+            seen.add(text)
+            parts.append(text)
+    return "\n\n".join(parts)
+
+
+def _history_messages(history: Any) -> list[dict[str, str]]:
+    """Gradio pairs ([user, bot]) or role/content dicts, as role/content dicts."""
+    messages = []
+    for item in history or []:
+        if isinstance(item, dict):
+            role = (item.get("role") or "").strip().lower()
+            content = item.get("content")
+            if role in ("user", "assistant") and isinstance(content, str) and content.strip():
+                messages.append({"role": role, "content": content.strip()})
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            for role, content in zip(("user", "assistant"), item):
+                if isinstance(content, str) and content.strip():
+                    messages.append({"role": role, "content": content.strip()})
+    return messages[-HISTORY_TURNS:]
+
+
+def build_messages(system: str, message: str, history: Any = None, docs: Iterable[Any] | None = None) -> list[dict[str, str]]:
+    """System rules, knowledge, history, question: most stable first."""
+    messages = [{"role": "system", "content": system}]
+    if docs is not None:
+        messages.append({"role": "system", "content": "The knowledge:\n\n" + knowledge_text(docs)})
+    messages.extend(_history_messages(history))
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def serialize(messages: list[dict[str, str]]) -> bytes:
+    return json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def to_langchain(messages: list[dict[str, str]]) -> list[Any]:
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+    types = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+    return [types[m["role"]](content=m["content"]) for m in messages]
+
+
+def to_gemini(messages: list[dict[str, str]]) -> tuple[str, list[dict[str, Any]]]:
+    """(system_instruction, contents) for google-genai generate_content."""
+    system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+    contents = [
+        {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+        for m in messages if m["role"] != "system"
+    ]
+    return system, contents
+
+
+def usage_tokens(usage: Any) -> tuple[int, int]:
+    """(prompt tokens, cached prompt tokens) from LangChain or google-genai usage metadata."""
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):  # LangChain usage_metadata
+        details = usage.get("input_token_details") or {}
+        return int(usage.get("input_tokens") or 0), int(details.get("cache_read") or 0)
+    return (int(getattr(usage, "prompt_token_count", 0) or 0),
+            int(getattr(usage, "cached_content_token_count", 0) or 0))
+
+
+class CacheStats:
+    """Running totals of prompt and cached prompt tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, usage: Any) -> dict[str, Any]:
+        prompt, cached = usage_tokens(usage)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt
+            self.cached_tokens += cached
+            return {
+                "prompt_tokens": prompt,
+                "cached_tokens": cached,
+                "cache_hit_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            }
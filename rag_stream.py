@@ -0,0 +1,53 @@
+"""Async streaming RAG handler for the Gradio chatbot (chatbot.py).
+
+The handler awaits retrieval and streams the LLM answer with astream, so one
+event loop serves many chats while they wait on the network; Gradio's queue
+concurrency limit, not a worker thread per chat, decides how many run at once.
+When a session is cancelled (stop button, closed tab) Gradio cancels the
+handler, and the upstream LLM stream is closed right away instead of running
+to the end.
+
+tests/test_rag_stream.py load-tests the handler with local fakes: the same
+users are served with concurrency 1 (Gradio's default, which queued every
+chat behind the previous one) and with 16 at once, and one session is
+cancelled mid-answer.
+"""
+
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from prompt_builder import RAG_RULES, CacheStats, build_messages, to_langchain
+
+def make_stream_response(
+    retrieve: Callable[[str], Awaitable[list]],
+    llm: Any,
+    cache_stats: CacheStats,
+    format_messages: Callable[[list[dict[str, str]]], Any] = to_langchain,
+) -> Callable[[str, Any], AsyncIterator[str]]:
+    """Gradio ChatInterface handler: retrieve chunks, then stream the growing answer."""
+
+    async def stream_response(message, history):
+        if message is None:
+            return
+
+        # the prompt needs the chunks, so retrieval has to finish first; while it (and later
+        # the LLM) waits on the network the event loop serves the other chats
+        docs = await retrieve(message)
+        rag_prompt = format_messages(build_messages(RAG_RULES, message, history, docs))
+
+        partial_message = ""
+        usage = None
+        stream = llm.astream(rag_prompt)
+        try:
+            async for response in stream:
+                partial_message += response.content
+                usage = response.usage_metadata or usage
+                yield partial_message
+        finally:
+            # on cancel (or the client going away) this closes the HTTP stream to the provider
+            await stream.aclose()
+
+        print(f"Prompt cache: {cache_stats.record(usage)}")
+
+    return stream_response
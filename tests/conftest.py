@@ -0,0 +1,39 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# the chatbot modules live at the repository root, not in a package
+sys.path.insert(0, str(ROOT))
+# and the Pi scripts sit side by side in their own folder
+sys.path.insert(0, str(ROOT / "Iot Code (DO NOT TOUCH)"))
+
+
+@pytest.fixture
+def rtdb():
+    """A FakeRTDB served on its own event loop thread; yields (rtdb, db_url, loop)."""
+    from fleet_sim import FakeRTDB  # imports the Pi device manager, so only when needed
+
+    fake = FakeRTDB()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(fake.serve("127.0.0.1", 0), loop).result(5)
+    port = server.sockets[0].getsockname()[1]
+    yield fake, f"http://127.0.0.1:{port}", loop
+
+    async def shutdown():
+        server.close()
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
@@ -0,0 +1,21 @@
+import chat_instrumentation
+
+
+def test_spans_are_free_until_enabled(monkeypatch):
+    monkeypatch.setattr(chat_instrumentation, "_spans", {})
+    with chat_instrumentation.span("chat.llm"):
+        pass
+    assert chat_instrumentation.span_report()["spans"] == {}
+
+    monkeypatch.setattr(chat_instrumentation, "_enabled", True)
+    with chat_instrumentation.span("chat.llm"):
+        pass
+    try:
+        with chat_instrumentation.span("chat.llm"):
+            raise TimeoutError
+    except TimeoutError:
+        pass
+    report = chat_instrumentation.span_report()
+    assert report["spans"]["chat.llm"]["count"] == 2
+    assert report["spans"]["chat.llm"]["errors"] == 1
+    assert report["active"] == []
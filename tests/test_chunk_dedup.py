@@ -0,0 +1,77 @@
+from dataclasses import dataclass, field
+
+from chunk_dedup import DEDUP_THRESHOLD, NearDuplicateIndex, dedup_chunks, minhash, shingles, similarity
+
+PASSAGE = ("Water the seedlings early in the morning so the leaves dry before the midday sun. "
+           "Keep soil moisture between forty and sixty percent during the first three weeks, "
+           "then reduce watering gradually as the roots grow deeper into the bed and the plants "
+           "start to flower. Check the drip lines every week for clogged emitters.")
+OTHER = ("Apply nitrogen fertilizer in two split doses, one at planting and one six weeks later, "
+         "and never on waterlogged soil. Test the pH every season and add lime when it falls "
+         "below six, since most vegetables take up phosphorus poorly in acidic ground.")
+
+
+@dataclass
+class Chunk:
+    page_content: str
+    metadata: dict = field(default_factory=dict)
+
+
+def jaccard(a: str, b: str) -> float:
+    sa, sb = shingles(a), shingles(b)
+    return len(sa & sb) / len(sa | sb)
+
+
+def test_shingles_ignore_case_and_punctuation():
+    assert shingles("Keep the SOIL moist!") == shingles("keep the soil, moist")
+    assert shingles("two words") == {"two words"}
+
+
+def test_minhash_estimates_jaccard():
+    edited = PASSAGE.replace("forty", "thirty").replace("every week", "every month")
+    half = PASSAGE[:len(PASSAGE) // 2] + OTHER[len(OTHER) // 2:]
+    for text in (PASSAGE, edited, half, OTHER):
+        assert abs(similarity(minhash(PASSAGE), minhash(text)) - jaccard(PASSAGE, text)) < 0.1
+    assert minhash(PASSAGE).tolist() == minhash(PASSAGE.upper()).tolist()  # fixed seed, normalized text
+
+
+def test_threshold_separates_edits_from_different_passages():
+    index = NearDuplicateIndex()
+    index.add("a", minhash(PASSAGE))
+
+    key, score = index.find(minhash(PASSAGE.replace("morning", "evening")))
+    assert key == "a" and score >= DEDUP_THRESHOLD
+    half = PASSAGE[:len(PASSAGE) // 2] + OTHER[len(OTHER) // 2:]
+    assert index.find(minhash(half))[0] is None
+    assert index.find(minhash(OTHER)) == (None, 0.0)  # shares no band, so never compared
+
+
+def test_batch_and_stored_duplicates_are_merged():
+    stored = {"ids": ["s1"], "documents": [PASSAGE], "metadatas": [{"source": "docs/manual_v1.pdf", "page": 0}]}
+    chunks = [
+        Chunk(OTHER, {"source": "docs/manual_v2.pdf", "page": 4}),
+        Chunk(OTHER + " ", {"source": "docs/manual_v3.pdf", "page": 4}),
+        Chunk(PASSAGE.replace("morning", "evening"), {"source": "docs/manual_v2.pdf", "page": 0}),
+    ]
+
+    result = dedup_chunks(chunks, ["n1", "n2", "n3"], stored)
+
+    assert result.kept_ids == ["n1"]
+    assert result.kept[0].metadata["duplicate_sources"] == "manual_v3.pdf p5"
+    assert result.stored_updates == {"s1": {"source": "docs/manual_v1.pdf", "page": 0, "duplicate_count": 1,
+                                            "duplicate_sources": "manual_v2.pdf p1"}}
+    assert (result.within_batch, result.against_stored, result.dropped) == (1, 1, 2)
+
+
+def test_reingesting_a_file_is_not_its_own_duplicate():
+    metadata = {"source": "docs/manual_v1.pdf", "page": 0}
+    stored = {"ids": ["s1"], "documents": [PASSAGE], "metadatas": [metadata]}
+
+    result = dedup_chunks([Chunk(PASSAGE, dict(metadata))], ["n1"], stored)
+    assert result.kept == [] and result.stored_updates == {}
+    assert (result.already_stored, result.dropped) == (1, 0)
+
+    # A copy recorded on an earlier run is not recorded again
+    stored["metadatas"] = [{**metadata, "duplicate_count": 1, "duplicate_sources": "manual_v2.pdf p1"}]
+    result = dedup_chunks([Chunk(PASSAGE, {"source": "manual_v2.pdf", "page": 0})], ["n1"], stored)
+    assert result.stored_updates == {} and result.already_stored == 1
@@ -0,0 +1,177 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+from client_limits import ClientRateLimiter, FairScheduler, FirebaseTokenVerifier, client_key
+
+PROJECT = "durian-test"
+SLOTS = 2
+
+
+class FakeLLM:
+    """Takes DELAY seconds per answer and records how many answers ran at once."""
+
+    DELAY = 0.05
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def invoke(self) -> None:
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.DELAY)
+        with self._lock:
+            self.active -= 1
+
+
+def load_test(fair: bool) -> tuple[dict, FakeLLM]:
+    """One noisy client sends 60 requests at once, then three others send two each."""
+    limiter = ClientRateLimiter(rate=2.0, burst=30, max_clients=100)
+    scheduler = FairScheduler(SLOTS, max_queued_per_client=100)
+    llm = FakeLLM()
+    results: dict[str, list] = {}
+    lock = threading.Lock()
+
+    def request(client: str):
+        started = time.monotonic()
+        if not limiter.check(client).allowed:
+            outcome = 429
+        elif not scheduler.acquire(client if fair else "everyone", timeout=10):
+            outcome = 503
+        else:
+            try:
+                llm.invoke()
+                outcome = 200
+            finally:
+                scheduler.release()
+        with lock:
+            results.setdefault(client, []).append((outcome, time.monotonic() - started))
+
+    threads = [threading.Thread(target=request, args=("noisy",)) for _ in range(60)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.02)  # the flood is queued before the others arrive
+    polite = [threading.Thread(target=request, args=(f"user{i}",)) for i in range(3) for _ in range(2)]
+    for thread in polite:
+        thread.start()
+    for thread in threads + polite:
+        thread.join()
+    return results, llm
+
+
+def slowest_polite(results: dict) -> float:
+    return max(latency for client, rows in results.items() if client != "noisy" for _, latency in rows)
+
+
+def test_round_robin_keeps_other_clients_fast():
+    fifo, _ = load_test(fair=False)
+    fair, llm = load_test(fair=True)
+    noisy = [outcome for outcome, _ in fair["noisy"]]
+    assert noisy.count(429) >= 25, "burst of 30 not enforced"
+    assert llm.peak <= SLOTS, "more upstream calls than slots"
+    assert slowest_polite(fair) < slowest_polite(fifo) / 3, "other clients still wait behind the noisy one"
+
+
+def test_limiter_state_is_bounded():
+    limiter = ClientRateLimiter(rate=1.0, burst=1, max_clients=100)
+    for i in range(150):
+        limiter.check(f"idle{i}")
+    assert len(limiter) == 100
+
+
+def test_rate_limit_headers():
+    limiter = ClientRateLimiter(rate=1.0, burst=1, max_clients=10)
+    assert limiter.check("a", now=0.0).allowed
+    denied = limiter.check("a", now=0.5)
+    assert not denied.allowed
+    assert denied.headers()["Retry-After"] == "1"
+
+
+def test_scheduler_rejects_when_client_queue_is_full():
+    scheduler = FairScheduler(1, max_queued_per_client=1)
+    assert scheduler.acquire("a", timeout=0)
+    waiter = threading.Thread(target=scheduler.acquire, args=("a", 1))
+    waiter.start()
+    time.sleep(0.05)
+    assert not scheduler.acquire("a", timeout=0), "queue of one accepted a second waiter"
+    scheduler.release()
+    waiter.join()
+
+
+def fake_verifier() -> FirebaseTokenVerifier:
+    def decode(token):
+        if not token.startswith("valid-"):
+            raise ValueError("bad signature")
+        return {"iss": f"https://securetoken.google.com/{PROJECT}", "user_id": token[6:], "exp": time.time() + 3600}
+
+    return FirebaseTokenVerifier(PROJECT, decode=decode)
+
+
+def test_client_key_uses_verified_uid_only():
+    verify = fake_verifier()
+    assert client_key({"Authorization": "Bearer valid-u1"}, "10.0.0.1", verify=verify) == "uid:u1"
+    # made-up credentials do not buy a fresh bucket
+    assert client_key({"Authorization": "Bearer forged"}, "10.0.0.1", verify=verify) == "ip:10.0.0.1"
+    assert client_key({"X-Client-Id": "rotating-1"}, "10.0.0.1", verify=verify) == "ip:10.0.0.1"
+    assert client_key({"Authorization": "Bearer valid-u1"}, "10.0.0.1") == "ip:10.0.0.1"
+
+
+def test_client_key_behind_proxy():
+    headers = {"X-Forwarded-For": "203.0.113.5, 10.0.0.2"}
+    assert client_key(headers, "127.0.0.1", trust_proxy=True) == "ip:203.0.113.5"
+    assert client_key(headers, "127.0.0.1") == "ip:127.0.0.1"
+
+
+def test_verifier_rejects_other_projects_and_caches_valid_tokens():
+    calls = []
+
+    def decode(token):
+        calls.append(token)
+        return {"iss": "https://securetoken.google.com/other-project", "user_id": "u1", "exp": time.time() + 3600}
+
+    assert FirebaseTokenVerifier(PROJECT, decode=decode)("token") is None
+
+    verify = fake_verifier()
+    verify._decode = lambda token, decode=verify._decode: calls.append(token) or decode(token)
+    calls.clear()
+    assert verify("valid-u2") == verify("valid-u2") == "u2"
+    assert calls == ["valid-u2"]
+
+
+def test_verifier_checks_signature_audience_and_expiry():
+    pytest.importorskip("google.auth")
+    pytest.importorskip("cryptography")
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+    from google.auth import crypt, jwt
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken")])
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(datetime.datetime(2020, 1, 1))
+            .not_valid_after(datetime.datetime(2100, 1, 1)).sign(key, hashes.SHA256()))
+    private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption()).decode()
+    signer = crypt.RSASigner.from_string(private_pem, "k1")
+    now = int(time.time())
+
+    def token(**claims):
+        payload = {"iss": f"https://securetoken.google.com/{PROJECT}", "aud": PROJECT, "sub": "u1",
+                   "user_id": "u1", "iat": now, "exp": now + 3600, **claims}
+        return jwt.encode(signer, payload).decode()
+
+    verify = FirebaseTokenVerifier(PROJECT)
+    verify._certs = {"k1": cert.public_bytes(serialization.Encoding.PEM).decode()}
+    verify._certs_fetched = time.monotonic()  # no download of Google's real certificates
+
+    assert verify(token()) == "u1"
+    assert verify(token(aud="other-project")) is None
+    assert verify(token(iat=now - 7200, exp=now - 3600)) is None
+    assert verify(token()[:-4] + "AAAA") is None
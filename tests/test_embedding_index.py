@@ -0,0 +1,60 @@
+import numpy as np
+
+from embedding_index import Int8Index, quantize_int8, truncate
+from eval_embeddings import evaluate
+
+
+def unit_vectors(rows: int, dims: int, seed: int = 0) -> np.ndarray:
+    return truncate(np.random.default_rng(seed).normal(size=(rows, dims)), None)
+
+
+def test_int8_codes_reconstruct_within_half_a_step():
+    vectors = unit_vectors(50, 64)
+    vectors[0] = 0.0
+    codes, scales = quantize_int8(vectors)
+
+    assert codes.dtype == np.int8 and scales.dtype == np.float32
+    assert np.abs(codes).max() == 127  # every nonzero row uses the full range
+    assert scales[0] == 1.0 and not codes[0].any()
+    error = np.abs(codes * scales[:, None] - vectors)
+    assert (error <= scales[:, None] / 2 + 1e-7).all()
+
+
+def test_truncate_renormalizes():
+    vectors = truncate(unit_vectors(10, 64), 16)
+    assert vectors.shape == (10, 16)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+
+
+def test_int8_search_ranks_like_float(tmp_path):
+    docs = unit_vectors(300, 64)
+    index = Int8Index.build([f"doc{i}" for i in range(len(docs))], docs)
+    path = tmp_path / "collection.int8.npz"
+    index.save(path)
+    index = Int8Index.load(path)
+
+    assert index.nbytes < docs.nbytes / 3
+    for i in range(0, 300, 30):
+        results = index.search(docs[i] * 3, 5)  # queries are renormalized
+        exact = np.argsort(-(docs @ docs[i]))[:5]
+        assert results[0][0] == f"doc{i}" and abs(results[0][1] - 1.0) < 0.02
+        # near-ties may swap places, but the same chunks come back
+        assert {doc_id for doc_id, _ in results} == {f"doc{j}" for j in exact}
+    assert Int8Index.load(tmp_path / "missing.npz") is None
+
+
+def test_recall_against_full_size_search():
+    docs = unit_vectors(400, 128)
+    queries = truncate(docs[:40] + 0.3 * unit_vectors(40, 128, seed=1), None)
+    results = {(r["dims"], r["kind"]): r for r in evaluate(docs, queries, [32], k=5)}
+
+    assert results[(128, "float32")]["recall"] == 1.0
+    assert results[(128, "int8")]["recall"] >= 0.95
+    assert results[(32, "float32")]["recall"] < results[(128, "int8")]["recall"]
+    assert results[(128, "int8")]["search_mb"] < results[(128, "float32")]["search_mb"] / 3
+
+
+def test_self_queries_leave_the_chunk_out():
+    docs = unit_vectors(100, 32)
+    results = evaluate(docs, docs[:10], [], k=3, self_queries=list(range(10)))
+    assert all(r["recall"] >= 0.9 for r in results)  # not inflated by each chunk finding itself
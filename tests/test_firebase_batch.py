@@ -0,0 +1,86 @@
+import json
+
+import firebase_batch
+from firebase_batch import WriteCoalescer
+
+
+class FakeClient:
+    def __init__(self, ok: bool = True):
+        self.ok = ok
+        self.patches = []
+
+    def patch(self, path, data):
+        self.patches.append((path, data))
+        return self.ok
+
+
+def writer(client, root, journal_dir):
+    return WriteCoalescer(client, root, journal_dir, window=60)  # flushed by hand
+
+
+def test_writes_collapse_into_one_patch(tmp_path):
+    client = FakeClient()
+    w = writer(client, "users/u1/devices/pi", tmp_path)
+    w.update("device_info", {"name": "Pi", "cpu": {"temp": 40, "load": 1}})
+    w.update("device_info", {"name": "Pi", "cpu": {"temp": 41, "load": 1}})
+    w.set("camera_feeds/cam1/status", "live")
+
+    assert w.flush()
+    assert client.patches == [("users/u1/devices/pi", {
+        "device_info/name": "Pi",
+        "device_info/cpu": {"temp": 41, "load": 1},  # the later leaf folds into the queued node
+        "camera_feeds/cam1/status": "live",
+    })]
+    w.close()
+
+
+def test_close_does_not_reschedule(tmp_path):
+    client = FakeClient(ok=False)
+    w = writer(client, "users/u1/devices/pi", tmp_path)
+    w.set("device_info/name", "Pi")
+    w.close()
+
+    assert w._timer is None
+    assert len(client.patches) == 1
+    assert not w.flush()  # closed: no further attempts
+    w.set("device_info/zone", "garage")
+    assert w._timer is None
+    assert len(client.patches) == 1
+    assert json.loads(w.journal_file.read_text())["writes"] == [["device_info/name", "Pi"]]
+
+
+def test_each_root_keeps_its_own_journal(tmp_path):
+    client = FakeClient(ok=False)
+    old = writer(client, "users/u1/devices/pi", tmp_path)
+    old.set("device_info/name", "old owner")
+    old.close()
+
+    new = writer(client, "users/u2/devices/pi", tmp_path)
+    new.set("device_info/name", "new owner")
+    new.close()
+
+    journals = {json.loads(p.read_text())["root"]: p for p in tmp_path.glob("*.json")}
+    assert set(journals) == {"users/u1/devices/pi", "users/u2/devices/pi"}
+
+    # The old owner's writes replay when that root comes back, and nowhere else
+    client.ok = True
+    client.patches.clear()
+    again = writer(client, "users/u1/devices/pi", tmp_path)
+    assert again.flush()
+    assert client.patches == [("users/u1/devices/pi", {"device_info/name": "old owner"})]
+    assert not journals["users/u1/devices/pi"].exists()
+    assert journals["users/u2/devices/pi"].exists()
+
+
+def test_dropped_writes_are_sent_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(firebase_batch, "JOURNAL_MAX_PATHS", 2)
+    client = FakeClient()
+    w = writer(client, "users/u1/devices/pi", tmp_path)
+    w.update("a", {"x": 1})
+    w.update("b", {"y": 1})
+    w.update("c", {"z": 1})  # pushes a/x out of the queue
+    assert list(w.pending) == ["b/y", "c/z"]
+
+    w.update("a", {"x": 1})  # unchanged, but it never went out
+    assert "a/x" in w.pending
+    w.close()
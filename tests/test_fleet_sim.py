@@ -0,0 +1,61 @@
+import threading
+import time
+
+import raspi_device_manager as rdm
+
+
+def test_put_patch_get_round_trip(rtdb):
+    fake, db_url, loop = rtdb
+    client = rdm.FirebaseClient(db_url)
+    root = rdm.device_root("owner", "pi_0200000000AA")
+
+    before = int(time.time() * 1000)
+    assert client.put(f"{root}/device_info", {"name": "Pi", "last_online": rdm.SERVER_TIMESTAMP})
+    assert client.patch(root, {"device_info/zone": "garage", "camera_feeds/cam1": {"url": "u"}})
+    # null in a PATCH deletes, and empty parents disappear as in Firebase
+    assert client.patch(root, {"camera_feeds/cam1": None})
+
+    info = client.get(f"{root}/device_info")
+    assert info["name"] == "Pi" and info["zone"] == "garage"
+    assert info["last_online"] >= before
+    assert client.get(f"{root}/camera_feeds") is None
+    assert client.get("users/owner/devices", params={"shallow": "true"}) == {"pi_0200000000AA": True}
+    assert fake.requests["PUT"] == 1 and fake.requests["PATCH"] == 2
+
+
+def test_outage_fails_writes_until_it_ends(rtdb, monkeypatch):
+    fake, db_url, loop = rtdb
+    monkeypatch.setattr(rdm, "HTTP_RETRIES", 0)
+    client = rdm.FirebaseClient(db_url)
+
+    fake.set_outage(True)
+    assert not client.patch("users/owner/devices/pi", {"device_info/name": "Pi"})
+    fake.set_outage(False)
+    assert client.patch("users/owner/devices/pi", {"device_info/name": "Pi"})
+    assert fake.get_node(["users", "owner", "devices", "pi", "device_info"]) == {"name": "Pi"}
+
+
+def test_stream_sees_dashboard_writes(rtdb):
+    fake, db_url, loop = rtdb
+    snapshots = []
+    claimed = threading.Event()
+    stop = threading.Event()
+
+    def on_change(snapshot):
+        snapshots.append(dict(snapshot or {}))
+        if rdm.is_claimed(snapshot):
+            claimed.set()
+
+    thread = threading.Thread(target=rdm.firebase_stream,
+                              args=("device_registry/pi_1", on_change, stop, db_url), daemon=True)
+    thread.start()
+    deadline = time.time() + 5
+    while not fake.streams and time.time() < deadline:
+        time.sleep(0.01)
+    # as the simulated dashboard does; stream queues belong to the server's loop
+    loop.call_soon_threadsafe(fake.write, ["device_registry", "pi_1"], {"claimed": True, "owner_uid": "owner"})
+
+    assert claimed.wait(5)
+    stop.set()
+    assert snapshots[0] == {}  # the initial put of the still-empty node
+    assert snapshots[-1] == {"claimed": True, "owner_uid": "owner"}
@@ -0,0 +1,97 @@
+import time
+
+from index_versions import HotSwapIndex, current_version, new_version, prune, publish
+
+
+def wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class Opener:
+    """Records open/release calls; opening a version whose name is in `broken` fails."""
+
+    def __init__(self):
+        self.events = []
+        self.broken = set()
+
+    def open(self, path):
+        if path.name in self.broken:
+            raise OSError("corrupt")
+        self.events.append(("open", path.name))
+        return f"index {path.name}"
+
+    def release(self, index):
+        self.events.append(("release", index.split()[-1]))
+
+
+def test_swap_waits_for_pinned_requests(tmp_path):
+    v1 = new_version(tmp_path)
+    publish(tmp_path, v1)
+    opener = Opener()
+    index = HotSwapIndex(tmp_path, opener.open, opener.release, check_interval=0)
+
+    with index.use() as first:
+        v2 = new_version(tmp_path)
+        publish(tmp_path, v2)
+        with index.use():
+            pass  # notices CURRENT and loads v2 in the background
+        wait_until(lambda: index.path == v2)
+        with index.use() as second:
+            assert second == f"index {v2.name}"
+        assert first == f"index {v1.name}"  # still pinned, so not released
+        assert opener.events == [("open", v1.name), ("open", v2.name)]
+    assert opener.events[-1] == ("release", v1.name)
+
+
+def test_idle_version_is_released_on_swap(tmp_path):
+    publish(tmp_path, new_version(tmp_path))
+    opener = Opener()
+    index = HotSwapIndex(tmp_path, opener.open, opener.release, check_interval=0)
+    old = index.path
+
+    v2 = new_version(tmp_path)
+    publish(tmp_path, v2)
+    with index.use():
+        pass
+    wait_until(lambda: ("release", old.name) in opener.events)
+    assert opener.events == [("open", old.name), ("open", v2.name), ("release", old.name)]
+
+
+def test_broken_version_keeps_the_live_one(tmp_path):
+    v1 = new_version(tmp_path)
+    publish(tmp_path, v1)
+    opener = Opener()
+    index = HotSwapIndex(tmp_path, opener.open, opener.release, check_interval=0)
+
+    v2 = new_version(tmp_path)
+    opener.broken.add(v2.name)
+    publish(tmp_path, v2)
+    with index.use():
+        pass
+    wait_until(lambda: index._loading is None)
+    with index.use() as live:
+        assert live == f"index {v1.name}"
+    assert index.path == v1 and opener.events == [("open", v1.name)]
+
+
+def test_prune_never_removes_the_live_version(tmp_path):
+    versions = [new_version(tmp_path) for _ in range(5)]  # names sort oldest first
+    publish(tmp_path, versions[0])  # rolled back to the oldest
+
+    removed = prune(tmp_path, keep=2)
+
+    assert sorted(removed) == sorted(versions[1:3])
+    assert current_version(tmp_path) == versions[0] and versions[0].exists()
+    assert all(path.exists() for path in versions[3:])
+
+
+def test_first_versioned_ingest_copies_the_legacy_layout(tmp_path):
+    (tmp_path / "chroma.sqlite3").write_text("legacy")
+    assert current_version(tmp_path) == tmp_path
+
+    version = new_version(tmp_path)
+    assert (version / "chroma.sqlite3").read_text() == "legacy"
+    assert not (version / "versions").exists()
@@ -0,0 +1,139 @@
+import base64
+import json
+import time
+
+import pytest
+
+from intent_router import IntentRouter, RouterStats, SensorSnapshots, sensor_reply
+
+MESSAGES = [
+    ("hi", "greeting"), ("Hello there!", "greeting"), ("thanks!", "thanks"), ("ok thank you", "thanks"),
+    ("bye", "goodbye"), ("what can you do?", "help"),
+    ("What's the soil moisture in zone A?", "sensor"), ("pH zone b", "sensor"),
+    ("current readings", "sensor"), ("how much nitrogen is in zone A now", "sensor"),
+    ("show me the temperature", "sensor"), ("NPK levels?", "sensor"),
+    ("Why is the soil moisture low in zone A and what should I do?", "open"),
+    ("How should I fertilize durian trees before flowering?", "open"),
+    ("When is the best time to harvest Monthong durian?", "open"),
+    ("What causes leaf blight on durian?", "open"),
+    ("Is a pH of 5.5 ok for durian?", "open"), ("is the moisture too low", "open"),
+    ("good morning", "greeting"), ("sensor data", "sensor"),
+    ("Tell me about durian pests in the rainy season", "open"),
+    ("What temperature do durian trees need?", "open"), ("What pH does durian prefer?", "open"),
+    ("how does salinity affect durian", "open"), ("what is nitrogen used for in durian", "open"),
+    ("What temperature kills durian flowers?", "open"), ("what's my soil moisture", "sensor"),
+    ("what pH do my durian trees need", "open"), ("what is the ph now", "sensor"),
+]
+
+
+def make_devices(now_ms=None):
+    now_ms = time.time() * 1000 if now_ms is None else now_ms
+    return {
+        "esp32_a1": {"name": "Soil A1", "zone": "Zone A", "type": "sensor",
+                     "sensor_data": {"moisture": 41.5, "temperature": 28.2, "ec": 512, "ph": 6.1,
+                                     "n": 40, "p": 18, "k": 95, "updated_at": now_ms - 90_000}},
+        "esp32_b1": {"name": "Soil B1", "zone": "Zone B", "type": "sensor",
+                     "sensor_data": {"moisture": 63.0, "temperature": 27.4, "ec": 430, "ph": 6.6,
+                                     "n": 35, "p": 22, "k": 88, "updated_at": now_ms - 20_000}},
+        "pi_cam": {"name": "Camera", "zone": "A", "type": "camera_server"},
+    }
+
+
+def token(uid="demo"):
+    claims = base64.urlsafe_b64encode(json.dumps({"user_id": uid}).encode()).decode().rstrip("=")
+    return f"x.{claims}.y"
+
+
+class FakeFetch:
+    """Stands in for the Realtime Database reads; counts calls."""
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.calls = []
+
+    def __call__(self, uid, id_token):
+        self.calls.append(uid)
+        return self.devices
+
+
+@pytest.fixture
+def fetch():
+    return FakeFetch(make_devices())
+
+
+@pytest.mark.parametrize("message, expected", MESSAGES)
+def test_messages_route_to_expected_intent(fetch, message, expected):
+    route = IntentRouter(SensorSnapshots(fetch)).route(message, token())
+    assert route.intent == expected
+    assert (route.reply is None) == (expected == "open")
+
+
+def test_sensor_question_answers_from_snapshot(fetch):
+    route = IntentRouter(SensorSnapshots(fetch)).route("What's the soil moisture in zone A?", token())
+    assert route.reply == "Zone A (Soil A1): soil moisture 41.5% (1 min ago)"
+    assert fetch.calls == ["demo"]
+
+
+def test_sensor_reply_formats_metrics_and_age():
+    devices = make_devices()
+    assert sensor_reply(devices, ["ph"], "b") == "Zone B (Soil B1): pH 6.6 (just now)"
+    assert sensor_reply(devices, ["n", "p", "k"], None).splitlines() == [
+        "Zone A (Soil A1): nitrogen 40 mg/kg, phosphorus 18 mg/kg, potassium 95 mg/kg (1 min ago)",
+        "Zone B (Soil B1): nitrogen 35 mg/kg, phosphorus 22 mg/kg, potassium 88 mg/kg (just now)",
+    ]
+    assert sensor_reply(devices, [], "a") == (
+        "Zone A (Soil A1): soil moisture 41.5%, soil temperature 28.2°C, pH 6.1, EC 512 µS/cm, "
+        "nitrogen 40 mg/kg, phosphorus 18 mg/kg, potassium 95 mg/kg (1 min ago)")
+
+    stale = make_devices(time.time() * 1000 - 3 * 3600_000)
+    assert sensor_reply(stale, ["ph"], "a").endswith(" (3 h ago)")
+
+
+def test_sensor_reply_skips_cameras_and_missing_zones():
+    devices = make_devices()
+    devices["pi_sensor"] = {"zone": "Zone C", "type": "sensor", "sensor_data": {"ph": 7.0}}
+    assert sensor_reply(devices, ["ph"], "c") == (
+        "I couldn't find any sensor readings in zone C. Check that the sensor is online in the dashboard.")
+    assert sensor_reply({"pi_cam": devices["pi_cam"]}, [], None) == (
+        "I couldn't find any sensor readings. Check that the sensor is online in the dashboard.")
+
+
+def test_snapshots_are_cached_per_token(fetch):
+    snapshots = SensorSnapshots(fetch, ttl=60)
+    assert snapshots.get(token()) is fetch.devices
+    assert snapshots.get(token()) is fetch.devices
+    assert fetch.calls == ["demo"]
+
+    snapshots.get(token("other"))
+    assert fetch.calls == ["demo", "other"]
+
+    assert snapshots.get("not-a-jwt") is None
+    assert fetch.calls == ["demo", "other"]
+
+
+def test_failed_fetch_is_not_cached():
+    fetch = FakeFetch(None)
+    router = IntentRouter(SensorSnapshots(fetch))
+    route = router.route("current readings", token())
+    assert route.reply == "I couldn't read your sensor data right now. Please try again in a moment."
+
+    fetch.devices = make_devices()
+    assert router.route("current readings", token()).reply.startswith("Zone A (Soil A1)")
+    assert len(fetch.calls) == 2
+
+
+def test_sensor_question_without_token_asks_to_sign_in(fetch):
+    route = IntentRouter(SensorSnapshots(fetch)).route("current readings")
+    assert (route.intent, route.reply) == ("sensor", "Sign in to the dashboard to ask about your sensor readings.")
+    assert fetch.calls == []
+
+
+def test_router_stats_report(fetch):
+    router, stats = IntentRouter(SensorSnapshots(fetch)), RouterStats()
+    for message in ("hi", "current readings", "How should I fertilize durian trees before flowering?"):
+        stats.record(router.route(message, token()), 0.002)
+    report = stats.report()
+    assert report["requests"] == 3
+    assert report["local"] == 2
+    assert report["by_intent"] == {"greeting": 1, "sensor": 1, "open": 1}
+    assert report["local_p50_ms"] == 2.0
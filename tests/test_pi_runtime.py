@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import pi_runtime
+from pi_runtime import Backoff, supervise, supervise_manager
+
+
+def test_backoff_doubles_caps_and_resets_after_a_stable_run():
+    backoff = Backoff("uploader")
+    delays = [backoff.next_delay(uptime=1) for _ in range(10)]
+    assert delays[:4] == [2, 4, 8, 16]
+    assert max(delays) == pi_runtime.RESTART_BACKOFF_MAX
+    assert backoff.next_delay(uptime=pi_runtime.RESTART_STABLE) == pi_runtime.RESTART_DELAY
+
+
+def test_supervise_restarts_a_crashed_component(monkeypatch):
+    monkeypatch.setattr(pi_runtime, "RESTART_DELAY", 0.01)
+    runs = []
+
+    async def component():
+        runs.append(len(runs))
+        if len(runs) < 3:
+            raise RuntimeError("boom")
+
+    asyncio.run(asyncio.wait_for(supervise("tracker", component, asyncio.Event()), 5))
+    assert len(runs) == 3  # two crashes, then a clean return ends supervision
+
+
+def test_supervise_stops_waiting_on_shutdown():
+    async def scenario():
+        stop = asyncio.Event()
+        runs = []
+
+        async def component():
+            runs.append(1)
+            raise RuntimeError("boom")
+
+        task = asyncio.create_task(supervise("uploader", component, stop))
+        await asyncio.sleep(0.05)  # crashed once, now in the 2s restart delay
+        stop.set()
+        await asyncio.wait_for(task, 1)
+        return runs
+
+    assert asyncio.run(scenario()) == [1]
+
+
+def test_manager_is_rerun_until_stopped(monkeypatch):
+    monkeypatch.setattr(pi_runtime, "RESTART_DELAY", 0.01)
+    stop = threading.Event()
+    calls = []
+
+    def main(stop_event, **kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        if len(calls) == 3:
+            stop_event.set()
+        # otherwise main() returned on an error, as it does when Firebase is unreachable
+
+    monkeypatch.setattr(pi_runtime.manager, "main", main)
+    supervise_manager(stop, state="state")
+    assert calls == [{"state": "state"}] * 3
@@ -0,0 +1,73 @@
+import os
+from typing import Any
+
+import pytest
+
+from prompt_builder import RAG_RULES, CacheStats, build_messages, serialize, to_gemini, usage_tokens
+
+
+class FakeProvider:
+    """Caches prefixes like the real providers: cached tokens = common prefix with an earlier prompt."""
+
+    def __init__(self):
+        self.prompts: list[bytes] = []
+
+    def invoke(self, messages: list[dict[str, str]]) -> dict[str, Any]:
+        prompt = serialize(messages)
+        cached = max((len(os.path.commonprefix([prompt, p])) for p in self.prompts), default=0)
+        self.prompts.append(prompt)
+        return {"input_tokens": len(prompt) // 4, "input_token_details": {"cache_read": cached // 4}}
+
+
+class Doc:
+    def __init__(self, source, page, text):
+        self.metadata = {"source": source, "page": page}
+        self.page_content = text
+
+
+@pytest.fixture
+def docs():
+    return [Doc("data/durian.pdf", page, f"Chunk about durian care, page {page}. " * 20) for page in range(5)]
+
+
+def test_prefix_is_identical_across_questions(docs):
+    provider, stats = FakeProvider(), CacheStats()
+    calls = [
+        ("How often should I water?", [], docs),
+        ("And in the dry season?", [["How often should I water?", "Twice a week."]], docs[::-1]),
+        ("Which fertilizer?", [{"role": "user", "content": "How often should I water?"},
+                               {"role": "assistant", "content": "Twice a week."}], docs[2:] + docs[:2]),
+    ]
+    prefixes = []
+    for question, history, retrieved in calls:
+        messages = build_messages(RAG_RULES, question, history, retrieved)
+        prefixes.append(serialize(messages[:2]))
+        stats.record(provider.invoke(messages))
+
+    assert len(set(prefixes)) == 1, "system + knowledge prefix differs between calls"
+    assert all(p.startswith(prefixes[0][:-1]) for p in provider.prompts), "prompt does not start with the prefix"
+    assert stats.cached_tokens > 0, "fake provider reported no cached tokens"
+
+
+def test_question_comes_last(docs):
+    history = [["How often should I water?", "Twice a week."]]
+    messages = build_messages(RAG_RULES, "Which fertilizer?", history, docs)
+    assert messages[0] == {"role": "system", "content": RAG_RULES}
+    assert messages[-1] == {"role": "user", "content": "Which fertilizer?"}
+    assert [m["role"] for m in messages[-3:-1]] == ["user", "assistant"]
+
+
+def test_gemini_gets_rules_and_knowledge_as_system_instruction(docs):
+    system, contents = to_gemini(build_messages(RAG_RULES, "Which fertilizer?", [], docs))
+    assert system.startswith(RAG_RULES) and "The knowledge:" in system
+    assert contents == [{"role": "user", "parts": [{"text": "Which fertilizer?"}]}]
+
+
+def test_usage_tokens_reads_langchain_and_gemini_usage():
+    class GeminiUsage:
+        prompt_token_count = 100
+        cached_content_token_count = 64
+
+    assert usage_tokens({"input_tokens": 100, "input_token_details": {"cache_read": 64}}) == (100, 64)
+    assert usage_tokens(GeminiUsage()) == (100, 64)
+    assert usage_tokens(None) == (0, 0)
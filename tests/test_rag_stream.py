@@ -0,0 +1,100 @@
+import asyncio
+import contextlib
+import time
+
+from prompt_builder import CacheStats
+from rag_stream import make_stream_response
+
+CONCURRENCY_LIMIT = 16  # chatbot.py reads CHATBOT_CONCURRENCY_LIMIT
+USERS = 20
+
+
+class Chunk:
+    def __init__(self, content: str, usage_metadata: dict | None = None):
+        self.content = content
+        self.usage_metadata = usage_metadata
+
+
+class FakeLLM:
+    """Streams TOKENS tokens, one every TOKEN_DELAY seconds, and counts closed streams."""
+
+    TOKENS = 20
+    TOKEN_DELAY = 0.01
+
+    def __init__(self):
+        self.finished = 0
+        self.closed_early = 0
+
+    async def astream(self, messages):
+        sent = 0
+        try:
+            for sent in range(1, self.TOKENS + 1):
+                await asyncio.sleep(self.TOKEN_DELAY)
+                yield Chunk("word ")
+            yield Chunk("", {"input_tokens": 1000, "input_token_details": {"cache_read": 768}})
+            self.finished += 1
+        finally:
+            if sent < self.TOKENS:
+                self.closed_early += 1
+
+
+async def fake_retrieve(message: str) -> list:
+    await asyncio.sleep(0.05)
+    return []
+
+
+def make_handler(llm: FakeLLM, stats: CacheStats | None = None):
+    return make_stream_response(fake_retrieve, llm, stats or CacheStats(), format_messages=lambda m: m)
+
+
+async def serve(handler, users: int, limit: int) -> float:
+    """Run users chats through a queue that lets limit of them run at once (like Gradio's)."""
+    gate = asyncio.Semaphore(limit)
+
+    async def user(i):
+        async with gate:
+            async for _ in handler(f"question {i}", []):
+                pass
+
+    started = time.monotonic()
+    await asyncio.gather(*(user(i) for i in range(users)))
+    return time.monotonic() - started
+
+
+def test_streams_growing_answer_and_records_cache_usage():
+    stats = CacheStats()
+    handler = make_handler(FakeLLM(), stats)
+
+    async def collect():
+        return [partial async for partial in handler("How often should I water?", [])]
+
+    partials = asyncio.run(collect())
+    assert partials[0] == "word " and partials[-1] == "word " * FakeLLM.TOKENS
+    assert (stats.requests, stats.prompt_tokens, stats.cached_tokens) == (1, 1000, 768)
+
+
+def test_concurrent_users_are_not_serialized():
+    handler = make_handler(FakeLLM())
+    serial = asyncio.run(serve(handler, USERS, 1))
+    parallel = asyncio.run(serve(handler, USERS, CONCURRENCY_LIMIT))
+    assert parallel < serial / 4, f"concurrent users still serialized ({parallel:.2f}s vs {serial:.2f}s)"
+
+
+def test_cancelled_session_closes_llm_stream():
+    llm = FakeLLM()
+    handler = make_handler(llm)
+
+    async def run():
+        async def consume():
+            async for _ in handler("cancel me", []):
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert llm.closed_early == 1, "cancelled session left the LLM stream running"
+    assert llm.finished == 0
@@ -0,0 +1,142 @@
+import copy
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import raspi_device_manager as rdm
+
+
+class StreamServer:
+    """
+    Stands in for the RTDB streaming endpoint. Each connection replays the next
+    session (a list of (event, data) pairs) as chunked text/event-stream, then
+    holds the connection open until close() unless the session ends in cancel.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = list(sessions)
+        self.paths = []
+        self.release = threading.Event()
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def write_chunk(self, text: str):
+                body = text.encode()
+                self.wfile.write(f"{len(body):x}\r\n".encode() + body + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                owner.paths.append(self.path)
+                session = owner.sessions.pop(0) if owner.sessions else []
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for event, data in session:
+                    self.write_chunk(f"event: {event}\ndata: {json.dumps(data)}\n\n")
+                if not session or session[-1][0] != "cancel":
+                    owner.release.wait(10)
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(*sessions):
+        server = StreamServer(sessions)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def stream(server, path, expected):
+    """Run firebase_stream until `expected` snapshots have arrived; return them."""
+    snapshots = []
+    done = threading.Event()
+    stop = threading.Event()
+
+    def on_change(snapshot):
+        snapshots.append(copy.deepcopy(snapshot))
+        if len(snapshots) >= expected:
+            done.set()
+
+    thread = threading.Thread(target=rdm.firebase_stream, args=(path, on_change, stop, server.url), daemon=True)
+    thread.start()
+    assert done.wait(5), f"got {snapshots}"
+    stop.set()
+    server.release.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    return snapshots
+
+
+def test_put_patch_and_keep_alive(serve):
+    server = serve([
+        ("put", {"path": "/", "data": {"name": "Pi", "claimed": False}}),
+        ("keep-alive", None),
+        ("patch", {"path": "/", "data": {"claimed": True, "zone": "garage"}}),
+        ("put", {"path": "/name", "data": None}),
+        ("put", {"path": "/cameras/cam1", "data": {"ok": 1}}),
+    ])
+
+    snapshots = stream(server, "device_registry/pi-1", 4)
+
+    assert server.paths == ["/device_registry/pi-1.json"]
+    assert snapshots == [
+        {"name": "Pi", "claimed": False},
+        {"name": "Pi", "claimed": True, "zone": "garage"},
+        {"claimed": True, "zone": "garage"},
+        {"claimed": True, "zone": "garage", "cameras": {"cam1": {"ok": 1}}},
+    ]
+
+
+def test_cancel_reconnects_with_a_fresh_snapshot(serve, monkeypatch):
+    monkeypatch.setattr(rdm, "STREAM_BACKOFF_MIN", 0.01)
+    server = serve(
+        [("put", {"path": "/", "data": {"name": "old"}}), ("cancel", "permission denied")],
+        [("put", {"path": "/", "data": {"name": "new"}})],
+    )
+
+    snapshots = stream(server, "device_registry/pi-1", 2)
+
+    assert len(server.paths) == 2
+    assert snapshots == [{"name": "old"}, {"name": "new"}]
+
+
+def test_wait_changed_sees_changes_made_before_the_wait(serve):
+    server = serve([("put", {"path": "/", "data": {"claimed": True}})])
+    listener = rdm.RegistryListener("pi-1", db_url=server.url)
+    data, synced, version = listener.snapshot()
+    assert (data, synced, version) == (None, False, 0)
+
+    listener.start()
+    try:
+        assert listener.wait_changed(version, 5)
+        # the event landed before this call, so it must not wait out the timeout
+        assert listener.wait_changed(version, 0)
+        data, synced, version = listener.snapshot()
+        assert (data, synced, version) == ({"claimed": True}, True, 1)
+        assert not listener.wait_changed(version, 0.05)
+    finally:
+        listener.stop()
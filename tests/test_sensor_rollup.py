@@ -0,0 +1,146 @@
+import json
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import requests
+
+from raspi_device_manager import FirebaseClient
+from sensor_rollup import (METRICS, RESOLUTIONS, RETENTION, DeviceRollup, RollupService, SeriesBuffer,
+                           bucket_start, rollup)
+
+OWNER = "owner"
+OFFSET_HOURS = 7
+
+
+def wait_until(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_rollup_buckets():
+    ts = np.array([0, 10, 59, 60, 130], dtype=np.float64)
+    values = np.array([[1, np.nan, 3, 5, 7],
+                       [np.nan, np.nan, np.nan, 4, np.nan]], dtype=np.float32)
+
+    keys, low, high, mean, count = rollup(ts, values, 60)
+
+    assert keys.tolist() == [0, 60, 120]
+    assert count.tolist() == [[2, 1, 1], [0, 1, 0]]
+    assert low[0].tolist() == [1, 5, 7] and high[0].tolist() == [3, 5, 7]
+    assert mean[0].tolist() == [2, 5, 7]
+    assert mean[1, 1] == 4 and np.isnan(mean[1, 0])
+
+
+def test_daily_buckets_follow_local_midnight():
+    offset = OFFSET_HOURS * 3600
+    before, after = 17 * 3600 - 60, 17 * 3600 + 60  # 23:59 and 00:01 local time
+    keys, *_ , count = rollup(np.array([before, after], dtype=np.float64),
+                              np.ones((1, 2), dtype=np.float32), RESOLUTIONS["1d"], offset)
+    assert keys.tolist() == [-offset, 86400 - offset]
+    assert count.tolist() == [[1, 1]]
+
+
+def test_expired_buckets_are_deleted_with_nulls():
+    device = DeviceRollup("esp32_1", SeriesBuffer())
+    first = 1_700_000_000
+    device.ingest({"moisture": 40, "updated_at": first * 1000}, time.time())
+    minute = bucket_start(first, 60)
+    patch = device.changes(0)
+    assert patch[f"1m/moisture/{minute}"] == [40, 40, 40, 1]
+    device.flushed(True, 0)
+
+    later = first + RETENTION["1m"] + 120
+    device.ingest({"moisture": 41, "updated_at": later * 1000}, time.time())
+    patch = device.changes(0)
+    assert all(patch[f"1m/{metric}/{minute}"] is None for metric in METRICS)
+    assert f"1h/moisture/{bucket_start(first, 3600)}" not in patch  # 1h buckets are kept 90 days
+    device.flushed(True, 0)
+    assert device.written["1m"] == [bucket_start(later, 60)]
+
+
+def test_failed_flush_is_retried():
+    device = DeviceRollup("esp32_1", SeriesBuffer())
+    device.ingest({"moisture": 40, "updated_at": 1_700_000_000_000}, time.time())
+    patch = device.changes(0)
+    device.flushed(False, 0)
+    assert device.changes(0) == patch
+
+
+def test_cursor_survives_a_restart():
+    device = DeviceRollup("esp32_1", SeriesBuffer())
+    reading = {"moisture": 40, "updated_at": 1_700_000_000_000, "timestamp": 5000}
+    assert device.ingest(reading, time.time())
+    state = json.loads(json.dumps(device.state()))  # as saved in cursors.json
+
+    restarted = DeviceRollup("esp32_1", SeriesBuffer(), state)
+    assert not restarted.ingest(reading, time.time())  # the new stream's first event
+    assert restarted.ingest({**reading, "updated_at": reading["updated_at"] + 5000}, time.time())
+
+    # Older firmware has no updated_at: its device timestamp is the cursor
+    legacy = DeviceRollup("esp32_2", SeriesBuffer())
+    assert legacy.ingest({"moisture": 40, "timestamp": 5000}, time.time())
+    restarted = DeviceRollup("esp32_2", SeriesBuffer(), json.loads(json.dumps(legacy.state())))
+    assert not restarted.ingest({"moisture": 40, "timestamp": 5000}, time.time())
+
+
+def test_service_rollups_match_raw_readings_across_a_restart(rtdb, tmp_path):
+    """ESP32 readings through FakeRTDB, with a restart halfway; 1d rollups must match the raw data."""
+    fake, db_url, _ = rtdb
+    device_ids = ["esp32_000000000000", "esp32_000000000001"]
+    for device_id in device_ids:
+        fake.set_node(["users", OWNER, "devices", device_id, "device_info"], {"type": "sensor"})
+
+    def start_service() -> RollupService:
+        service = RollupService(FirebaseClient(db_url), OWNER, db_url,
+                                utc_offset_hours=OFFSET_HOURS, state_dir=tmp_path)
+        connected = len(fake.streams)  # streams of a stopped service linger until their next event
+        service.discover()
+        wait_until(lambda: len(fake.streams) >= connected + len(device_ids))
+        return service
+
+    interval, steps = 300, 360  # 30 hours of readings
+    start = time.time() - steps * interval
+    rng = np.random.default_rng(1)
+    session = requests.Session()
+    expected = {device_id: [] for device_id in device_ids}
+    sent = counted = 0
+
+    service = start_service()
+    for step in range(steps):
+        ts = start + step * interval
+        for index, device_id in enumerate(device_ids):
+            moisture = round(float(40 + 10 * np.sin(2 * np.pi * ts / 86400) + index + rng.normal(0, 1)), 2)
+            reading = {"moisture": moisture, "temperature": 28.5, "timestamp": step * interval * 1000,
+                       "updated_at": int(ts * 1000)}
+            session.put(f"{db_url}/users/{OWNER}/devices/{device_id}/sensor_data.json", json=reading)
+            expected[device_id].append((ts, moisture))
+            sent += 1
+        if (step + 1) % 12 == 0 or step == steps // 2:
+            wait_until(lambda: service.readings + counted == sent)
+            service.flush()
+        if step == steps // 2:
+            service.stop_event.set()  # stop as systemd does (run() flushes on the way out, done above)
+            counted += service.readings
+            service = start_service()
+    wait_until(lambda: service.readings + counted == sent)
+    service.flush()
+    service.stop_event.set()
+    time.sleep(0.1)
+    assert service.readings + counted == sent  # nothing counted twice after the restart
+
+    for device_id in device_ids:
+        rollups = fake.get_node(["users", OWNER, "devices", device_id, "sensor_rollups"])
+        times = np.array([ts for ts, _ in expected[device_id]])
+        values = np.array([[value for _, value in expected[device_id]]], dtype=np.float32)
+        keys, low, high, mean, count = rollup(times, values, RESOLUTIONS["1d"], OFFSET_HOURS * 3600)
+        stored = rollups["1d"]["moisture"]
+        assert sorted(stored) == sorted(str(key) for key in keys.tolist())
+        for column, key in enumerate(keys.tolist()):
+            assert stored[str(key)] == pytest.approx(
+                [low[0, column], high[0, column], mean[0, column], count[0, column]], abs=1e-3)
+        assert len(rollups["1m"]["moisture"]) <= RETENTION["1m"] / 60 + 1
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import pytest
+
+import ffmpeg_hls_launcher as launcher
+from stream_config import DEFAULT_STREAM_CONFIG
+from stream_status import SNAPSHOT_MIN_INTERVAL, StreamStatusTracker
+
+
+@pytest.fixture
+def snapshots(monkeypatch):
+    config = {**DEFAULT_STREAM_CONFIG, "snapshot_enabled": True, "snapshot_interval": 15}
+    monkeypatch.setattr(launcher, "STREAM_CONFIG", config)
+    monkeypatch.setattr(launcher, "HLS_OUTPUT_DIR", Path("/dev/shm/hls"))
+    return config
+
+
+def test_no_snapshot_output_by_default(monkeypatch):
+    monkeypatch.setattr(launcher, "STREAM_CONFIG", dict(DEFAULT_STREAM_CONFIG))
+    cmd = launcher.build_ffmpeg_cmd("cam1", "rtsp://cam1")
+    assert launcher.snapshot_output_args("cam1") == []
+    assert "-skip_frame" not in cmd and "image2" not in cmd
+
+
+def test_snapshot_every_interval_from_keyframes(snapshots):
+    cmd = launcher.build_ffmpeg_cmd("cam1", "rtsp://cam1")
+
+    # only keyframes are decoded, and that must be set on the input
+    assert cmd.index("-skip_frame") < cmd.index("-i")
+    assert cmd[cmd.index("-skip_frame") + 1] == "nokey"
+    # the thumbnail is a second output after the HLS playlist
+    assert cmd.index("/dev/shm/hls/cam1.m3u8") < cmd.index("image2")
+    assert cmd[-1] == "/dev/shm/hls/cam1.jpg"
+    assert cmd[cmd.index("-vf") + 1] == "fps=1/15,scale=320:-2"
+    assert cmd[cmd.index("-atomic_writing") + 1] == "1"
+
+
+def test_webp_snapshots(snapshots):
+    snapshots["snapshot_format"] = "webp"
+    args = launcher.snapshot_output_args("cam1")
+    assert args[args.index("-c:v") + 1] == "libwebp"
+    assert args[-1] == "/dev/shm/hls/cam1.webp"
+
+
+def test_snapshot_timestamp_writes_are_throttled():
+    tracker = StreamStatusTracker()
+    now = 1_700_000_000.0
+
+    assert tracker.snapshot("cam1", {"snapshot_at": None}, now) is None
+    assert tracker.snapshot("cam1", {"snapshot_at": now - 1}, now) == int((now - 1) * 1000)
+    # a newer thumbnail, but too soon after the last write
+    assert tracker.snapshot("cam1", {"snapshot_at": now + 10}, now + 10) is None
+    later = now + SNAPSHOT_MIN_INTERVAL
+    assert tracker.snapshot("cam1", {"snapshot_at": now + 10}, later) == int((now + 10) * 1000)
+    # the same thumbnail is not written twice
+    assert tracker.snapshot("cam1", {"snapshot_at": now + 10}, later + SNAPSHOT_MIN_INTERVAL) is None
@@ -0,0 +1,64 @@
+import stream_status
+from stream_status import STATE_CONFIRM_SAMPLES, STATUS_MIN_INTERVAL, StreamStatusTracker
+
+NOW = 1_700_000_000.0
+
+
+def sample(now, **overrides):
+    values = {"running": True, "last_segment_at": now - 1, "bitrate_kbps": 2000, "fps": 15.0,
+              "speed": 1.0, "upload_lag_s": 1.0, "restarts": 0}
+    values.update(overrides)
+    return values
+
+
+def offline(now):
+    return sample(now, running=False)
+
+
+def test_state_changes_only_after_confirmation():
+    tracker = StreamStatusTracker()
+    first = tracker.update("cam1", sample(NOW), NOW)
+    assert first["state"] == "live" and first["since"] == int(NOW * 1000)
+
+    now = NOW
+    for _ in range(STATE_CONFIRM_SAMPLES - 1):
+        now += 5
+        assert tracker.update("cam1", offline(now), now) is None  # not confirmed yet
+    now += 5
+    status = tracker.update("cam1", offline(now), now)
+    assert status["state"] == "offline" and status["since"] == int(now * 1000)
+    assert "bitrate_kbps" not in status  # numbers are dropped while offline
+
+
+def test_flapping_never_changes_state():
+    tracker = StreamStatusTracker()
+    tracker.update("cam1", sample(NOW), NOW)
+    now = NOW
+    for i in range(10):
+        now += STATUS_MIN_INTERVAL  # past the rate limit, so only hysteresis holds it back
+        status = tracker.update("cam1", offline(now) if i % 2 == 0 else sample(now), now)
+        assert status is None or status["state"] == "live"
+
+
+def test_same_state_is_rate_limited_and_dead_banded():
+    tracker = StreamStatusTracker()
+    tracker.update("cam1", sample(NOW), NOW)
+
+    # a real change, but too soon after the last write
+    assert tracker.update("cam1", sample(NOW + 5, bitrate_kbps=3000), NOW + 5) is None
+    # late enough, but inside the dead band (50 kbps / 20%)
+    later = NOW + STATUS_MIN_INTERVAL
+    assert tracker.update("cam1", sample(later, bitrate_kbps=2100), later) is None
+
+    status = tracker.update("cam1", sample(later, bitrate_kbps=3000), later)
+    assert status["bitrate_kbps"] == 3000
+    assert status["since"] == int(NOW * 1000)  # still the same live period
+
+
+def test_state_change_bypasses_the_rate_limit():
+    tracker = StreamStatusTracker()
+    tracker.update("cam1", sample(NOW), NOW)
+    lagging = sample(NOW + 1, upload_lag_s=stream_status.LAG_DEGRADED + 5)
+    assert tracker.update("cam1", lagging, NOW + 1) is None
+    status = tracker.update("cam1", lagging, NOW + 2)
+    assert status["state"] == "degraded"
@@ -0,0 +1,75 @@
+import os
+import shutil
+import time
+
+import pytest
+
+import hls_uploader
+from hls_uploader import UploadLanes, UploadManifest
+from upload_metrics import UploadMetrics
+
+pytestmark = pytest.mark.skipif(shutil.which("rsync") is None, reason="rsync is not installed")
+
+SEGMENT_SECONDS = 1  # one synthetic segment per camera per second
+PLAYLIST_SIZE = 5  # segments kept per camera, like FFmpeg's hls_list_size
+RUN_SECONDS = 6
+SEGMENT_KB = 100
+HEAVY_KB = 1000  # the last camera added writes keyframe-heavy segments
+BWLIMIT = 1000  # KiB/s per lane, standing in for the uplink
+LATENCY_BOUND = 1.0  # allowed growth of cam1's p95 latency (s)
+
+
+def write_segment(live, cam_name: str, sequence: int, size_kb: int):
+    """Write one synthetic segment and playlist the way FFmpeg does (temp file + rename)."""
+    segment = live / f"{cam_name}_{sequence:03d}.ts"
+    segment.with_suffix('.tmp').write_bytes(os.urandom(size_kb * 1024))
+    os.replace(segment.with_suffix('.tmp'), segment)
+    (live / f"{cam_name}_{sequence - PLAYLIST_SIZE:03d}.ts").unlink(missing_ok=True)
+
+    first = max(0, sequence - PLAYLIST_SIZE + 1)
+    lines = ["#EXTM3U", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}", f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+    for number in range(first, sequence + 1):
+        lines += [f"#EXTINF:{SEGMENT_SECONDS}.0,", f"{cam_name}_{number:03d}.ts"]
+    playlist = live / f"{cam_name}.m3u8"
+    playlist.with_suffix('.tmp').write_text('\n'.join(lines) + '\n')
+    os.replace(playlist.with_suffix('.tmp'), playlist)
+
+
+def cam1_latency_p95(tmp_path, monkeypatch, cameras: int) -> float:
+    """Upload cameras' synthetic segments to a local target; return cam1's p95 segment latency."""
+    live = tmp_path / f"live{cameras}"
+    live.mkdir()
+    monkeypatch.setattr(hls_uploader, "LOCAL_HLS_DIR", live)
+    config = {"local_target_dir": str(tmp_path / f"vps{cameras}"), "upload_bwlimit": BWLIMIT}
+    assert hls_uploader.test_vps_connection(config)
+
+    metrics = UploadMetrics()
+    manifest = UploadManifest()
+    lanes = UploadLanes(config, manifest, metrics)
+    names = [f"cam{index + 1}" for index in range(cameras)]
+    try:
+        start = next_segment = time.monotonic()
+        sequence = 0
+        while time.monotonic() - start < RUN_SECONDS:
+            if time.monotonic() >= next_segment:
+                for cam_name in names:
+                    heavy = cameras > 1 and cam_name == names[-1]
+                    write_segment(live, cam_name, sequence, HEAVY_KB if heavy else SEGMENT_KB)
+                sequence += 1
+                next_segment += SEGMENT_SECONDS
+            lanes.submit(manifest.changed())
+            time.sleep(0.1)
+        assert lanes.wait_idle(30)
+        assert lanes.healthy()
+    finally:
+        lanes.stop()
+
+    p95 = metrics.summary()["cameras"].get("cam1", {}).get("latency_p95_s")
+    assert p95 is not None, "no cam1 segments confirmed"
+    return p95
+
+
+def test_adding_cameras_keeps_cam1_latency_bounded(tmp_path, monkeypatch):
+    baseline = cam1_latency_p95(tmp_path, monkeypatch, 1)
+    crowded = cam1_latency_p95(tmp_path, monkeypatch, 4)
+    assert crowded - baseline <= LATENCY_BOUND, f"cam1 p95 {baseline:.2f}s -> {crowded:.2f}s"
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import hls_uploader
+from hls_uploader import UploadManifest
+
+
+@pytest.fixture
+def hls_dir(tmp_path, monkeypatch):
+    live = tmp_path / "hls"
+    live.mkdir()
+    monkeypatch.setattr(hls_uploader, "LOCAL_HLS_DIR", live)
+    return live
+
+
+def test_confirmed_segments_are_not_offered_again(hls_dir):
+    manifest = UploadManifest()
+    (hls_dir / "cam1_001.ts").write_bytes(b"a" * 100)
+    (hls_dir / "cam1_002.ts.tmp").write_bytes(b"partial")
+
+    pending = manifest.changed()
+    assert set(pending) == {"cam1_001.ts"}  # files FFmpeg is still writing are skipped
+    manifest.confirm(pending)
+    assert manifest.confirmed("cam1_001.ts")
+    assert manifest.changed() == {}
+    assert manifest.changed(["cam1_001.ts", "cam1_009.ts"]) == {}  # unknown names are already gone
+
+    (hls_dir / "cam1_001.ts").write_bytes(b"b" * 200)  # rewritten: new size
+    assert set(manifest.changed(["cam1_001.ts"])) == {"cam1_001.ts"}
+
+
+def test_playlists_are_resent_only_when_their_content_changes(hls_dir):
+    manifest = UploadManifest()
+    playlist = hls_dir / "cam1.m3u8"
+    playlist.write_text("#EXTM3U\ncam1_001.ts\n")
+    manifest.confirm(manifest.changed())
+
+    # FFmpeg replaces the playlist atomically: new inode, same content
+    replacement = hls_dir / "cam1.m3u8.new"
+    replacement.write_text("#EXTM3U\ncam1_001.ts\n")
+    os.replace(replacement, playlist)
+    assert manifest.changed(["cam1.m3u8"]) == {}
+
+    playlist.write_text("#EXTM3U\ncam1_001.ts\ncam1_002.ts\n")
+    assert set(manifest.changed(["cam1.m3u8"])) == {"cam1.m3u8"}
+
+
+def test_full_scan_forgets_deleted_files(hls_dir):
+    manifest = UploadManifest()
+    segment = hls_dir / "cam1_001.ts"
+    segment.write_bytes(b"a" * 100)
+    manifest.confirm(manifest.changed())
+
+    segment.unlink()
+    manifest.changed()
+    assert not manifest.confirmed("cam1_001.ts")
+
+
+def test_reconcile_trusts_same_size_segments_only(hls_dir, tmp_path):
+    target = tmp_path / "vps"
+    target.mkdir()
+    for name, size in {"cam1_001.ts": 100, "cam1_002.ts": 100, "cam1.m3u8": 20}.items():
+        (hls_dir / name).write_bytes(b"x" * size)
+    (target / "cam1_001.ts").write_bytes(b"x" * 100)
+    (target / "cam1_002.ts").write_bytes(b"x" * 50)  # interrupted upload
+    (target / "cam1.m3u8").write_bytes(b"x" * 20)
+
+    manifest = UploadManifest()
+    assert manifest.reconcile({"local_target_dir": str(target)})
+    assert set(manifest.changed()) == {"cam1_002.ts", "cam1.m3u8"}
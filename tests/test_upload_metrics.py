@@ -0,0 +1,17 @@
+import json
+import urllib.request
+
+from upload_metrics import UploadMetrics, start_metrics_server
+
+
+def test_metrics_server_listens_on_the_pi_only_by_default():
+    server = start_metrics_server(UploadMetrics(), 0)
+    try:
+        host, port = server.server_address
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics.json", timeout=5) as response:
+            assert response.status == 200
+            json.load(response)
+    finally:
+        server.shutdown()
+        server.server_close()